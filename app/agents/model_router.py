@@ -0,0 +1,109 @@
+"""
+Complexity based routing between a small and a large chat model.
+Questions are scored with cheap local features (table name hits,
+aggregation keywords, join hints and length); simple ones go to the small
+model, and a run escalates to the large model when the small model's SQL
+fails or returns no rows.
+"""
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable
+
+from app.utils.lexical_index import tokenize
+
+AGGREGATION_WORDS = {
+    "count", "sum", "total", "average", "avg", "mean", "median", "max", "maximum", "min", "minimum",
+    "highest", "lowest", "top", "most", "least", "rank", "percent", "percentage", "ratio", "trend",
+    "growth", "distinct", "group",
+}
+## phrases that usually need a join, a GROUP BY or a subquery
+JOIN_HINTS = [
+    r"\bper\b", r"\beach\b", r"\bfor every\b", r"\bwith their\b", r"\band their\b", r"\balong with\b",
+    r"\bacross\b", r"\bcompare[ds]?\b", r"\bversus\b", r"\bvs\b", r"\bbetween\b", r"\bjoin\b",
+    r"\bwho have\b", r"\bthat have\b", r"\bwithout\b", r"\bnever\b",
+]
+
+
+@dataclass
+class RoutingDecision:
+    tier: str ## "small" or "large"
+    score: int
+    features: Dict[str, int] = field(default_factory=dict)
+    escalated: bool = False
+    started_at: float = field(default_factory=time.time)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class ModelRouter:
+    """Scores questions and keeps a record of routing decisions and their outcomes"""
+
+    def __init__(self, threshold: int = 3, history_size: int = 100):
+        self.threshold = threshold
+        self.decisions = {"small": 0, "large": 0}
+        self.escalations = 0
+        self.outcomes = {"small": 0, "large": 0, "escalated": 0}
+        self.recent = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def features(self, question: str, table_names: Iterable[str]) -> Dict[str, int]:
+        lowered = question.lower()
+        words = re.findall(r"\w+", lowered)
+        question_tokens = set(tokenize(question))
+        table_hits = 0
+        for table in table_names:
+            ## tokenize() puts the whole identifier first, followed by its snake/camel case parts
+            table_tokens = tokenize(table)
+            if table_tokens and (table_tokens[0] in question_tokens or set(table_tokens[1:] or [None]) <= question_tokens):
+                table_hits += 1
+        return {
+            "words": len(words),
+            "table_hits": table_hits,
+            "aggregations": sum(1 for word in words if word in AGGREGATION_WORDS),
+            "join_hints": sum(1 for hint in JOIN_HINTS if re.search(hint, lowered)),
+        }
+
+    def classify(self, question: str, table_names: Iterable[str]) -> RoutingDecision:
+        """Route a question to the small or the large model"""
+        features = self.features(question, table_names)
+        score = features["aggregations"] + 2 * features["join_hints"] + 2 * max(features["table_hits"] - 1, 0)
+        ## no table named, the model has to explore the schema
+        score += 1 if features["table_hits"] == 0 else 0
+        score += 2 if features["words"] > 25 else 1 if features["words"] > 12 else 0
+        decision = RoutingDecision(tier="small" if score < self.threshold else "large", score=score, features=features)
+        with self._lock:
+            self.decisions[decision.tier] += 1
+        return decision
+
+    def escalate(self, decision: dict) -> dict:
+        """Move a run from the small to the large model"""
+        with self._lock:
+            self.escalations += 1
+        return {**decision, "tier": "large", "escalated": True}
+
+    def record_outcome(self, question: str, decision: dict, answered: bool = True):
+        """Record how a routed question ended"""
+        outcome = "escalated" if decision.get("escalated") else decision.get("tier", "large")
+        with self._lock:
+            if answered:
+                self.outcomes[outcome] += 1
+            self.recent.append({
+                "question": question[:200],
+                **decision,
+                "answered": answered,
+                "seconds": round(time.time() - decision.get("started_at", time.time()), 3),
+            })
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "decisions": dict(self.decisions),
+                "escalations": self.escalations,
+                "outcomes": dict(self.outcomes),
+                "recent": list(self.recent)[-20:],
+            }
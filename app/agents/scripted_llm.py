@@ -0,0 +1,101 @@
+"""
+Deterministic offline chat model for the sql agent.
+It walks the agent through list_tables -> get_schema -> execute_query and
+answers with the query result, so the workflow can be run and benchmarked
+without an API key or network access.
+"""
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that emits a fixed tool call sequence, picking the SQL from the question"""
+
+    ## question keyword -> SQL, the first keyword found in the lowercased question wins
+    queries: Dict[str, str] = {}
+    ## used when no keyword matches, {table} is the first table relevant to the question
+    default_query: str = "SELECT COUNT(*) FROM {table}"
+    ## simulated model latency per call
+    latency_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _question(self, messages: List[BaseMessage]) -> str:
+        return next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+
+    def _tables(self, listing: str, question: str) -> List[str]:
+        ## list_tables answers "a, b, c" or "Most relevant 2 of 9 tables for the question: a, b. ..."
+        names = listing.split(":", 1)[1].split(".")[0] if ":" in listing else listing
+        tables = [t.strip() for t in names.split(",") if t.strip()]
+        words = set(re.findall(r"\w+", question.lower()))
+        mentioned = [t for t in tables if t.lower() in words or t.lower().rstrip("s") in words]
+        return mentioned or tables[:1]
+
+    def _listed_table(self, messages: List[BaseMessage], question: str) -> str:
+        """First relevant table of the last list_tables answer"""
+        listing = next((str(m.content) for m in reversed(messages)
+                        if isinstance(m, ToolMessage) and m.name == "list_tables"), "")
+        return self._tables(listing, question)[0] if listing else ""
+
+    def _sql(self, question: str, table: str) -> str:
+        lowered = question.lower()
+        for keyword, sql in self.queries.items():
+            if keyword in lowered:
+                return sql
+        return self.default_query.format(table=table)
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        question = self._question(messages)
+        last = messages[-1]
+        call_id = f"call_{len(messages)}"
+        if isinstance(last, HumanMessage):
+            system = next((str(m.content) for m in messages if isinstance(m, SystemMessage)), "")
+            if "Schema of the available tables:" in system:
+                ## fast path, the schema is in the prompt
+                tables = re.findall(r"^\s*(\w+)\(", system.split("Schema of the available tables:", 1)[1], re.M)
+                table = self._tables(", ".join(tables), question)[0] if tables else ""
+                return AIMessage(content="", tool_calls=[
+                    {"name": "execute_query", "args": {"query": self._sql(question, table)}, "id": call_id}])
+            return AIMessage(content="", tool_calls=[
+                {"name": "list_tables", "args": {"question": question}, "id": call_id}])
+        if isinstance(last, ToolMessage) and last.name == "list_tables":
+            return AIMessage(content="", tool_calls=[
+                {"name": "get_schema", "args": {"table_name": self._tables(str(last.content), question)}, "id": call_id}])
+        if isinstance(last, ToolMessage) and last.name == "get_schema":
+            return AIMessage(content="", tool_calls=[
+                {"name": "execute_query", "args": {"query": self._sql(question, self._listed_table(messages, question))}, "id": call_id}])
+        if isinstance(last, ToolMessage) and last.name == "execute_query" and str(last.content).startswith("Error"):
+            ## retry a failed query once, like a model correcting its SQL
+            failures = 0
+            for message in reversed(messages):
+                if isinstance(message, HumanMessage):
+                    break
+                if isinstance(message, ToolMessage) and message.name == "execute_query" and str(message.content).startswith("Error"):
+                    failures += 1
+            if failures < 2:
+                return AIMessage(content="", tool_calls=[
+                    {"name": "execute_query", "args": {"query": self._sql(question, self._listed_table(messages, question))}, "id": call_id}])
+        return AIMessage(content=f"The query returned: {last.content}")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[Any] = None, **kwargs) -> ChatResult:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[Any] = None, **kwargs) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
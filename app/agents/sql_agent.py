@@ -352,49 +352,146 @@ import os
 from IPython.display import display, Image
 from langchain_google_genai import ChatGoogleGenerativeAI
 # from app.tools.database_tools import DatabaseTools
-from app.utils.database_connection import DatabaseConnection
+from app.utils.database_connection import DatabaseConnection, connection_key, engine_registry
+from app.utils.schema_catalog import catalog_fingerprint, read_catalog, read_catalog_details
+from app.utils.schema_index import SchemaIndex
+from app.utils.schema_digest import table_digests
+from app.utils.sql_validation import lower_catalog
+from app.utils.message_compaction import compact_messages, estimate_tokens
+from app.services.answer_cache import normalize_question
+from app.services.single_flight import single_flight
+from app.services.few_shot import few_shot_index
+from app.services.result_sets import result_sets
+from app.services.schema_snapshots import SchemaSnapshot, schema_snapshots
 from app.tools.database_tools import DatabaseTools
+from app.agents.scripted_llm import ScriptedChatModel
+from app.agents.model_router import ModelRouter
+from app.schemas.agent_state import AgentState
+from typing import List
+from collections import OrderedDict
+import asyncio
+import re
+import threading
+import uuid
+import time
+
+from app.utils.query_result import FAILED_QUERY_PREFIXES
+from app.utils.metrics import LLMMetricsHandler
+
+## memory_estimate constants, measured with tracemalloc on a 600 table / 5400 column SQLite schema
+SESSION_BASE_BYTES = 2 * 1024 * 1024
+SESSION_COLUMN_BYTES = 512
 
 load_dotenv()
 import os
-os.environ["GROQ_API_KEY"]=os.getenv("GROQ_API_KEY")
-os.environ["GEMINI_API_KEY"]=os.getenv("GEMINI_API_KEY")
+## keys are optional when an offline model is used
+for key in ("GROQ_API_KEY", "GEMINI_API_KEY"):
+    if os.getenv(key):
+        os.environ[key] = os.getenv(key)
 
 
 from langgraph.graph import MessagesState
 from langgraph.prebuilt import tools_condition, ToolNode
-from langgraph.checkpoint.memory import MemorySaver
+from app.services.checkpointer import get_checkpointer
+from langchain_core.runnables import RunnableLambda
 
 
 class SQLAgent:
 
 
-    def __init__(self):
+    def __init__(self, llm=None, small_llm=None):
         
         # Initialize instance variables
         self.db = None
+        self.app = None
+        self.connection_key = None
+        self.schema_index = None
+        self.catalog = None
+        self._schema_fingerprint = None
+        self._schema_fingerprint_at = 0.0
+        self.schema_fingerprint_ttl = float(os.getenv("SCHEMA_FINGERPRINT_TTL_SECONDS", "60"))
+        self.schema_warmup = os.getenv("SCHEMA_WARMUP", "true").lower() == "true"
+        ## reconnects reuse the persisted metadata, catalog details and digests of an unchanged schema
+        self.schema_snapshots = os.getenv("SCHEMA_SNAPSHOTS", "true").lower() == "true"
+        self._catalog_details = None
+
+        # Schema-in-prompt fast path, skips the list_tables/get_schema round trips
+        self.schema_fast_path = os.getenv("SCHEMA_FAST_PATH", "false").lower() == "true"
+        self.schema_digest_max_tables = int(os.getenv("SCHEMA_DIGEST_MAX_TABLES", "40"))
+        self.schema_digest_max_chars = int(os.getenv("SCHEMA_DIGEST_MAX_CHARS", "8000"))
+        ## digest line per table, least recently used lines are dropped beyond the bound
+        self.schema_digest_cache_tables = int(os.getenv("SCHEMA_DIGEST_CACHE_TABLES", "2000"))
+        self._table_digests = OrderedDict()
+        self._table_digests_fingerprint = None
+        self._table_digests_lock = threading.Lock()
+
+        # Conversation compaction before each LLM call
+        self.compaction_keep_exchanges = int(os.getenv("COMPACTION_KEEP_EXCHANGES", "3"))
+        self.prompt_token_budget = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))
+        self.compaction_tool_output_chars = int(os.getenv("COMPACTION_TOOL_OUTPUT_CHARS", "500"))
+
+        # Few-shot examples from the query history of the connection
+        self.few_shot_examples = int(os.getenv("FEW_SHOT_EXAMPLES", "3"))
+
+        # Share one graph run between concurrent identical questions
+        self.coalesce_queries = os.getenv("QUERY_COALESCING", "true").lower() == "true"
         # self.repl = PythonREPL()
         # self.code = None 
 
-        # Setting up LLM
-        self.llm = ChatGroq(model="openai/gpt-oss-120b",api_key = os.getenv("GROQ_API_KEY"))
+        # Setting up LLM, any tool calling chat model can be injected
+        if llm is None and os.getenv("LLM_PROVIDER", "groq").lower() == "scripted":
+            ## deterministic offline model, for benchmarks and local runs without an API key
+            llm = ScriptedChatModel()
+        self.llm = llm or ChatGroq(model="openai/gpt-oss-120b",api_key = os.getenv("GROQ_API_KEY"))
+
+        # Complexity based routing, simple questions go to a small and fast model
+        if small_llm is None and llm is None and os.getenv("LLM_PROVIDER", "groq").lower() == "groq" \
+                and os.getenv("MODEL_ROUTING", "false").lower() == "true":
+            small_llm = ChatGroq(model=os.getenv("SMALL_MODEL", "llama-3.1-8b-instant"), api_key = os.getenv("GROQ_API_KEY"))
+        self.small_llm = small_llm
+        self.model_router = ModelRouter(threshold=int(os.getenv("MODEL_ROUTER_THRESHOLD", "3")))
+        ## callback handlers attached to every workflow run, model call metrics for /metrics
+        self.callbacks = [LLMMetricsHandler()]
         # self.llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", google_api_key=os.environ["GEMINI_API_KEY"])
         # Register the tool method
         # self.query_to_database = self._create_query_tool()
 
     
 
-    def setup_database_connection(self, connection_string: str):
+    def setup_database_connection(self, connection_string: str, cost_guard=None, allowed_tables=None, schema=None):
         """Set up database connection and initialize tools"""
         try:
 
-            self.db = DatabaseConnection(connection_string).db
+            previous = self.db
+            self.db = DatabaseConnection(connection_string, schema=schema).db
             print("Database connection successful!")
-            self.db_tools = DatabaseTools(db=self.db, llm=self.llm)    
+            if previous is not None:
+                ## the replaced connection no longer holds its engine, unused engines are disposed once idle
+                engine_registry.release(previous._engine)
+            if allowed_tables is not None:
+                self.allowed_tables = allowed_tables
+                self.db.allowed_tables = allowed_tables
+            ## sessions on the same URL but another schema must not share cached schemas, results or answers
+            self.connection_key = connection_key(self.db._engine, self.db._schema)
+            self._schema_fingerprint = None
+            self.schema_index = SchemaIndex()
+            self.catalog = None
+            self._catalog_details = None
+            ## one catalog read gives the fingerprint the snapshot is checked against and, on a miss, the index columns
+            catalog = self.read_schema_catalog()
+            snapshot = self.load_schema_snapshot()
+            if snapshot is None:
+                self.refresh_schema_index(catalog)
+            self.db_tools = DatabaseTools(db=self.db, llm=self.llm, schema_index=self.schema_index, catalog=lambda: self.catalog, cost_guard=cost_guard,
+                                         schema_fingerprint=self.schema_fingerprint)    
             self.list_tables_tool = self.db_tools.list_tables       
             self.schema_tool = self.db_tools.get_schema 
             self.execute_query_tools = self.db_tools.execute_query
-            self.tools_list = [self.list_tables_tool, self.schema_tool, self.execute_query_tools]
+            self.tools_list = self.db_tools.get_all_tools()
+            if self.schema_warmup:
+                ## tables are reflected on first use, the background warm-up fills in the rest
+                threading.Thread(target=self.warm_schema, args=(self.db_tools, self._schema_fingerprint, snapshot),
+                                 name="schema-warmup", daemon=True).start()
 
 
 
@@ -417,23 +514,139 @@ class SQLAgent:
             print(f"Unexpected error during database connection: {str(e)}")
             raise ValueError(f"Failed to establish database connection: {str(e)}")
         
-    def sql_agent(self, state: MessagesState):
-            """Creating a sql agent chain"""
-            
-            print("Creating a sql agent chain")
-            self.llm_with_tools = self.llm.bind_tools(self.tools_list)
-
-            sys_msg = SystemMessage(content = f"""You are a supervisor SQL agent managing tools to get the answer to the user's query created by Kshitij Kumrawat. If someone who built you, answer "Kshitij Kumrawat." Always stick to the following guidelines and instructions.
+    def schema_fingerprint(self) -> str:
+        """Fingerprint of the connected schema, re-read at most once per TTL"""
+        now = time.monotonic()
+        if self._schema_fingerprint is None or now - self._schema_fingerprint_at > self.schema_fingerprint_ttl:
+            catalog = read_catalog(self.db._engine, self.db._schema)
+            fingerprint = catalog_fingerprint(catalog)
+            if self._schema_fingerprint is not None and fingerprint != self._schema_fingerprint:
+                print("Schema change detected, refreshing schema index")
+                self.refresh_schema_index(catalog)
+            self._schema_fingerprint = fingerprint
+            self._schema_fingerprint_at = now
+        return self._schema_fingerprint
+
+    def read_schema_catalog(self):
+        """Column listing of the connection, recorded as the current schema fingerprint; None when it cannot be read"""
+        try:
+            catalog = read_catalog(self.db._engine, self.db._schema)
+        except Exception as e:
+            print(f"Error reading schema catalog: {e}")
+            return None
+        self._schema_fingerprint = catalog_fingerprint(catalog)
+        self._schema_fingerprint_at = time.monotonic()
+        return catalog
+
+    def refresh_schema_index(self, catalog=None):
+        """Re-read the catalog (unless given) and re-index the tables whose columns, comments or foreign keys changed"""
+        try:
+            start = time.perf_counter()
+            details = read_catalog_details(self.db._engine, self.db._schema, catalog)
+            self.index_catalog(details, start)
+        except Exception as e:
+            ## the index only narrows down the table list, the agent works without it
+            print(f"Error building schema index: {e}")
+
+    def index_catalog(self, details: dict, start: float):
+        """Catalog for the SQL validation and schema index of the given catalog details"""
+        self._catalog_details = details
+        ## tables and columns for the local SQL validation in execute_query
+        self.catalog = lower_catalog({table: info["columns"] for table, info in details.items()})
+        ## tables outside the allowed ones are never offered, so they are not indexed either
+        allowed = getattr(self.db, "allowed_tables", None)
+        if allowed is not None:
+            details = {table: info for table, info in details.items() if table in allowed}
+        changed = self.schema_index.update(details)
+        print(f"Schema index updated: {changed} of {len(self.schema_index)} tables re-indexed in {time.perf_counter() - start:.3f}s")
+
+    def set_allowed_tables(self, allowed_tables):
+        """Restrict the agent to the given tables and re-scope the schema index to them"""
+        self.allowed_tables = allowed_tables
+        self.db.allowed_tables = allowed_tables
+        if self._catalog_details is not None:
+            self.index_catalog(self._catalog_details, time.perf_counter())
+
+    def memory_estimate(self) -> int:
+        """Rough size of the agent in bytes: a fixed part for the graph and model clients, plus the per-column
+        share of the reflected metadata, the catalog and the schema index"""
+        if self.db is None:
+            return SESSION_BASE_BYTES
+        reflected = sum(len(table.columns) for table in list(self.db._metadata.tables.values()))
+        cataloged = sum(len(columns) for columns in (self.catalog or {}).values())
+        return SESSION_BASE_BYTES + SESSION_COLUMN_BYTES * (reflected + cataloged)
+
+    def load_schema_snapshot(self):
+        """Restore the persisted schema of the connection when its fingerprint is unchanged, None otherwise"""
+        if not self.schema_snapshots:
+            return None
+        try:
+            start = time.perf_counter()
+            ## the single catalog query of the fingerprint replaces reflection and the catalog detail queries
+            fingerprint = self.schema_fingerprint()
+            snapshot = schema_snapshots.load(self.connection_key, self.db._schema, fingerprint)
+            if snapshot is None:
+                return None
+            self.db._metadata = snapshot.metadata
+            with self._table_digests_lock:
+                ## snapshots of older versions keyed digests by table tuples
+                self._table_digests = OrderedDict((t, d) for t, d in snapshot.digests.items() if isinstance(t, str))
+                self._table_digests_fingerprint = fingerprint
+            self.index_catalog(snapshot.details, start)
+            print(f"Schema snapshot restored: {len(snapshot.metadata.tables)} reflected tables")
+            return snapshot
+        except Exception as e:
+            print(f"Error restoring schema snapshot: {e}")
+            return None
+
+    def warm_schema(self, db_tools, fingerprint, snapshot=None):
+        """Background warm-up of the connection's tables, then a snapshot of them for the next connect"""
+        db_tools.warm_schema()
+        if not self.schema_snapshots or fingerprint is None or db_tools is not self.db_tools or self._catalog_details is None:
+            return
+        try:
+            ## digest lines of the whole scope, what the fast path uses on small schemas
+            tables = sorted(db_tools.scoped_tables())
+            new_digest = False
+            if tables and len(tables) <= self.schema_digest_max_tables:
+                new_digest = bool(self.table_digest_lines(tables, fingerprint)[1])
+            with db_tools.reflect_lock:
+                if snapshot is not None and not new_digest and len(self.db._metadata.tables) == len(snapshot.metadata.tables):
+                    return
+                schema_snapshots.save(self.connection_key, self.db._schema, SchemaSnapshot(
+                    fingerprint=fingerprint, metadata=self.db._metadata,
+                    details=self._catalog_details, digests=self.cached_table_digests()))
+        except Exception as e:
+            print(f"Error saving schema snapshot: {e}")
+
+    def system_message(self, schema_digest: str = "", examples: str = "") -> SystemMessage:
+            """System prompt of the sql agent"""
+            if schema_digest:
+                ## fast path: the schema is already known, go straight to execute_query
+                table_guidelines = f"""- The schema of the available tables is given below (column TYPE, PK = primary key, -> = foreign key). It is complete and current, so do not call list_tables or get_schema for these tables, write the query directly and run it with execute_query.
+                - Only use list_tables and get_schema if a table you need is not part of the schema below."""
+                schema_section = f"Schema of the available tables:\n{schema_digest}\n"
+            else:
+                schema_section = ""
+                table_guidelines = """- Always list down the tables, never assume any table names or believe on users assuming table names because they can be incorrect.
+                - Dont make any schema assumptions, always get the schema using the get_schema tool before generating any query of the required table."""
+
+            examples_section = ""
+            if examples:
+                examples_section = f"""Questions answered before on this database and the SQL that worked for them. Use them as a starting point when they match the question, but still follow the guidelines above:
+{examples}
+"""
+
+            return SystemMessage(content = f"""You are a supervisor SQL agent managing tools to get the answer to the user's query created by Kshitij Kumrawat. If someone who built you, answer "Kshitij Kumrawat." Always stick to the following guidelines and instructions.
                 
                 You posses the following tools :
-                1. list_tables - List all tables from the database
+                1. list_tables - List all tables from the database, pass the user question to get the most relevant tables of a large database
                 2. get_schema - Get the schema of required tables
                 3. execute_query - Execute the SQL query
                 
                 The following are instructions to help you decide which tool to use next:                    
                 - Always breakdown the user query into smaller sub-tasks and decide which tool should be called next to accomplish each sub-task.
-                - Always list down the tables, never assume any table names or believe on users assuming table names because they can be incorrect.
-                - Dont make any schema assumptions, always get the schema using the get_schema tool before generating any query of the required table.
+                {table_guidelines}
                 - Use the execute_query tool to run the final query and get results.
                 - If a query execution fails, analyze the error message, adjust the query accordingly, and try executing it again.
                 - Allowed: SELECT statements (only for retrieval), COUNT, SUM, AVG, MIN, MAX.
@@ -446,26 +659,190 @@ class SQLAgent:
                 - never execute any SQL commands that alter data. This includes UPDATE, DELETE, INSERT, TRUNCATE, ALTER, DROP, REPLACE, MERGE, or CALL (if the stored procedure modifies data).
                 - Prohibited: All data manipulation language (DML) and data definition language (DDL) commands.
 
-                
+                {schema_section}
+                {examples_section}
                """)
+
+    def relevant_tables(self, state: AgentState) -> List[str]:
+            """Tables the agent may use to answer the current question"""
+            tables = list(self.db.get_usable_table_names())
+            allowed = getattr(self.db, "allowed_tables", None)
+            if allowed is not None:
+                tables = [t for t in tables if t in allowed]
+            ## on large schemas only the tables matching the question are worth a digest
+            if len(tables) > self.schema_digest_max_tables and self.schema_index is not None:
+                tables = self.schema_index.search(self.current_question(state), self.db_tools.list_tables_top_k, allowed=tables)
+            return tables
+
+    def table_digest_lines(self, tables: List[str], fingerprint):
+            """(table -> digest line, tables that were not cached), only the missing tables are inspected"""
+            with self._table_digests_lock:
+                if fingerprint != self._table_digests_fingerprint:
+                    self._table_digests.clear()
+                    self._table_digests_fingerprint = fingerprint
+                lines, missing = {}, []
+                for table in tables:
+                    if table in self._table_digests:
+                        self._table_digests.move_to_end(table)
+                        lines[table] = self._table_digests[table]
+                    else:
+                        missing.append(table)
+            if missing:
+                built = table_digests(self.db._engine, missing, self.db._schema)
+                lines.update(built)
+                with self._table_digests_lock:
+                    ## lines inspected under an older fingerprint are not kept
+                    if fingerprint == self._table_digests_fingerprint:
+                        self._table_digests.update(built)
+                        while len(self._table_digests) > self.schema_digest_cache_tables:
+                            self._table_digests.popitem(last=False)
+            return lines, missing
+
+    def cached_table_digests(self) -> dict:
+            with self._table_digests_lock:
+                return dict(self._table_digests)
+
+    def schema_digest(self, tables: List[str]) -> str:
+            """Schema digest of the given tables, empty when it is too large for the prompt"""
+            if not tables or len(tables) > self.schema_digest_max_tables:
+                return ""
+            tables = sorted(tables)
+            lines, _ = self.table_digest_lines(tables, self.schema_fingerprint())
+            digest = "\n".join(lines[table] for table in tables)
+            return digest if len(digest) <= self.schema_digest_max_chars else ""
+
+    def prepare(self, state: AgentState):
+            """Deterministic pre-node, routes the question, retrieves few-shot examples and injects the schema digest when the fast path is enabled"""
+            try:
+                ## picks up schema changes (and re-indexes) at most once per fingerprint TTL
+                self.schema_fingerprint()
+            except Exception as e:
+                print(f"Error reading schema fingerprint: {e}")
+            update = {"schema_digest": "", "routing": self.route(state), "few_shot_examples": self.examples(state)}
+            if not self.schema_fast_path:
+                return update
+            try:
+                update["schema_digest"] = self.schema_digest(self.relevant_tables(state))
+            except Exception as e:
+                print(f"Error building schema digest, falling back to the tool loop: {e}")
+            return update
+
+    def examples(self, state: AgentState) -> str:
+            """Similar past questions and their SQL, restricted to the allowed tables"""
+            if not self.few_shot_examples:
+                return ""
+            try:
+                matches = few_shot_index.search(self.connection_key, self.current_question(state), self.few_shot_examples)
+                allowed = getattr(self.db, "allowed_tables", None)
+                if allowed is not None:
+                    ## drop examples that query tables the user may not use
+                    hidden = set(self.db.get_usable_table_names()) - set(allowed)
+                    matches = [(q, sql) for q, sql in matches
+                               if not any(re.search(rf"\b{re.escape(t)}\b", sql, re.I) for t in hidden)]
+            except Exception as e:
+                print(f"Error retrieving few-shot examples: {e}")
+                return ""
+            return "\n".join(f"Q: {question}\nSQL: {sql}" for question, sql in matches)
+
+    def route(self, state: AgentState) -> dict:
+            """Routing decision of the current question, empty when there is no small model"""
+            if self.small_llm is None:
+                return {}
+            try:
+                decision = self.model_router.classify(self.current_question(state), self.db.get_usable_table_names())
+            except Exception as e:
+                print(f"Error routing question, using the large model: {e}")
+                return {}
+            print(f"Routing question to the {decision.tier} model (score {decision.score}, {decision.features})")
+            return decision.as_dict()
+
+    def current_question(self, state: AgentState) -> str:
+            return next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+
+    def select_model(self, state: AgentState):
+            """Model for the next call and the state update, escalating when the small model's query failed or returned nothing"""
+            routing = state.get("routing") or {}
+            update = {}
+            if routing.get("tier") == "small":
+                results = []
+                for message in reversed(state["messages"]):
+                    if not isinstance(message, ToolMessage):
+                        break
+                    results.append(message)
+                ## an empty result usually means a wrong filter or join, the large model gets a second look
+                if any(m.name == "execute_query" and (str(m.content).startswith(FAILED_QUERY_PREFIXES) or not str(m.content).strip())
+                       for m in results):
+                    print("Query of the small model failed or returned nothing, escalating to the large model")
+                    routing = self.model_router.escalate(routing)
+                    update["routing"] = routing
+            llm = self.small_llm if routing.get("tier") == "small" else self.llm
+            return llm, routing, update
+
+    def record_routing_outcome(self, state: AgentState, routing: dict, response):
+            """Record the outcome of a routed question once the model answers"""
+            if not routing or response.tool_calls:
+                return
+            answered = False
+            for message in reversed(state["messages"]):
+                if isinstance(message, HumanMessage):
+                    break
+                if isinstance(message, ToolMessage) and message.name == "execute_query":
+                    answered = not str(message.content).startswith(FAILED_QUERY_PREFIXES)
+                    break
+            self.model_router.record_outcome(self.current_question(state), routing, answered)
+
+    async def aprepare(self, state: AgentState):
+            """Async prepare node, schema inspection is sync only"""
+            return await asyncio.to_thread(self.prepare, state)
+
+    def build_prompt(self, state: AgentState):
+            """System message plus the compacted conversation, and the number of tokens compaction removed"""
+            sys_msg = self.system_message(state.get("schema_digest", ""), state.get("few_shot_examples", ""))
+            budget = max(self.prompt_token_budget - estimate_tokens(sys_msg), 0)
+            messages, removed = compact_messages(
+                state["messages"], self.compaction_keep_exchanges, budget, self.compaction_tool_output_chars)
+            if removed:
+                print(f"Compacted conversation: {removed} tokens removed from the prompt")
+            return [sys_msg] + messages, removed
+
+    def sql_agent(self, state: AgentState):
+            """Creating a sql agent chain"""
             
-            return {"messages": [self.llm_with_tools.invoke([sys_msg] + state["messages"])]}    
+            print("Creating a sql agent chain")
+            llm, routing, update = self.select_model(state)
+            self.llm_with_tools = llm.bind_tools(self.tools_list)
+            prompt, removed = self.build_prompt(state)
+            response = self.llm_with_tools.invoke(prompt)
+            self.record_routing_outcome(state, routing, response)
+            return {"messages": [response], "compacted_tokens": removed, **update}
+
+    async def asql_agent(self, state: AgentState):
+            """Async sql agent node, used when the graph runs with ainvoke"""
+            llm, routing, update = self.select_model(state)
+            self.llm_with_tools = llm.bind_tools(self.tools_list)
+            prompt, removed = self.build_prompt(state)
+            response = await self.llm_with_tools.ainvoke(prompt)
+            self.record_routing_outcome(state, routing, response)
+            return {"messages": [response], "compacted_tokens": removed, **update}
     
     def initialize_workflow(self):
         """Initialize the workflow graph"""
         
-        memory = MemorySaver()
+        ## shared, bounded checkpointer so reconnecting does not drop the conversation threads
+        memory = get_checkpointer()
         
         print("Intializing Workflow....")
         # Create workflow
-        workflow = StateGraph(MessagesState)
+        workflow = StateGraph(AgentState)
 
         # Add nodes
-        workflow.add_node("sql_agent", self.sql_agent)
+        workflow.add_node("prepare", RunnableLambda(self.prepare, afunc=self.aprepare, name="prepare"))
+        workflow.add_node("sql_agent", RunnableLambda(self.sql_agent, afunc=self.asql_agent, name="sql_agent"))
         workflow.add_node("tools", ToolNode(tools=self.tools_list))
 
         # Set entry point
-        workflow.add_edge(START, "sql_agent")
+        workflow.add_edge(START, "prepare")
+        workflow.add_edge("prepare", "sql_agent")
         workflow.add_conditional_edges(
             "sql_agent",
             # If the latest message (result) from assistant is a tool call -> tools_condition routes to tools
@@ -478,6 +855,12 @@ class SQLAgent:
         self.app = workflow.compile(checkpointer = memory)
         # display(Image(self.app.get_graph(xray=True).draw_mermaid_png()))                
                 
+    def run_config(self, config: dict) -> dict:
+        """Run config with the agent callbacks attached"""
+        if not self.callbacks:
+            return config
+        return {**config, "callbacks": [*(config.get("callbacks") or []), *self.callbacks]}
+
     ## called from the fastapi endpoint
     def execute_query(self, query: str, config: dict):
         """Execute a query through the workflow"""
@@ -486,8 +869,63 @@ class SQLAgent:
         if self.app is None:
             raise ValueError("Workflow not initialized. Please set up the connection first.")
 
+        config = self.run_config(config)
         response = self.app.invoke({
         "messages": [HumanMessage(content=query)]
         }, config=config)
 
         return response["messages"][-1].content
+
+    async def aexecute_query(self, query: str, config: dict):
+        """Execute a query through the workflow without blocking the event loop"""
+        if self.db is None:
+            raise ValueError("Database connection not established. Please set up the connection first.")
+        if self.app is None:
+            raise ValueError("Workflow not initialized. Please set up the connection first.")
+
+        config = self.run_config(config)
+        response = await self.app.ainvoke({
+        "messages": [HumanMessage(content=query)]
+        }, config=config)
+
+        return response["messages"][-1].content
+
+    def coalescing_key(self, query: str) -> str:
+        """Questions with the same key asked at the same time get the same answer"""
+        allowed = getattr(self.db, "allowed_tables", None)
+        tables = "*" if allowed is None else ",".join(sorted(allowed))
+        return "\x1f".join([normalize_question(query), self.connection_key or "", tables])
+
+    async def aexecute_query_coalesced(self, query: str, thread_id: str, callbacks: list = None):
+        """Run a fresh question, sharing the run with concurrent identical questions.
+        Returns the answer and whether it came from another request's run."""
+        config = {"configurable": {"thread_id": thread_id}, "callbacks": callbacks or []}
+        if not self.coalesce_queries:
+            return await self.aexecute_query(query, config), False
+
+        async def run():
+            ## only the leader's callbacks see the run
+            result = await self.aexecute_query(query, config)
+            return result, thread_id
+
+        (result, leader_thread), shared = await single_flight.do(self.coalescing_key(query), run)
+        if shared:
+            ## give the follower its own copy of the conversation so it can ask follow-up questions
+            state = await self.app.aget_state({"configurable": {"thread_id": leader_thread}})
+            await self.app.aupdate_state({"configurable": {"thread_id": thread_id}}, state.values, as_node="sql_agent")
+            result_sets.copy(leader_thread, thread_id)
+            print(f"Coalesced query on thread {thread_id} with in-flight thread {leader_thread}")
+        return result, shared
+
+    async def aseed_thread(self, thread_id: str, question: str, answer: str, sql_query: str = None, result_text: str = ""):
+        """Checkpoint a question answered without a run (answer cache hit), so follow-up questions on the thread have its context"""
+        messages = [HumanMessage(content=question)]
+        if sql_query:
+            ## the executed query as the agent would have called it, follow-ups can build on the SQL
+            call_id = f"cached-{uuid.uuid4().hex}"
+            messages += [
+                AIMessage(content="", tool_calls=[{"name": "execute_query", "args": {"query": sql_query}, "id": call_id}]),
+                ToolMessage(content=result_text, tool_call_id=call_id, name="execute_query"),
+            ]
+        messages.append(AIMessage(content=answer))
+        await self.app.aupdate_state({"configurable": {"thread_id": thread_id}}, {"messages": messages}, as_node="sql_agent")
@@ -28,6 +28,11 @@ def init_history_db():
                 executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        ## connection the query ran on (credential-free URL), used to retrieve few-shot examples
+        columns = [row[1] for row in cur.execute("PRAGMA table_info(query_history)")]
+        if "connection_key" not in columns:
+            cur.execute("ALTER TABLE query_history ADD COLUMN connection_key TEXT")
+        cur.execute("CREATE INDEX IF NOT EXISTS query_history_connection ON query_history (connection_key)")
         conn.commit()
         conn.close()
         print("Query history table initialized successfully.")
@@ -0,0 +1,68 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.services.answer_cache import answer_cache
+from app.utils.result_cache import result_cache
+from app.services.checkpointer import get_checkpointer
+from app.services.single_flight import single_flight
+from app.services.agent_sessions import agent_sessions
+from app.utils.database_connection import connection_key, engine_registry
+from app.utils.metrics import registry
+
+router = APIRouter()
+
+@registry.collector
+def component_metrics():
+    """Values owned by the caches, the checkpointer and the connection, read on scrape"""
+    caches = {"answer": answer_cache.stats(), "result": result_cache.stats()}
+    yield ("talk2db_cache_hits_total", "counter", "Cache hits",
+           [({"cache": name}, stats["hits"]) for name, stats in caches.items()])
+    yield ("talk2db_cache_misses_total", "counter", "Cache misses",
+           [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+    yield ("talk2db_cache_hit_ratio", "gauge", "Share of cache lookups served from the cache",
+           [({"cache": name}, stats["hits"] / ((stats["hits"] + stats["misses"]) or 1)) for name, stats in caches.items()])
+    yield ("talk2db_cache_entries", "gauge", "Entries held by the cache",
+           [({"cache": name}, stats["entries"]) for name, stats in caches.items()])
+
+    checkpointer = get_checkpointer().stats()
+    yield ("talk2db_checkpointer_threads", "gauge", "Conversation threads held in memory", [({}, checkpointer["threads"])])
+    yield ("talk2db_checkpointer_bytes", "gauge", "Size of the checkpoints held in memory", [({}, checkpointer["bytes"])])
+    yield ("talk2db_checkpointer_evictions_total", "counter", "Threads evicted from memory", [({}, checkpointer["evictions"])])
+
+    flights = single_flight.stats()
+    yield ("talk2db_coalesced_requests_total", "counter", "Requests answered by an identical in-flight run",
+           [({}, flights["followers"])])
+
+    engines = engine_registry.stats()
+    yield ("talk2db_db_engines", "gauge", "Database engines (connection pools) held by the process", [({}, len(engines["engines"]))])
+    pools = [engine for engine in engines["engines"] if "checked_out" in engine]
+    yield ("talk2db_db_pool_checked_out", "gauge", "Connections checked out of the pool",
+           [({"database": engine["connection"]}, engine["checked_out"]) for engine in pools])
+    yield ("talk2db_db_pool_checked_in", "gauge", "Idle connections held by the pool",
+           [({"database": engine["connection"]}, engine["checked_in"]) for engine in pools])
+    yield ("talk2db_db_pool_size", "gauge", "Configured pool size",
+           [({"database": engine["connection"]}, engine["size"]) for engine in pools])
+    yield ("talk2db_db_pool_overflow", "gauge", "Connections open beyond the pool size",
+           [({"database": engine["connection"]}, engine["overflow"]) for engine in pools])
+
+    sessions = agent_sessions.stats()
+    yield ("talk2db_agent_sessions", "gauge", "Agent sessions (user and connection) held by the process",
+           [({}, len(sessions["sessions"]))])
+    yield ("talk2db_agent_sessions_estimated_bytes", "gauge", "Estimated memory of the agent sessions",
+           [({}, sessions["estimated_bytes"])])
+    yield ("talk2db_agent_session_evictions_total", "counter", "Agent sessions evicted (idle, count or memory budget)",
+           [({}, sessions["evictions"])])
+
+    ## limiters are shared by the sessions of a connection
+    limiters = {}
+    for agent in agent_sessions.agents():
+        if agent.db is not None:
+            limiters[connection_key(agent.db._engine)] = agent.db_tools.limiter.stats()
+    yield ("talk2db_db_active_queries", "gauge", "Tool calls using the connection",
+           [({"database": key}, limiter["active"]) for key, limiter in limiters.items()])
+    yield ("talk2db_db_limiter_waits_total", "counter", "Tool calls that waited for the per-connection cap",
+           [({"database": key}, limiter["waits"]) for key, limiter in limiters.items()])
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus text format"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,18 +1,20 @@
 from fastapi import APIRouter, HTTPException 
 from sqlalchemy import inspect 
-from app.services.sql_agent_instance import sql_agent
+from app.services.agent_sessions import agent_sessions
 from pydantic import BaseModel 
-from typing import List 
+from typing import List, Optional
 
 class TableIndexingRequest(BaseModel):
     table_names: List[str]
+    username: Optional[str] = "developer"
 
 
 router = APIRouter()
 
 @router.get("/schema")
-async def get_schema():
-    if not sql_agent.db: 
+async def get_schema(username: Optional[str] = "developer"):
+    sql_agent = agent_sessions.get(username)
+    if sql_agent is None or not sql_agent.db: 
         raise HTTPException(
             status_code=400,
             detail="Database connection is not established. Please set up the connection first."
@@ -48,15 +50,15 @@ async def get_schema():
     
 @router.post("/schema/indexing")
 async def update_indexing(request: TableIndexingRequest):
-    if not sql_agent.db:
+    sql_agent = agent_sessions.get(request.username)
+    if sql_agent is None or not sql_agent.db:
         raise HTTPException(
             status_code=400,
             detail="Database connection is not established. Please set up the connection first."
         )
     try:
-        # Set allowed tables on the agent and the database wrapper
-        sql_agent.allowed_tables = request.table_names
-        sql_agent.db.allowed_tables = request.table_names
+        # Set allowed tables on the agent and the database wrapper, the schema index follows
+        sql_agent.set_allowed_tables(request.table_names)
         return {"message": "Indexing updated successfully for the specified tables."}
     except Exception as e:
         raise HTTPException(
@@ -65,8 +67,9 @@ async def update_indexing(request: TableIndexingRequest):
         )
 
 @router.get("/schema/indexing")
-async def get_indexing():
-    if not sql_agent.db:
+async def get_indexing(username: Optional[str] = "developer"):
+    sql_agent = agent_sessions.get(username)
+    if sql_agent is None or not sql_agent.db:
         raise HTTPException(
             status_code=400,
             detail="Database connection is not established. Please set up the connection first."
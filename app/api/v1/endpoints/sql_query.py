@@ -37,13 +37,24 @@
 #     except Exception as e:
 #         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from app.services.sql_agent_instance import sql_agent
+from app.services.agent_sessions import agent_sessions
+from app.services.answer_cache import answer_cache
+from app.services.few_shot import few_shot_index
+from app.services.result_sets import result_sets
 from typing import Optional
 import uuid
-from langchain_core.messages import AIMessage
+import json
+import time
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from app.agents.sql_agent import FAILED_QUERY_PREFIXES, SQLAgent
 from sqlalchemy import text
+from app.utils.query_plan import estimate_plan, explain_statement, plan_output, sqlite_table_rows
+from app.utils.query_result import ARROW_MEDIA_TYPE, QueryResult, pyarrow, to_arrow_ipc, to_columnar
+from app.utils.run_tracer import RunTracer
 from app.api.v1.auth import get_db
 
 router = APIRouter()
@@ -52,64 +63,256 @@ class SQLQueryRequest(BaseModel):
     query: str
     thread_id: Optional[str] = None
     username: Optional[str] = "developer"
+    use_cache: bool = True ## set to False to bypass the answer cache
+    include_result_set: bool = False ## return the rows of the executed query as columnar JSON
+    debug: bool = False ## return per-step timings, tokens and tool calls of the run
 
 class SQLQueryResponse(BaseModel):
     result: str
     thread_id: str ## client can use this to continue the conversation
+    cached: bool = False
+    coalesced: bool = False ## answered by an identical request that was already in flight
+    result_set: Optional[dict] = None ## columns, dtypes and column arrays of the executed query
+    debug: Optional[dict] = None ## RunTracer summary, when requested
+
+async def extract_sql_query(sql_agent: SQLAgent, thread_id: str) -> Optional[str]:
+    """Extract the last executed SQL query from the LangGraph state messages"""
+    try:
+        state = await sql_agent.app.aget_state({"configurable": {"thread_id": thread_id}})
+        messages = state.values.get("messages", [])
+        ## outputs of the tool calls, so a query that failed is not reported as the answer's SQL
+        outputs = {msg.tool_call_id: str(msg.content) for msg in messages if isinstance(msg, ToolMessage)}
+        for msg in reversed(messages):
+            if hasattr(msg, "tool_calls") and msg.tool_calls:
+                for tc in reversed(msg.tool_calls):
+                    # Check if execute_query tool was called
+                    if tc.get("name") == "execute_query" and not outputs.get(tc.get("id"), "").startswith(FAILED_QUERY_PREFIXES):
+                        # The argument name might be query
+                        return tc.get("args", {}).get("query")
+    except Exception as e:
+        print(f"Error extracting SQL query from state: {e}")
+    return None
+
+def save_to_history(sql_agent: SQLAgent, username: Optional[str], natural_query: str, sql_query: str):
+    """Save a successfully executed query to the query history"""
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO query_history (username, natural_query, generated_sql, connection_key) VALUES (?, ?, ?, ?)",
+            (username or "developer", natural_query, sql_query, sql_agent.connection_key)
+        )
+        conn.commit()
+        conn.close()
+        few_shot_index.add(sql_agent.connection_key, natural_query, sql_query)
+        print("Logged successfully executed query to history.")
+    except Exception as e:
+        print(f"Error saving query to history: {e}")
+
+def answer_cache_key(sql_agent: SQLAgent, request: SQLQueryRequest) -> Optional[str]:
+    """Cache key of the request, None when the answer cache does not apply"""
+    ## follow-up questions depend on the conversation, only fresh questions are cached
+    if not request.use_cache or request.thread_id or sql_agent.db is None:
+        return None
+    try:
+        return answer_cache.make_key(
+            request.query,
+            sql_agent.connection_key,
+            sql_agent.schema_fingerprint(),
+            getattr(sql_agent, "allowed_tables", None),
+        )
+    except Exception as e:
+        print(f"Error computing answer cache key: {e}")
+        return None
+
+async def seed_cached_thread(sql_agent: SQLAgent, thread_id: str, question: str, cached):
+    """Give the thread of a cached answer the question and answer, so the returned thread_id can be resumed"""
+    try:
+        result_text = cached.result_set.to_text() if cached.result_set is not None else ""
+        await sql_agent.aseed_thread(thread_id, question, cached.result, cached.sql_query, result_text)
+        result_sets.discard(thread_id)
+        if cached.result_set is not None:
+            result_sets.put(thread_id, cached.result_set)
+    except Exception as e:
+        print(f"Error seeding thread {thread_id} with the cached answer: {e}")
+
+def debug_info(tracer: Optional[RunTracer], started: float) -> dict:
+    """debug field of the response, nothing when it was not requested"""
+    return {"debug": tracer.summary(time.perf_counter() - started)} if tracer else {}
+
+def wants_arrow(accept: Optional[str]) -> bool:
+    return bool(accept) and ARROW_MEDIA_TYPE in accept
+
+def query_response(request: SQLQueryRequest, accept: Optional[str], result: str, thread_id: str,
+                   result_set: Optional[QueryResult], sql_query: Optional[str] = None, **flags):
+    """JSON response, or an Arrow IPC stream of the result set when the client accepts it"""
+    if wants_arrow(accept):
+        metadata = {"result": result, "thread_id": thread_id, "sql_query": sql_query, **flags}
+        return Response(content=to_arrow_ipc(result_set or QueryResult(), metadata), media_type=ARROW_MEDIA_TYPE)
+    columnar = to_columnar(result_set) if request.include_result_set and result_set is not None else None
+    return SQLQueryResponse(result=result, thread_id=thread_id, result_set=columnar, **flags)
 
 @router.post("/query", response_model=SQLQueryResponse)
-async def query_database(request: SQLQueryRequest):
+async def query_database(request: SQLQueryRequest, accept: Optional[str] = Header(None)):
+    if wants_arrow(accept) and pyarrow is None:
+        raise HTTPException(status_code=406, detail="Arrow responses need pyarrow installed on the server")
+    started = time.perf_counter()
+    tracer = RunTracer() if request.debug else None
+    sql_agent = agent_sessions.get(request.username)
+    if sql_agent is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Database connection is not established. Please set up the connection first."
+        )
     try:
         ## generate if not provided thread id 
         thread_id = request.thread_id or str(uuid.uuid4())
         ## add debug 
         print(f"Thread ID: {thread_id}, Query: {request.query}")
-        result = sql_agent.execute_query(request.query, config={"configurable": {"thread_id": thread_id}})
-        print(f"Result: {result}")
 
-        # Extract the SQL query from the LangGraph state messages
-        sql_query = None
-        try:
-            state = sql_agent.app.get_state({"configurable": {"thread_id": thread_id}})
-            messages = state.values.get("messages", [])
-            for msg in reversed(messages):
-                if hasattr(msg, "tool_calls") and msg.tool_calls:
-                    for tc in msg.tool_calls:
-                        # Check if execute_query tool was called
-                        if tc.get("name") == "execute_query":
-                            # The argument name might be query
-                            sql_query = tc.get("args", {}).get("query")
-                            break
-                    if sql_query:
-                        break
-        except Exception as e:
-            print(f"Error extracting SQL query from state: {e}")
+        ## the fingerprint lookup may hit the database catalog, keep it off the event loop
+        cache_key = await asyncio.to_thread(answer_cache_key, sql_agent, request)
+        if cache_key:
+            cached = answer_cache.get(cache_key)
+            if cached:
+                print(f"Answer cache hit for query: {request.query}")
+                if cached.sql_query:
+                    await asyncio.to_thread(save_to_history, sql_agent, request.username, request.query, cached.sql_query)
+                await seed_cached_thread(sql_agent, thread_id, request.query, cached)
+                return query_response(request, accept, cached.result, thread_id, cached.result_set,
+                                      cached.sql_query, cached=True, **debug_info(tracer, started))
+
+        ## a follow-up question must not report the rows of an earlier turn
+        result_sets.discard(thread_id)
+        if request.thread_id is None and request.use_cache:
+            ## fresh questions are coalesced with identical in-flight ones
+            result, coalesced = await sql_agent.aexecute_query_coalesced(request.query, thread_id, [tracer] if tracer else None)
+        else:
+            config = {"configurable": {"thread_id": thread_id}, "callbacks": [tracer] if tracer else []}
+            result = await sql_agent.aexecute_query(request.query, config=config)
+            coalesced = False
+        print(f"Result: {result}")
 
         # Save to query history if found
+        sql_query = await extract_sql_query(sql_agent, thread_id)
+        ## rows as fetched by the execute_query tool, the query is not run again
+        result_set = result_sets.get(thread_id) if sql_query else None
         if sql_query:
-            try:
-                username = request.username or "developer"
-                conn = get_db()
-                cur = conn.cursor()
-                cur.execute(
-                    "INSERT INTO query_history (username, natural_query, generated_sql) VALUES (?, ?, ?)",
-                    (username, request.query, sql_query)
-                )
-                conn.commit()
-                conn.close()
-                print("Logged successfully executed query to history.")
-            except Exception as e:
-                print(f"Error saving query to history: {e}")
-
-        return SQLQueryResponse(result=result, thread_id=thread_id)
+            await asyncio.to_thread(save_to_history, sql_agent, request.username, request.query, sql_query)
+            ## only answers grounded in an executed query are worth caching
+            if cache_key:
+                answer_cache.set(cache_key, result, sql_query, result_set)
+
+        return query_response(request, accept, result, thread_id, result_set, sql_query, coalesced=coalesced, **debug_info(tracer, started))
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+## graph nodes whose transitions are reported to streaming clients
+STREAMED_NODES = ("sql_agent", "tools")
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_agent_events(sql_agent: SQLAgent, request: SQLQueryRequest, thread_id: str):
+    """Run the agent graph and translate its events into server-sent events"""
+    yield sse_event("start", {"thread_id": thread_id})
+    started = time.perf_counter()
+    tracer = RunTracer() if request.debug else None
+    try:
+        cache_key = await asyncio.to_thread(answer_cache_key, sql_agent, request)
+        if cache_key:
+            cached = answer_cache.get(cache_key)
+            if cached:
+                if cached.sql_query:
+                    await asyncio.to_thread(save_to_history, sql_agent, request.username, request.query, cached.sql_query)
+                    yield sse_event("sql", {"query": cached.sql_query})
+                await seed_cached_thread(sql_agent, thread_id, request.query, cached)
+                final = {"result": cached.result, "thread_id": thread_id, "cached": True}
+                if request.include_result_set and cached.result_set is not None:
+                    final["result_set"] = to_columnar(cached.result_set)
+                if tracer:
+                    final["debug"] = tracer.summary(time.perf_counter() - started)
+                yield sse_event("final", final)
+                return
+
+        config = {"configurable": {"thread_id": thread_id}, "callbacks": [tracer] if tracer else []}
+        result_sets.discard(thread_id)
+        agent_tools = {t.name for t in sql_agent.tools_list}
+        result = ""
+        streamed = False
+        sql_query = None
+        async for event in sql_agent.app.astream_events(
+            {"messages": [HumanMessage(content=request.query)]}, config=sql_agent.run_config(config), version="v2"
+        ):
+            kind = event["event"]
+            name = event.get("name")
+            ## the node run itself is tagged with its graph step, inner runnables are not
+            is_node = any(tag.startswith("graph:step:") for tag in event.get("tags", []))
+            if kind in ("on_chain_start", "on_chain_end") and name in STREAMED_NODES and is_node:
+                yield sse_event("node", {"node": name, "status": "start" if kind == "on_chain_start" else "end"})
+            elif kind == "on_tool_start" and name in agent_tools:
+                tool_input = event["data"].get("input") or {}
+                yield sse_event("tool", {"tool": name, "input": tool_input})
+                if name == "execute_query" and isinstance(tool_input, dict):
+                    sql_query = tool_input.get("query")
+                    yield sse_event("sql", {"query": sql_query})
+            elif kind == "on_chat_model_start":
+                ## every model turn starts a new answer, only the last one is final
+                result = ""
+                streamed = False
+            elif kind == "on_chat_model_stream":
+                chunk = event["data"]["chunk"]
+                if chunk.content and not chunk.tool_call_chunks:
+                    result += chunk.content
+                    streamed = True
+                    yield sse_event("token", {"token": chunk.content})
+            elif kind == "on_chat_model_end":
+                output = event["data"].get("output")
+                ## models without native streaming deliver the whole answer at once
+                if not streamed and output is not None and output.content and not output.tool_calls:
+                    result = output.content
+                    yield sse_event("token", {"token": result})
+
+        result_set = result_sets.get(thread_id) if sql_query else None
+        if sql_query:
+            await asyncio.to_thread(save_to_history, sql_agent, request.username, request.query, sql_query)
+            if cache_key and result:
+                answer_cache.set(cache_key, result, sql_query, result_set)
+        final = {"result": result, "thread_id": thread_id, "cached": False}
+        if request.include_result_set and result_set is not None:
+            final["result_set"] = to_columnar(result_set)
+        if tracer:
+            final["debug"] = tracer.summary(time.perf_counter() - started)
+        yield sse_event("final", final)
+    except Exception as e:
+        print(f"Error while streaming query: {e}")
+        yield sse_event("error", {"detail": str(e)})
+
+@router.post("/query/stream")
+async def query_database_stream(request: SQLQueryRequest):
+    sql_agent = agent_sessions.get(request.username)
+    if sql_agent is None or sql_agent.db is None or sql_agent.app is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Database connection is not established. Please set up the connection first."
+        )
+    thread_id = request.thread_id or str(uuid.uuid4())
+    print(f"Thread ID: {thread_id}, Streaming query: {request.query}")
+    return StreamingResponse(
+        stream_agent_events(sql_agent, request, thread_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/query/explain")
 async def explain_query(request: SQLQueryRequest):
-    if not sql_agent.db:
+    sql_agent = agent_sessions.get(request.username)
+    if sql_agent is None or not sql_agent.db:
         raise HTTPException(
             status_code=400,
             detail="Database connection is not established. Please set up the connection first."
@@ -117,33 +320,18 @@ async def explain_query(request: SQLQueryRequest):
     try:
         query = request.query.strip().rstrip(";")
         dialect = sql_agent.db._engine.dialect.name
-        
-        # Dialect specific syntax
-        if dialect == "postgresql":
-            explain_sql = f"EXPLAIN (FORMAT JSON) {query}"
-        elif dialect == "mysql":
-            explain_sql = f"EXPLAIN FORMAT=JSON {query}"
-        else:
-            explain_sql = f"EXPLAIN QUERY PLAN {query}"
+        explain_sql = explain_statement(query, dialect)
         
         with sql_agent.db._engine.connect() as connection:
-            result = connection.execute(text(explain_sql))
-            rows = result.fetchall()
-            
-            # Format results into a serializable list of dicts/lists
-            plan_output = []
-            for row in rows:
-                if dialect in ["postgresql", "mysql"]:
-                    # Usually returns a single column containing JSON
-                    plan_output.append(row[0])
-                else:
-                    # SQLite returns (id, parent, notused, detail)
-                    plan_output.append(dict(row._mapping))
+            rows = connection.execute(text(explain_sql)).fetchall()
+            table_rows = sqlite_table_rows(connection) if dialect == "sqlite" else None
+            plan = plan_output(rows, dialect)
             
             return {
                 "dialect": dialect,
                 "explain_query": explain_sql,
-                "plan": plan_output
+                "plan": plan,
+                "estimate": vars(estimate_plan(plan, dialect, table_rows))
             }
     except Exception as e:
         raise HTTPException(
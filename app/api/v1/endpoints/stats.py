@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from typing import Optional
+from app.services.answer_cache import answer_cache
+from app.utils.result_cache import result_cache
+from app.services.checkpointer import get_checkpointer
+from app.services.single_flight import single_flight
+from app.services.few_shot import few_shot_index
+from app.services.result_sets import result_sets
+from app.services.schema_snapshots import schema_snapshots
+from app.services.agent_sessions import agent_sessions
+from app.utils.database_connection import engine_registry
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_stats(username: Optional[str] = "developer"):
+    """Runtime statistics of the in-process caches, the conversation checkpointer, the agent sessions and the user's agent"""
+    sql_agent = agent_sessions.get(username)
+    return {
+        "answer_cache": answer_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "checkpointer": get_checkpointer().stats(),
+        "single_flight": single_flight.stats(),
+        "model_router": sql_agent.model_router.stats() if sql_agent is not None else None,
+        "few_shot": few_shot_index.stats(),
+        "result_sets": result_sets.stats(),
+        "schema_snapshots": schema_snapshots.stats(),
+        "engines": engine_registry.stats(),
+        "sessions": agent_sessions.stats(),
+        "tools": sql_agent.db_tools.stats() if sql_agent is not None and sql_agent.db is not None else None,
+    }
@@ -1,6 +1,7 @@
 import streamlit as st
 import sqlite3
 import requests
+import json
 import hashlib
 import pandas as pd
 # Initialize SQLite database
@@ -144,7 +145,7 @@ def db_connection_page():
             try:
                 response = requests.post(
                     'http://localhost:8000/api/v1/setup-connection',
-                    json={'connection_string': connection_string}
+                    json={'connection_string': connection_string, 'username': st.session_state.username}
                 )
                 if response.status_code == 200:
                     st.success('Database connected successfully!')
@@ -156,6 +157,24 @@ def db_connection_page():
             except requests.RequestException as e:
                 st.error(f'Error connecting to backend: {str(e)}')
                 
+# Stream agent progress and answer tokens from the backend
+def stream_query(query: str):
+    with requests.post(
+        'http://localhost:8000/api/v1/query/stream',
+        json={'query': query, 'username': st.session_state.username},
+        stream=True
+    ) as response:
+        if response.status_code != 200:
+            yield "error", {"detail": response.text}
+            return
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event:
+                yield event, json.loads(line[len("data:"):])
+                event = None
+
 # Chat interface page
 def chat_page():
     st.set_page_config(page_title="Talk2SQL👨🏼‍💻🛢", layout="wide")
@@ -172,19 +191,35 @@ def chat_page():
     
     if query:
         st.session_state.chat_history.append({"role": "user", "content": query})
+        with st.chat_message("user"):
+            st.write(query)
         
         try:
-            response = requests.post(
-                'http://localhost:8000/api/v1/query',
-                json={'query': query}
-            )
+            with st.chat_message("assistant"):
+                status = st.status("Thinking...")
+                answer_placeholder = st.empty()
+                answer = ""
+                result = None
+                for event, data in stream_query(query):
+                    if event == "node":
+                        if data["status"] == "start":
+                            status.update(label="Running tools..." if data["node"] == "tools" else "Thinking...")
+                    elif event == "tool":
+                        status.write(f"Calling `{data['tool']}`")
+                    elif event == "sql":
+                        status.code(data["query"], language="sql")
+                    elif event == "token":
+                        answer += data["token"]
+                        answer_placeholder.markdown(answer)
+                    elif event == "final":
+                        result = data.get("result") or answer
+                    elif event == "error":
+                        st.error(f'Query failed: {data.get("detail")}')
+                status.update(label="Done", state="complete")
             
-            if response.status_code == 200:
-                result = response.json().get("result", "No result")
+            if result is not None:
                 st.session_state.chat_history.append({"role": "assistant", "content": result})
                 st.rerun()
-            else:
-                st.error(f'Query failed: {response.text}')
         except requests.RequestException as e:
             st.error(f'Error connecting to backend: {str(e)}')
     
@@ -1,7 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1.endpoints import sql_query, database_connection, schema, history
+from app.api.v1.endpoints import sql_query, database_connection, schema, history, stats, metrics
 from app.api.v1 import auth
+from app.utils.metrics import MetricsMiddleware
 
 app = FastAPI()
 
@@ -13,9 +14,13 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
 )
+## request latency and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(database_connection.router, prefix="/api/v1")
 app.include_router(sql_query.router, prefix="/api/v1")
 app.include_router(auth.router, prefix="/api/v1/auth")
 app.include_router(schema.router, prefix="/api/v1")
-app.include_router(history.router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(history.router, prefix="/api/v1")
+app.include_router(stats.router, prefix="/api/v1")
+app.include_router(metrics.router)
@@ -1,3 +1,5 @@
+import operator
+from typing import Annotated
 from pydantic import BaseModel, Field
 from langgraph.graph import MessagesState
 
@@ -16,3 +18,11 @@ class SQLAgentState(MessagesState):
 
 class DBQuery(BaseModel):
     query: str = Field(..., description="The SQL query to execute")
+
+
+class AgentState(MessagesState):
+    """State of the sql agent workflow"""
+    schema_digest: str ## compact schema of the relevant tables, empty when the tool loop is used
+    compacted_tokens: Annotated[int, operator.add] ## prompt tokens removed by conversation compaction, summed over the thread
+    routing: dict ## model routing decision of the current question, see ModelRouter
+    few_shot_examples: str ## similar past questions with their working SQL, from the query history
@@ -0,0 +1,160 @@
+"""
+Agent sessions per user and database connection.
+Each session holds its own SQLAgent (connection, tools and compiled graph),
+so users can work against different databases at the same time. Sessions
+are evicted when idle, least recently used first beyond the session count
+or the estimated memory budget. The lookup on the request path is a dict
+access under a lock; connecting runs outside of it.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.engine import make_url
+
+from app.agents.sql_agent import SQLAgent
+from app.utils.database_connection import engine_registry
+
+DEFAULT_USER = "developer"
+
+
+def table_scope(allowed_tables) -> Optional[tuple]:
+    return tuple(allowed_tables) if allowed_tables is not None else None
+
+
+class _Session:
+    def __init__(self, agent: SQLAgent, options: tuple):
+        self.agent = agent
+        ## connect options the agent was set up with, a reconnect with other options builds a new agent;
+        ## the allowed tables are compared with the agent itself, they can change after connecting
+        self.options = options
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class AgentSessionRegistry:
+    """SQLAgent per (user, connection), bounded by count, idle time and estimated memory"""
+
+    def __init__(self, max_sessions: int = 64, idle_seconds: float = 3600, max_bytes: int = 1 << 30,
+                 factory: Callable[[], SQLAgent] = SQLAgent):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_bytes
+        ## builds the agent of a new session, replaceable for benchmarks and offline runs
+        self.factory = factory
+        self._sessions: "OrderedDict[Tuple[str, str], _Session]" = OrderedDict()
+        ## user -> connection of the last setup-connection call, the one their queries run against
+        self._active: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evictions = 0
+
+    @staticmethod
+    def session_key(username: Optional[str], connection_string: str, schema: Optional[str] = None) -> Tuple[str, str]:
+        connection = make_url(connection_string).render_as_string(hide_password=True)
+        return (username or DEFAULT_USER, f"{connection}#{schema}" if schema else connection)
+
+    def connect(self, username: Optional[str], connection_string: str, cost_guard=None,
+                allowed_tables=None, schema=None) -> SQLAgent:
+        """Session of the user for the connection, set up unless one with the same options exists; blocking"""
+        key = self.session_key(username, connection_string, schema)
+        options = (connection_string, repr(vars(cost_guard)) if cost_guard is not None else None)
+        with self._lock:
+            session = self._sessions.get(key)
+            if (session is not None and session.options == options
+                    and table_scope(getattr(session.agent, "allowed_tables", None)) == table_scope(allowed_tables)):
+                self._touch(key, session)
+                self._active[key[0]] = key[1]
+                self.reused += 1
+                return session.agent
+
+        ## connecting and reflecting takes a while, other users keep being served meanwhile
+        agent = self.factory()
+        agent.setup_database_connection(connection_string, cost_guard, allowed_tables=allowed_tables, schema=schema)
+        with self._lock:
+            replaced = self._sessions.pop(key, None)
+            self._sessions[key] = _Session(agent, options)
+            self._active[key[0]] = key[1]
+            self.created += 1
+            evicted = self._evict(keep=key)
+        if replaced is not None:
+            evicted.append(replaced)
+        self._close(evicted)
+        return agent
+
+    def get(self, username: Optional[str]) -> Optional[SQLAgent]:
+        """Connected agent of the user, None when the user has no (live) session"""
+        user = username or DEFAULT_USER
+        with self._lock:
+            connection = self._active.get(user)
+            session = self._sessions.get((user, connection)) if connection is not None else None
+            if session is None:
+                return None
+            self._touch((user, connection), session)
+            return session.agent
+
+    def agents(self):
+        """Agents of all live sessions"""
+        with self._lock:
+            return [session.agent for session in self._sessions.values()]
+
+    def _touch(self, key, session: _Session):
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(key)
+
+    def _evict(self, keep=None) -> list:
+        """Remove idle sessions, then least recently used ones over the count or memory budget; lock held"""
+        now = time.monotonic()
+        evicted = []
+        for key, session in list(self._sessions.items()):
+            if key != keep and now - session.last_used > self.idle_seconds:
+                evicted.append(self._sessions.pop(key))
+        total = sum(session.agent.memory_estimate() for session in self._sessions.values())
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or total > self.max_bytes):
+            key = next(iter(self._sessions))
+            if key == keep:
+                break
+            session = self._sessions.pop(key)
+            total -= session.agent.memory_estimate()
+            evicted.append(session)
+        if evicted:
+            self._active = {user: connection for user, connection in self._active.items()
+                            if (user, connection) in self._sessions}
+        self.evictions += len(evicted)
+        return evicted
+
+    @staticmethod
+    def _close(sessions: list):
+        ## requests still holding an agent finish on it, its engine is disposed once idle
+        for session in sessions:
+            if session.agent.db is not None:
+                engine_registry.release(session.agent.db._engine)
+
+    def sweep(self):
+        """Evict idle sessions, also run on every stats call"""
+        with self._lock:
+            evicted = self._evict()
+        self._close(evicted)
+
+    def stats(self) -> dict:
+        self.sweep()
+        now = time.monotonic()
+        with self._lock:
+            sessions = [{"user": user, "connection": connection,
+                         "active": self._active.get(user) == connection,
+                         "idle_seconds": round(now - session.last_used, 1),
+                         "estimated_bytes": session.agent.memory_estimate()}
+                        for (user, connection), session in self._sessions.items()]
+        return {"sessions": sessions, "max_sessions": self.max_sessions, "max_bytes": self.max_bytes,
+                "estimated_bytes": sum(s["estimated_bytes"] for s in sessions),
+                "created": self.created, "reused": self.reused, "evictions": self.evictions}
+
+
+agent_sessions = AgentSessionRegistry(
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "64")),
+    idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "3600")),
+    max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(1 << 30))),
+)
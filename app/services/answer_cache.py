@@ -0,0 +1,127 @@
+"""
+Answer cache for the /query endpoint.
+Answers are keyed by the normalized question, the connection, the schema
+fingerprint and the allowed tables, so a repeated dashboard question is
+served without running the agent graph again.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+## multi-word phrases are rewritten before single words
+SYNONYMS = [
+    (r"\bhow many\b", "count"),
+    (r"\bnumber of\b", "count"),
+    (r"\bwhat s\b", "what is"),
+    (r"\bwhats\b", "what is"),
+    (r"\b(show|display|give|get|fetch|find)( me)?\b", "list"),
+    (r"\bplease\b", ""),
+]
+
+## comparison operators and signs change the meaning of a question, they are kept as words
+OPERATORS = [
+    (r">=|=>", " gte "),
+    (r"<=|=<", " lte "),
+    (r"!=|<>", " ne "),
+    (r">", " gt "),
+    (r"<", " lt "),
+    (r"=", " eq "),
+    ## a minus sign in front of a number, not a hyphen inside a word or range
+    (r"(?<![\w.])-(?=\.?\d)", " minus "),
+]
+## other punctuation is dropped, decimal points inside numbers are kept
+_PUNCTUATION = re.compile(r"(?!(?<=\d)\.(?=\d))[^\w\s]")
+
+
+def normalize_question(question: str) -> str:
+    """Normalize case, whitespace, punctuation and common synonyms of a question"""
+    normalized = unicodedata.normalize("NFKC", question).lower()
+    for pattern, replacement in OPERATORS:
+        normalized = re.sub(pattern, replacement, normalized)
+    normalized = _PUNCTUATION.sub(" ", normalized)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    for pattern, replacement in SYNONYMS:
+        normalized = re.sub(pattern, replacement, normalized)
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+@dataclass
+class CachedAnswer:
+    result: str
+    sql_query: Optional[str]
+    created_at: float
+    ## QueryResult of the executed query, for clients asking for the result set
+    result_set: Any = None
+
+
+class AnswerCache:
+    """Thread-safe LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(question: str, connection_key: str, schema_fingerprint: str,
+                 allowed_tables: Optional[Iterable[str]] = None) -> str:
+        """Build the cache key of a question asked against a connection"""
+        tables = "*" if allowed_tables is None else ",".join(sorted(allowed_tables))
+        raw = "\x1f".join([normalize_question(question), connection_key, schema_fingerprint, tables])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedAnswer]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - entry.created_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, result: str, sql_query: Optional[str] = None, result_set: Any = None):
+        with self._lock:
+            self._entries[key] = CachedAnswer(result=result, sql_query=sql_query, created_at=time.monotonic(),
+                                              result_set=result_set)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600")),
+)
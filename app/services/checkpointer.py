@@ -0,0 +1,406 @@
+"""
+Checkpointers for the agent workflow.
+BoundedMemorySaver keeps only the latest checkpoints of each thread, expires
+idle threads and caps the number of threads and bytes held in memory.
+SQLiteCheckpointSaver puts a durable SQLite store (WAL, batched writes)
+behind it, so threads evicted from memory are reloaded on their next turn.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+class ThreadUsage:
+    __slots__ = ("last_access", "bytes", "blob_keys", "write_keys", "versions")
+
+    def __init__(self):
+        self.last_access = time.monotonic()
+        self.bytes = 0
+        self.blob_keys: Set[tuple] = set()
+        self.write_keys: Set[tuple] = set()
+        ## (checkpoint_ns, checkpoint_id) -> channel versions, to know which blobs are still referenced
+        self.versions: Dict[Tuple[str, str], dict] = {}
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer with per-thread TTL and a global LRU cap on threads and bytes"""
+
+    def __init__(self, max_threads: int = 1000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: float = 24 * 3600, keep_checkpoints: int = 2, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        ## older checkpoints are only needed for time travel, which the API does not expose
+        self.keep_checkpoints = keep_checkpoints
+        self._threads: "OrderedDict[str, ThreadUsage]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    ## bookkeeping
+
+    def _usage(self, thread_id: str) -> ThreadUsage:
+        usage = self._threads.get(thread_id)
+        if usage is None:
+            usage = self._threads[thread_id] = ThreadUsage()
+        usage.last_access = time.monotonic()
+        self._threads.move_to_end(thread_id)
+        return usage
+
+    def _measure(self, thread_id: str, usage: ThreadUsage):
+        size = 0
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+        size += sum(len(self.blobs[key][1]) for key in usage.blob_keys if key in self.blobs)
+        for key in usage.write_keys:
+            size += sum(len(write[2][1]) for write in self.writes.get(key, {}).values())
+        self.total_bytes += size - usage.bytes
+        usage.bytes = size
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, usage: ThreadUsage):
+        """Drop all but the latest checkpoints of a thread, with their writes and unreferenced blobs"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return []
+        dropped = sorted(checkpoints)[:-self.keep_checkpoints]
+        for checkpoint_id in dropped:
+            del checkpoints[checkpoint_id]
+            usage.versions.pop((checkpoint_ns, checkpoint_id), None)
+            write_key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(write_key, None)
+            usage.write_keys.discard(write_key)
+        referenced = {
+            (thread_id, ns, channel, version)
+            for (ns, _), versions in usage.versions.items()
+            for channel, version in versions.items()
+        }
+        for key in [k for k in usage.blob_keys if k[1] == checkpoint_ns and k not in referenced]:
+            self.blobs.pop(key, None)
+            usage.blob_keys.discard(key)
+        return dropped
+
+    def _forget(self, thread_id: str):
+        """Remove a thread from memory"""
+        usage = self._threads.pop(thread_id, None)
+        self.storage.pop(thread_id, None)
+        if usage is None:
+            return
+        for key in usage.blob_keys:
+            self.blobs.pop(key, None)
+        for key in usage.write_keys:
+            self.writes.pop(key, None)
+        self.total_bytes -= usage.bytes
+
+    def _expired(self, usage: ThreadUsage) -> bool:
+        return time.monotonic() - usage.last_access > self.ttl_seconds
+
+    def _enforce_limits(self, current_thread: Optional[str] = None):
+        ## threads are ordered by last access, so expired ones are at the front
+        while self._threads:
+            thread_id, usage = next(iter(self._threads.items()))
+            if not self._expired(usage):
+                break
+            self._expire(thread_id)
+            self.expirations += 1
+        while len(self._threads) > self.max_threads or self.total_bytes > self.max_bytes:
+            thread_id = next(iter(self._threads))
+            if thread_id == current_thread:
+                break
+            self._evict(thread_id)
+            self.evictions += 1
+
+    def _expire(self, thread_id: str):
+        self._forget(thread_id)
+
+    def _evict(self, thread_id: str):
+        self._forget(thread_id)
+
+    ## checkpointer interface
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            usage = self._threads.get(thread_id)
+            if usage is not None and self._expired(usage):
+                self._expire(thread_id)
+                self.expirations += 1
+                usage = None
+            if usage is None and not self._load_thread(thread_id):
+                return None
+            self._usage(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config and config["configurable"]["thread_id"] not in self._threads:
+                if not self._load_thread(config["configurable"]["thread_id"]):
+                    return iter(())
+            return iter(list(super().list(config, **kwargs)))
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            usage = self._usage(thread_id)
+            usage.versions[(checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+            usage.blob_keys.update((thread_id, checkpoint_ns, k, v) for k, v in new_versions.items())
+            dropped = self._prune(thread_id, checkpoint_ns, usage)
+            self._measure(thread_id, usage)
+            self._persist_put(config, checkpoint, new_versions, dropped)
+            self._enforce_limits(thread_id)
+            return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            usage = self._usage(thread_id)
+            usage.write_keys.add(key)
+            self._measure(thread_id, usage)
+            self._persist_writes(key)
+            self._enforce_limits(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._forget(thread_id)
+
+    ## persistence hooks, no-ops for the memory only saver
+
+    def _load_thread(self, thread_id: str) -> bool:
+        return False
+
+    def _persist_put(self, config: RunnableConfig, checkpoint: Checkpoint, new_versions: ChannelVersions, dropped):
+        pass
+
+    def _persist_writes(self, key: tuple):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "threads": len(self._threads),
+                "bytes": self.total_bytes,
+                "max_threads": self.max_threads,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteCheckpointSaver(BoundedMemorySaver):
+    """Durable checkpointer: a bounded in-memory working set backed by SQLite in WAL mode.
+    Writes are queued and flushed in batches by a background thread."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT,
+            checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+        );
+        CREATE TABLE IF NOT EXISTS blobs (
+            thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT, type TEXT, data BLOB,
+            PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+        );
+        CREATE TABLE IF NOT EXISTS writes (
+            thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+            channel TEXT, type TEXT, data BLOB, task_path TEXT,
+            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+        );
+        CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, last_access REAL);
+        CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+    """
+
+    def __init__(self, path: str = "checkpoints.db", flush_interval: float = 0.05,
+                 flush_batch_size: int = 500, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(self.SCHEMA)
+        self._db_lock = threading.Lock()
+        self._pending: list = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_purge = 0.0
+        self.flushes = 0
+        self._flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flusher", daemon=True)
+        self._flusher.start()
+
+    ## batched writes
+
+    def _queue(self, sql: str, params: tuple):
+        with self._pending_lock:
+            self._pending.append((sql, params))
+            if len(self._pending) >= self.flush_batch_size:
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_purge > min(self.ttl_seconds, 3600):
+                    self._purge_expired()
+            except Exception as e:
+                print(f"Error flushing checkpoints: {e}")
+
+    def flush(self):
+        """Write all queued operations in one transaction"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        with self._db_lock:
+            self._connection.execute("BEGIN")
+            try:
+                for sql, params in pending:
+                    self._connection.execute(sql, params)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+
+    def _purge_expired(self):
+        """Delete threads idle for longer than the TTL from disk"""
+        self._last_purge = time.monotonic()
+        cutoff = time.time() - self.ttl_seconds
+        with self._db_lock:
+            self._connection.execute("BEGIN")
+            for table in ("checkpoints", "blobs", "writes"):
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE thread_id IN (SELECT thread_id FROM threads WHERE last_access < ?)",
+                    (cutoff,))
+            self._connection.execute("DELETE FROM threads WHERE last_access < ?", (cutoff,))
+            self._connection.execute("COMMIT")
+
+    def _touch(self, thread_id: str):
+        self._queue("INSERT OR REPLACE INTO threads (thread_id, last_access) VALUES (?, ?)", (thread_id, time.time()))
+
+    def _persist_put(self, config, checkpoint, new_versions, dropped):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        saved_checkpoint, saved_metadata, parent_id = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+        self._queue(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (thread_id, checkpoint_ns, checkpoint["id"], parent_id, *saved_checkpoint, *saved_metadata))
+        for channel, version in new_versions.items():
+            blob = self.blobs.get((thread_id, checkpoint_ns, channel, version))
+            if blob is not None:
+                self._queue("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                            (thread_id, checkpoint_ns, channel, str(version), *blob))
+        for checkpoint_id in dropped:
+            self._queue("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        (thread_id, checkpoint_ns, checkpoint_id))
+            self._queue("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        (thread_id, checkpoint_ns, checkpoint_id))
+        if dropped:
+            usage = self._threads[thread_id]
+            kept = {str(v) for (ns, _), versions in usage.versions.items() if ns == checkpoint_ns for v in versions.values()}
+            self._queue(
+                f"DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND version NOT IN ({','.join('?' * len(kept)) or 'NULL'})",
+                (thread_id, checkpoint_ns, *kept))
+        self._touch(thread_id)
+
+    def _persist_writes(self, key: tuple):
+        for (task_id, idx), (_, channel, value, task_path) in self.writes.get(key, {}).items():
+            self._queue("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (*key, task_id, idx, channel, *value, task_path))
+
+    ## reload of threads evicted from memory
+
+    def _load_thread(self, thread_id: str) -> bool:
+        self.flush()
+        with self._db_lock:
+            checkpoints = self._connection.execute(
+                "SELECT checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata "
+                "FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchall()
+            if not checkpoints:
+                return False
+            blobs = self._connection.execute(
+                "SELECT checkpoint_ns, channel, version, type, data FROM blobs WHERE thread_id = ?", (thread_id,)).fetchall()
+            writes = self._connection.execute(
+                "SELECT checkpoint_ns, checkpoint_id, task_id, idx, channel, type, data, task_path "
+                "FROM writes WHERE thread_id = ?", (thread_id,)).fetchall()
+
+        usage = self._usage(thread_id)
+        for ns, checkpoint_id, parent_id, c_type, c_data, m_type, m_data in checkpoints:
+            self.storage[thread_id][ns][checkpoint_id] = ((c_type, c_data), (m_type, m_data), parent_id)
+            versions = self.serde.loads_typed((c_type, c_data))["channel_versions"]
+            usage.versions[(ns, checkpoint_id)] = dict(versions)
+        ## blob versions are stored as text, map them back to the versions the checkpoints refer to
+        version_types = {(ns, ch, str(v)): v for (ns, _), vs in usage.versions.items() for ch, v in vs.items()}
+        for ns, channel, version, b_type, b_data in blobs:
+            key = (thread_id, ns, channel, version_types.get((ns, channel, version), version))
+            self.blobs[key] = (b_type, b_data)
+            usage.blob_keys.add(key)
+        for ns, checkpoint_id, task_id, idx, channel, w_type, w_data, task_path in writes:
+            key = (thread_id, ns, checkpoint_id)
+            self.writes.setdefault(key, {})[(task_id, idx)] = (task_id, channel, (w_type, w_data), task_path)
+            usage.write_keys.add(key)
+        self._measure(thread_id, usage)
+        self._enforce_limits(thread_id)
+        return True
+
+    def _expire(self, thread_id: str):
+        super()._forget(thread_id)
+        for table in ("checkpoints", "blobs", "writes", "threads"):
+            self._queue(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._expire(thread_id)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._db_lock:
+            persisted = self._connection.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+        stats.update({
+            "backend": "sqlite",
+            "path": self.path,
+            "persisted_threads": persisted,
+            "pending_writes": len(self._pending),
+            "flushes": self.flushes,
+        })
+        return stats
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer() -> BoundedMemorySaver:
+    """Process-wide checkpointer, configured through the CHECKPOINT_* environment variables"""
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            options = dict(
+                max_threads=int(os.getenv("CHECKPOINT_MAX_THREADS", "1000")),
+                max_bytes=int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024))),
+                ttl_seconds=float(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600))),
+                keep_checkpoints=int(os.getenv("CHECKPOINT_KEEP", "2")),
+            )
+            if os.getenv("CHECKPOINTER", "memory").lower() == "sqlite":
+                _checkpointer = SQLiteCheckpointSaver(path=os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db"), **options)
+            else:
+                _checkpointer = BoundedMemorySaver(**options)
+        return _checkpointer
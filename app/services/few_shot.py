@@ -0,0 +1,113 @@
+"""
+Few-shot examples retrieved from the query history.
+Past questions that produced a working query are indexed per connection
+(BM25 over words and word bigrams), so the agent can be shown the SQL of
+the most similar questions already answered on the same database.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.services.answer_cache import normalize_question
+from app.utils.lexical_index import BM25Index, tokenize
+from app.utils.schema_index import STOP_TOKENS
+
+
+def question_terms(question: str) -> List[str]:
+    """Word and word bigram terms of a question"""
+    words = [t for t in tokenize(normalize_question(question)) if t not in STOP_TOKENS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class FewShotIndex:
+    """In-memory similarity index of successful history entries, one BM25 index per connection"""
+
+    def __init__(self, max_examples: int = 5000, min_overlap: float = 0.5):
+        self.max_examples = max_examples
+        ## share of the question words an example has to contain
+        self.min_overlap = min_overlap
+        self._indexes: Dict[str, BM25Index] = {}
+        ## normalized question -> (question, sql), the latest working query wins; oldest entry first
+        self._examples: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _load(self, connection_key: str):
+        """Index the history of a connection, once per process"""
+        from app.api.v1.auth import get_db
+
+        index, examples = BM25Index(), {}
+        try:
+            conn = get_db()
+            rows = conn.execute(
+                "SELECT natural_query, generated_sql FROM query_history WHERE connection_key = ? "
+                "ORDER BY id DESC LIMIT ?", (connection_key, self.max_examples)
+            ).fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"Error loading query history for few-shot examples: {e}")
+            rows = []
+        ## oldest first, so newer queries of the same question replace older ones
+        for question, sql in reversed(rows):
+            key = normalize_question(question)
+            examples.pop(key, None)
+            examples[key] = (question, sql)
+            index.add(key, question_terms(question))
+        self._indexes[connection_key] = index
+        self._examples[connection_key] = examples
+        print(f"Few-shot index loaded: {len(examples)} examples")
+
+    def add(self, connection_key: Optional[str], question: str, sql: str):
+        """Index a new history entry, only when the connection's index is already loaded; evicts the oldest beyond max_examples"""
+        if not connection_key:
+            return
+        key = normalize_question(question)
+        with self._lock:
+            if connection_key not in self._indexes:
+                return
+            index, examples = self._indexes[connection_key], self._examples[connection_key]
+            ## re-inserted, so a question asked again counts as the newest entry
+            examples.pop(key, None)
+            examples[key] = (question, sql)
+            index.add(key, question_terms(question))
+            while len(examples) > self.max_examples:
+                oldest = next(iter(examples))
+                del examples[oldest]
+                index.remove(oldest)
+                self.evictions += 1
+
+    def search(self, connection_key: Optional[str], question: str, k: int = 3) -> List[Tuple[str, str]]:
+        """(question, sql) pairs of the k most similar past questions"""
+        if not connection_key or k <= 0:
+            return []
+        with self._lock:
+            if connection_key not in self._indexes:
+                self._load(connection_key)
+            index, examples = self._indexes[connection_key], self._examples[connection_key]
+        terms = question_terms(question)
+        words = {t for t in terms if " " not in t}
+        if not words:
+            return []
+        results = []
+        for key, _ in index.search(terms, k * 3):
+            example_words = {t for t in question_terms(examples[key][0]) if " " not in t}
+            if len(words & example_words) / len(words) >= self.min_overlap:
+                results.append(examples[key])
+            if len(results) == k:
+                break
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connections": len(self._indexes),
+                "examples": sum(len(examples) for examples in self._examples.values()),
+                "max_examples": self.max_examples,
+                "evictions": self.evictions,
+            }
+
+
+few_shot_index = FewShotIndex(
+    max_examples=int(os.getenv("FEW_SHOT_MAX_HISTORY", "5000")),
+    min_overlap=float(os.getenv("FEW_SHOT_MIN_OVERLAP", "0.5")),
+)
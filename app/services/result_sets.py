@@ -0,0 +1,49 @@
+"""
+Result sets of the queries the agent executed, per conversation thread.
+The execute_query tool records the rows it fetched, so /query can return
+them as structured data without running the SQL again.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.utils.query_result import QueryResult
+
+
+class ResultSetStore:
+    """Last successful result set of each thread, bounded LRU"""
+
+    def __init__(self, max_threads: int = 256):
+        self.max_threads = max_threads
+        self._results: "OrderedDict[str, QueryResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, thread_id: Optional[str], result: QueryResult):
+        if not thread_id:
+            return
+        with self._lock:
+            self._results[thread_id] = result
+            self._results.move_to_end(thread_id)
+            while len(self._results) > self.max_threads:
+                self._results.popitem(last=False)
+
+    def get(self, thread_id: str) -> Optional[QueryResult]:
+        with self._lock:
+            return self._results.get(thread_id)
+
+    def discard(self, thread_id: str):
+        with self._lock:
+            self._results.pop(thread_id, None)
+
+    def copy(self, source: str, target: str):
+        result = self.get(source)
+        if result is not None:
+            self.put(target, result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"threads": len(self._results), "max_threads": self.max_threads}
+
+
+result_sets = ResultSetStore(max_threads=int(os.getenv("RESULT_SET_MAX_THREADS", "256")))
@@ -0,0 +1,103 @@
+"""
+Persisted schema snapshots of the connected databases.
+The reflected SQLAlchemy metadata, the catalog details behind the schema
+index and the schema digests are pickled to a local directory, one file per
+connection target. On reconnect (or after a restart) a snapshot is only used
+when its schema fingerprint matches the one read from the live catalog, so
+an unchanged schema is not reflected again.
+Snapshots are written and read by this process only, never load files from
+an untrusted directory: unpickling a planted file runs arbitrary code. The
+directory is created private to the service user, and snapshots are not read
+from a directory other users can write to.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from sqlalchemy import MetaData
+
+
+@dataclass
+class SchemaSnapshot:
+    fingerprint: str
+    metadata: MetaData
+    ## read_catalog_details output, feeds the schema index and the SQL validation catalog
+    details: Dict[str, dict]
+    ## table name -> schema digest line
+    digests: Dict[str, str] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+
+
+class SchemaSnapshotStore:
+    """One pickled SchemaSnapshot per connection target, in a local directory"""
+
+    def __init__(self, directory: str = "schema_snapshots"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.saves = 0
+
+    def _path(self, connection_key: str, schema: Optional[str]) -> str:
+        ## the connection key carries no password, hashing it keeps host and user names out of the file name
+        digest = hashlib.sha256(f"{connection_key}\x1f{schema or ''}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pickle")
+
+    def load(self, connection_key: str, schema: Optional[str], fingerprint: str) -> Optional[SchemaSnapshot]:
+        """Snapshot of the connection, None when there is none or the schema changed since it was taken"""
+        path = self._path(connection_key, schema)
+        if not self._trusted():
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"Error reading schema snapshot {path}: {e}")
+            self.misses += 1
+            return None
+        if not isinstance(snapshot, SchemaSnapshot) or snapshot.fingerprint != fingerprint:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return snapshot
+
+    def save(self, connection_key: str, schema: Optional[str], snapshot: SchemaSnapshot):
+        path = self._path(connection_key, schema)
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            ## written next to the target and renamed, readers never see a partial file
+            temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+            with self._lock:
+                self.saves += 1
+        except Exception as e:
+            print(f"Error writing schema snapshot {path}: {e}")
+
+    def _trusted(self) -> bool:
+        """False when other users could have written the snapshots"""
+        try:
+            mode = os.stat(self.directory).st_mode
+        except OSError:
+            return True
+        if os.name == "posix" and mode & 0o022:
+            print(f"Ignoring schema snapshots in {self.directory}: the directory is writable by other users")
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {"directory": self.directory, "hits": self.hits, "misses": self.misses,
+                "stale": self.stale, "saves": self.saves}
+
+
+schema_snapshots = SchemaSnapshotStore(directory=os.getenv("SCHEMA_SNAPSHOT_DIR", "schema_snapshots"))
@@ -1,9 +0,0 @@
-"""
-SQLAgent singleton instance module.
-This creates and maintains a single instance of the SQLAgent class
-that can be imported and used throughout the application.
-"""
-# from app.services.sql_agent import SQLAgent
-from app.agents.sql_agent import SQLAgent
-# Create a singleton instance
-sql_agent = SQLAgent()
\ No newline at end of file
@@ -236,18 +236,67 @@
 
 
 ## creating database tools 
-from langchain_core.tools import tool
+from langchain_core.tools import tool, StructuredTool
 from app.schemas.agent_state import SQLAgentState
 from typing import Dict
 from langchain_core.messages import AIMessage
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from app.schemas.agent_state import DBQuery
 from langchain_core.prompts import ChatPromptTemplate
+from app.utils.database_connection import connection_key, engine_registry
+from app.utils.result_cache import result_cache
+from app.utils.tool_execution import ConnectionLimiter, ToolTimings, limiter_for
+from app.utils.sql_validation import validate_sql
+from app.utils.query_plan import CostGuard, estimate_plan, explain_statement, plan_output, sqlite_table_rows
+from app.utils.query_result import QueryResult, ResultLimits, acollect_result, collect_result
+from app.services.result_sets import result_sets
+from app.utils.metrics import DB_POOL_CHECKOUT_SECONDS, DB_QUERY_ROWS, DB_QUERY_SECONDS
+from app.utils.schema_cache import TableSchemaCache, schema_cache_for
+from langchain_core.runnables import RunnableConfig
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import NullType
+import asyncio
+import os
+import threading
+import time
 
 class DatabaseTools:
-    def __init__(self,db = None, llm = None):
+    def __init__(self,db = None, llm = None, schema_index = None, catalog = None, cost_guard = None, schema_fingerprint = None):
         self.db = db 
         self.llm = llm
+        ## ranks tables by relevance to the question on large schemas, see list_tables
+        self.schema_index = schema_index
+        self.list_tables_top_k = int(os.getenv("SCHEMA_INDEX_TOP_K", "15"))
+        ## keys the shared schema and result caches, includes the schema
+        self.connection_key = connection_key(self.db._engine, self.db._schema) if self.db is not None else None
+        self.async_engine = engine_registry.async_engine(self.db._engine) if self.db is not None else None
+        ## tool calls of one step run in parallel, bounded per database whatever the schema
+        self.max_concurrency = int(os.getenv("DB_MAX_CONCURRENCY", "4"))
+        self.limiter = limiter_for(connection_key(self.db._engine), self.max_concurrency) if self.db is not None else ConnectionLimiter(self.max_concurrency)
+        self._schema_pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="get-schema")
+        self.timings = ToolTimings()
+        ## table schemas are cached per connection and dropped when the schema fingerprint (callable) changes
+        self.schema_fingerprint = schema_fingerprint
+        self.schema_cache = schema_cache_for(self.connection_key) if self.connection_key else TableSchemaCache()
+        ## held while tables are reflected into (or snapshotted from) the connection metadata
+        self.reflect_lock = threading.Lock()
+        self._reflected_fingerprint = None
+        self.warmup_batch_size = int(os.getenv("SCHEMA_WARMUP_BATCH", "50"))
+        self.warmup = {"tables": 0, "reflected": 0, "done": False, "seconds": None}
+        ## queries are validated locally against the catalog (callable returning lower_catalog() output)
+        self.catalog = catalog
+        self.sql_validation = os.getenv("SQL_VALIDATION", "true").lower() == "true"
+        self.rejected_queries = 0
+        ## estimate-only EXPLAIN before running a query, see CostGuard
+        self.cost_guard = cost_guard if cost_guard is not None else CostGuard.from_env()
+        self.cost_guard_refused = 0
+        self.cost_guard_limited = 0
+        ## results are streamed and capped before they reach the model
+        self.result_limits = ResultLimits.from_env(self.db._max_string_length if self.db is not None else 300)
+        self.truncated_results = 0
         # self._create_query_tool = self._create_query_tool()
         self.tools = self.get_all_tools()
         try:
@@ -290,14 +339,32 @@ class DatabaseTools:
     #             return result
             
     #         return query_to_database
-    def list_tables(self) -> Dict:
-            """List all the tables"""
+    def list_tables(self, question: str = "") -> Dict:
+            """List all the tables
+            
+            Arguments:
+            question -- The user question, on large databases only the tables most relevant to it are listed
+            """
+            with self.timings.measure("list_tables"):
+                return self._list_tables(question)
+
+    def _list_tables(self, question: str = "") -> str:
             tables_list = self.list_tables_tool.invoke("")
             ## adding allowed tables only code 
             all_tables = [t.strip() for t in tables_list.split(",")]
             allowed = getattr(self.db, "allowed_tables", None)
             if allowed is not None:
-                tables_list = ", ".join([t for t in all_tables if t in allowed])
+                all_tables = [t for t in all_tables if t in allowed]
+                tables_list = ", ".join(all_tables)
+
+            if question and self.schema_index is not None and len(all_tables) > self.list_tables_top_k:
+                relevant = self.schema_index.search(question, self.list_tables_top_k, allowed=all_tables)
+                if relevant:
+                    tables_list = (f"Most relevant {len(relevant)} of {len(all_tables)} tables for the question: "
+                                   f"{', '.join(relevant)}. If a table is missing, call list_tables again with other keywords.")
+                else:
+                    tables_list = (f"No table of the {len(all_tables)} tables matched the question, "
+                                   "call list_tables again with other keywords.")
             
             ##########
             print(f"Tables found: {tables_list}")
@@ -306,21 +373,117 @@ class DatabaseTools:
     def get_schema(self, table_name: list[str]) -> Dict:
             """Get the schema of required tables"""
             print("📘 Getting schema...")
-            tables_list = self.list_tables_tool.invoke("")
-            if any(table not in tables_list for table in table_name):
-                 return "Table not exits in database"
-            
-            tables = [table.strip() for table in tables_list.split(",")]
-            required_schema = ""
-            
-            for table in tables:
+            with self.timings.measure("get_schema"):
+                usable_tables = set(self.db.get_usable_table_names())
+                if any(table not in usable_tables for table in table_name):
+                     return "Table not exits in database"
+                ## tables outside the allowed ones are neither described nor reflected
+                allowed = getattr(self.db, "allowed_tables", None)
+                hidden = [table for table in table_name if allowed is not None and table not in allowed]
+                if hidden:
+                    return f"Error: Table '{hidden[0]}' is not available. Allowed tables: {', '.join(sorted(allowed))}."
+
+                tables = list(dict.fromkeys(table_name))
+                fingerprint = self._schema_fingerprint()
+                schemas, missing = self.schema_cache.lookup(tables, fingerprint)
+                if missing:
+                    fetched = self._fetch_schemas(missing, fingerprint)
+                    ## failed tables are fetched again on the next call
+                    self.schema_cache.store({table: schema for table, schema in fetched.items()
+                                             if not schema.startswith("Error")}, fingerprint)
+                    schemas.update(fetched)
+                return "".join(f"\nTable: {table}\n{schemas[table]}\n" for table in tables if schemas.get(table))
+
+    def _schema_fingerprint(self):
+            if self.schema_fingerprint is None:
+                return None
+            try:
+                return self.schema_fingerprint()
+            except Exception as e:
+                ## cached schemas are still served, new ones are not stored
+                print(f"Error reading schema fingerprint: {e}")
+                return None
+
+    def _fetch_schemas(self, tables: list[str], fingerprint) -> Dict[str, str]:
+            """Schemas of tables missing from the cache, reflected together and rendered side by side"""
+            try:
+                with self.limiter.slot():
+                    self._reflect(tables, fingerprint)
+            except Exception as e:
+                ## get_table_info reflects the remaining tables itself
+                print(f"Error reflecting tables {tables}: {e}")
+            ## DDL and sample rows per table, run side by side within the connection cap
+            return dict(zip(tables, self._schema_pool.map(self._table_schema, tables)))
+
+    def _reflect(self, tables: list[str], fingerprint):
+            """One reflection pass for all tables not yet in the connection metadata"""
+            metadata = self.db._metadata
+            with self.reflect_lock:
+                if fingerprint is not None and fingerprint != self._reflected_fingerprint:
+                    ## tables reflected under an older schema are stale
+                    if self._reflected_fingerprint is not None:
+                        metadata.clear()
+                    self._reflected_fingerprint = fingerprint
+                reflected = {table.name for table in metadata.tables.values()}
+                to_reflect = [table for table in tables if table not in reflected]
+                if to_reflect:
+                    metadata.reflect(views=self.db._view_support, bind=self.db._engine,
+                                     only=to_reflect, schema=self.db._schema)
+
+    def scoped_tables(self) -> list[str]:
+            """Usable tables of the connection, restricted to the allowed tables when set"""
+            tables = list(self.db.get_usable_table_names())
+            allowed = getattr(self.db, "allowed_tables", None)
+            if allowed is not None:
+                tables = [t for t in tables if t in allowed]
+            return tables
+
+    def warm_schema(self):
+            """Reflect the allowed (or all) tables ahead of use, in batches so on-demand reflection is not held up"""
+            start = time.perf_counter()
+            tables = self.scoped_tables()
+            self.warmup.update(tables=len(tables), reflected=0, done=False, seconds=None)
+            for i in range(0, len(tables), self.warmup_batch_size):
+                batch = tables[i:i + self.warmup_batch_size]
                 try:
-                    schema = self.get_schema_tool.invoke(table)
-                    required_schema += f"\nTable: {table}\n{schema}\n"
+                    with self.limiter.slot():
+                        self._reflect(batch, None)
                 except Exception as e:
-                    print(f"Error getting schema for {table}: {e}")
-            
-            return required_schema
+                    print(f"Error warming up schema of {batch}: {e}")
+                self.warmup["reflected"] += len(batch)
+            self.warmup.update(done=True, seconds=round(time.perf_counter() - start, 3))
+            print(f"Schema warm-up: {len(tables)} tables reflected in {self.warmup['seconds']}s")
+
+    def _table_schema(self, table: str) -> str:
+            """DDL and sample rows of one table, formatted like SQLDatabase.get_table_info, or an error line"""
+            try:
+                with self.limiter.slot():
+                    with self.reflect_lock:
+                        ## the shared metadata is reflected into and cleared by other threads, see _reflect
+                        metadata = self.db._metadata
+                        if not any(t.name == table for t in metadata.tables.values()):
+                            metadata.reflect(views=self.db._view_support, bind=self.db._engine,
+                                             only=[table], schema=self.db._schema)
+                        reflected = next(t for t in metadata.tables.values() if t.name == table)
+                        custom = (self.db._custom_table_info or {}).get(table)
+                        if custom:
+                            return custom
+                        for column in list(reflected.columns):
+                            if type(column.type) is NullType:
+                                reflected._columns.remove(column)
+                        info = str(CreateTable(reflected).compile(self.db._engine)).rstrip()
+                    ## indexes and sample rows run outside the lock, side by side with the other tables
+                    extras = []
+                    if self.db._indexes_in_table_info:
+                        extras.append(self.db._get_table_indexes(reflected))
+                    if self.db._sample_rows_in_table_info:
+                        extras.append(self.db._get_sample_rows(reflected))
+                    if extras:
+                        info += "\n\n/*" + "".join(f"\n{extra}\n" for extra in extras) + "*/"
+                    return info
+            except Exception as e:
+                print(f"Error getting schema for {table}: {e}")
+                return f"Error: could not read the schema of table '{table}': {e}"
     
 
     def generate_query(self, state: SQLAgentState) -> Dict:
@@ -377,7 +540,7 @@ class DatabaseTools:
                 }
             
     
-    def execute_query(self,query: str) -> Dict:
+    def execute_query(self,query: str, config: RunnableConfig = None) -> Dict:
             """Execute the SQL query
             
             Arguments:
@@ -386,15 +549,212 @@ class DatabaseTools:
             returns:
             execution results
             """
-            
+            error = self.validate(query)
+            if error:
+                return error
             try:
-                results = self.query_tool.invoke(query)
-                print(f"Query results: {results}")
-                return results
+                ## identical read-only statements are served from the shared result cache
+                ## for as long as the database reports the same data version
+                with self.timings.measure("execute_query"):
+                    results = result_cache.get_or_execute(
+                        self.db._engine,
+                        self.result_cache_key,
+                        query,
+                        self._run_query,
+                        size_of=self._result_size,
+                        cacheable=lambda r: isinstance(r, QueryResult),
+                    )
+                return self._tool_output(results, config)
             except Exception as e:
                 print(f"Error executing query: {e}")
                 return "Query execution failed."
+
+    @property
+    def result_cache_key(self) -> str:
+            """Namespace of this session in the shared result cache"""
+            ## the cost guard may rewrite or refuse a query and the limits shape the result,
+            ## sessions on the same connection only share results when both match
+            return "\x1f".join([self.connection_key, repr(self.cost_guard), repr(self.result_limits)])
+
+    def _run_query(self, query: str):
+            """QueryResult of a query, or the error message"""
+            started = time.perf_counter()
+            results = self._fetch(query)
+            self._record_query(started, results)
+            return results
+
+    def _record_query(self, started: float, results):
+            if isinstance(results, QueryResult):
+                DB_QUERY_SECONDS.observe(time.perf_counter() - started, status="ok")
+                DB_QUERY_ROWS.observe(results.total_rows)
+            else:
+                ## refused by the cost guard before running, or failed
+                status = "refused" if results.startswith("Error: Query refused") else "error"
+                DB_QUERY_SECONDS.observe(time.perf_counter() - started, status=status)
+
+    def _fetch(self, query: str):
+            try:
+                with self.limiter.slot():
+                    checkout = time.perf_counter()
+                    with self.db._engine.connect() as connection:
+                        DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - checkout)
+                        note = ""
+                        if self.cost_guard.enabled:
+                            query, note = self._guarded_query(query, lambda q: self._explain(connection, q))
+                            if query is None:
+                                return note
+                        ## server-side cursor, rows are fetched in batches instead of all at once
+                        result = connection.execution_options(stream_results=True).execute(text(query))
+                        results = collect_result(result, self.result_limits)
+            except SQLAlchemyError as e:
+                return f"Error: {e}"
+            results.note = note
+            return results
+
+    def _explain(self, connection, query: str):
+            dialect = self.db._engine.dialect.name
+            rows = connection.execute(text(explain_statement(query, dialect))).fetchall()
+            table_rows = sqlite_table_rows(connection) if dialect == "sqlite" else None
+            return plan_output(rows, dialect), table_rows
+
+    def _result_size(self, results) -> int:
+            return results.size if isinstance(results, QueryResult) else len(str(results))
+
+    def _tool_output(self, results, config: RunnableConfig = None) -> str:
+            if isinstance(results, QueryResult):
+                ## kept for the API response of the run, see result_sets
+                result_sets.put(((config or {}).get("configurable") or {}).get("thread_id"), results)
+                if results.truncated:
+                    self.truncated_results += 1
+                results = results.to_text()
+            print(f"Query results: {results}")
+            return results
+
+    def _guarded_query(self, query: str, explain):
+            """(query to run, note for the model) after the cost guard, (None, message) when refused"""
+            dialect = self.db._engine.dialect.name
+            try:
+                plan, table_rows = explain(query)
+            except SQLAlchemyError as e:
+                ## the statement would fail the same way, no need to run it
+                return None, f"Error: {e}"
+            try:
+                estimate = estimate_plan(plan, dialect, table_rows)
+            except Exception as e:
+                print(f"Error reading query plan: {e}")
+                return query, ""
+            guarded, note = self.cost_guard.check(query, dialect, estimate)
+            if guarded is None:
+                self.cost_guard_refused += 1
+            elif guarded != query:
+                self.cost_guard_limited += 1
+            if note:
+                print(f"Cost guard: {note.strip()}")
+            return guarded, note
+            
+    def validate(self, query: str):
+            """Local parse-and-validate gate, the error message when the query must not reach the database"""
+            if not self.sql_validation:
+                return None
+            try:
+                catalog = self.catalog() if self.catalog is not None else None
+                error = validate_sql(query, self.db._engine.dialect.name, catalog, getattr(self.db, "allowed_tables", None))
+            except Exception as e:
+                ## never block a query because the validator itself failed
+                print(f"Error validating query: {e}")
+                return None
+            if error:
+                self.rejected_queries += 1
+                print(f"Query rejected before execution: {error}")
+            return error
+            
+    async def alist_tables(self, question: str = "") -> Dict:
+            """List all the tables
+            
+            Arguments:
+            question -- The user question, on large databases only the tables most relevant to it are listed
+            """
+            ## table names and the schema index are held in memory, no database round trip
+            return self.list_tables(question)
+
+    async def aget_schema(self, table_name: list[str]) -> Dict:
+            """Get the schema of required tables"""
+            ## SQLAlchemy reflection is sync only, keep it off the event loop
+            return await asyncio.to_thread(self.get_schema, table_name)
+
+    async def aexecute_query(self, query: str, config: RunnableConfig = None) -> Dict:
+            """Execute the SQL query
             
+            Arguments:
+            query -- The SQL query to execute
+
+            returns:
+            execution results
+            """
+            if self.async_engine is None:
+                return await asyncio.to_thread(self.execute_query, query, config)
+            error = self.validate(query)
+            if error:
+                return error
+            try:
+                with self.timings.measure("execute_query"):
+                    results = await result_cache.aget_or_execute(
+                        self.db._engine,
+                        self.result_cache_key,
+                        query,
+                        self._arun_query,
+                        async_engine=self.async_engine,
+                        size_of=self._result_size,
+                        cacheable=lambda r: isinstance(r, QueryResult),
+                    )
+                return self._tool_output(results, config)
+            except Exception as e:
+                print(f"Error executing query: {e}")
+                return "Query execution failed."
+
+    async def _arun_query(self, query: str):
+            """Run a query on the async engine, QueryResult or the error message"""
+            started = time.perf_counter()
+            results = await self._afetch(query)
+            self._record_query(started, results)
+            return results
+
+    async def _afetch(self, query: str):
+            note = ""
+            try:
+                async with self.limiter.aslot():
+                    checkout = time.perf_counter()
+                    async with self.async_engine.connect() as connection:
+                        DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - checkout)
+                        if self.cost_guard.enabled:
+                            dialect = self.async_engine.dialect.name
+                            plan = (await connection.execute(text(explain_statement(query, dialect)))).fetchall()
+                            table_rows = await connection.run_sync(sqlite_table_rows) if dialect == "sqlite" else None
+                            query, note = self._guarded_query(query, lambda _: (plan_output(plan, dialect), table_rows))
+                            if query is None:
+                                return note
+                        result = await connection.stream(text(query))
+                        results = await acollect_result(result, self.result_limits)
+            except SQLAlchemyError as e:
+                return f"Error: {e}"
+            results.note = note
+            return results
+
+    def stats(self) -> dict:
+            return {
+                "concurrency": self.limiter.stats(),
+                "timings": self.timings.stats(),
+                "rejected_queries": self.rejected_queries,
+                "truncated_results": self.truncated_results,
+                "schema_cache": self.schema_cache.stats(),
+                "schema_warmup": dict(self.warmup),
+                "cost_guard": {**vars(self.cost_guard), "refused": self.cost_guard_refused, "limited": self.cost_guard_limited},
+            }
+
     def get_all_tools(self):
-         return [self.list_tables, self.get_schema, self.execute_query]
-            
\ No newline at end of file
+         ## each tool carries a sync and an async implementation, so the graph can run with invoke or ainvoke
+         return [
+              StructuredTool.from_function(func=self.list_tables, coroutine=self.alist_tables),
+              StructuredTool.from_function(func=self.get_schema, coroutine=self.aget_schema),
+              StructuredTool.from_function(func=self.execute_query, coroutine=self.aexecute_query),
+         ]
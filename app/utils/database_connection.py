@@ -1,17 +1,35 @@
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from typing import Dict, Optional
+import os
+import threading
+import time
+
+from app.utils.result_cache import result_cache
+from app.utils.schema_cache import drop_schema_cache
+from app.utils.tool_execution import drop_limiter
 
 
 class DatabaseConnection: 
-    def __init__(self,connection_string: str):
+    def __init__(self,connection_string: str, schema: Optional[str] = None):
         self.db = None
-        self.setup_database_connection(connection_string)
+        ## reflect tables when they are first used instead of the whole catalog at connect time
+        self.lazy_reflection = os.getenv("LAZY_TABLE_REFLECTION", "true").lower() == "true"
+        self.setup_database_connection(connection_string, schema)
 
-    def setup_database_connection(self, connection_string: str):
+    def setup_database_connection(self, connection_string: str, schema: Optional[str] = None):
         """Set up database connection and initialize tools"""
         try:
             # Initialize database connection
-            self.db = SQLDatabase.from_uri(connection_string)
+            ## engines are shared per database URL and schema, so reconnecting reuses the pool instead of opening another one
+            engine = engine_registry.acquire(connection_string, schema)
+            try:
+                self.db = SQLDatabase(engine, schema=schema, lazy_table_reflection=self.lazy_reflection)
+            except Exception:
+                engine_registry.release(engine)
+                raise
             print("Database connection successful!")
 
             return self.db
@@ -25,3 +43,189 @@ class DatabaseConnection:
         except Exception as e:
             print(f"Unexpected error during database connection: {str(e)}")
             raise ValueError(f"Failed to establish database connection: {str(e)}")
+
+
+def connection_key(engine, schema: Optional[str] = None) -> str:
+    """Credential-free identity of the database an engine points at, and of the schema when one is selected.
+    Process-wide caches (schemas, results, answers, few-shot history, coalescing) are keyed by it."""
+    key = engine.url.render_as_string(hide_password=True)
+    return f"{key}#{schema}" if schema else key
+
+
+## sync driver -> async driver used by the async request path
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+    "sqlite": "aiosqlite",
+}
+
+
+def create_async_engine_for(engine, **pool_options):
+    """Async twin of a sync engine, None when no async driver is available for it"""
+    backend = engine.url.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        return None
+    try:
+        ## needs greenlet as well as the async driver itself
+        from sqlalchemy.ext.asyncio import create_async_engine
+        return create_async_engine(engine.url.set(drivername=f"{backend}+{driver}"), **pool_options)
+    except ImportError as e:
+        print(f"Async driver {driver} not available, falling back to worker threads: {e}")
+        return None
+
+
+def normalize_url(connection_string: str) -> str:
+    """Canonical form of a database URL, equal for URLs that only differ in host case or query order"""
+    url = make_url(connection_string)
+    url = url.set(host=url.host.lower() if url.host else url.host, query=dict(sorted(url.query.items())))
+    return url.render_as_string(hide_password=False)
+
+
+def pool_options(url) -> dict:
+    """Connection pool settings of the DB_POOL_* environment variables for an engine URL"""
+    options = {
+        ## checks connections on checkout, dropped connections (failovers, idle timeouts) are replaced transparently
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        ## recycle before server or proxy idle timeouts close the connection
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+    }
+    ## in-memory SQLite runs on a single-connection pool without overflow or timeout
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", "5")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30")),
+    )
+    return options
+
+
+## dialect -> statement making a schema the default of a session, {} is the quoted schema name
+SCHEMA_STATEMENTS = {
+    "postgresql": "SET search_path TO {}",
+    "mysql": "USE {}",
+    "mariadb": "USE {}",
+    "oracle": "ALTER SESSION SET CURRENT_SCHEMA = {}",
+    "snowflake": "USE SCHEMA {}",
+    "duckdb": "SET search_path TO {}",
+    "trino": "USE {}",
+    "hana": "SET SCHEMA {}",
+}
+
+
+def apply_schema(engine, schema: Optional[str]):
+    """Make schema the default of every connection the engine opens, so unqualified table names resolve in it.
+    Works for async engines through their sync_engine."""
+    statement = SCHEMA_STATEMENTS.get(engine.dialect.name)
+    if not schema or statement is None:
+        return
+    sql = statement.format(engine.dialect.identifier_preparer.quote_schema(schema))
+
+    @event.listens_for(engine, "connect")
+    def set_schema(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(sql)
+        finally:
+            cursor.close()
+        ## drivers outside autocommit opened a transaction, a later rollback must not undo the setting
+        dbapi_connection.commit()
+
+
+class _Entry:
+    def __init__(self, engine, schema: Optional[str] = None):
+        self.engine = engine
+        self.schema = schema
+        self.async_engine = None
+        self.async_created = False
+        self.refs = 0
+        self.released_at = time.monotonic()
+
+
+class EngineRegistry:
+    """Process-wide engines deduplicated by URL and schema, unused engines are disposed after an idle period"""
+
+    def __init__(self, idle_seconds: float = 600):
+        self.idle_seconds = idle_seconds
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.disposed = 0
+
+    def acquire(self, connection_string: str, schema: Optional[str] = None):
+        """Shared engine of a URL whose connections default to schema, call release when the connection is replaced"""
+        ## pooled connections carry their default schema, so engines are not shared across schemas
+        key = f"{normalize_url(connection_string)}#{schema}" if schema else normalize_url(connection_string)
+        with self._lock:
+            self._dispose_idle()
+            entry = self._entries.get(key)
+            if entry is None:
+                url = make_url(connection_string)
+                engine = create_engine(url, **pool_options(url))
+                apply_schema(engine, schema)
+                entry = self._entries[key] = _Entry(engine, schema)
+                self.created += 1
+            else:
+                self.reused += 1
+            entry.refs += 1
+            return entry.engine
+
+    def release(self, engine):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.engine is engine and entry.refs > 0:
+                    entry.refs -= 1
+                    entry.released_at = time.monotonic()
+            self._dispose_idle()
+
+    def async_engine(self, engine):
+        """Shared async twin of a registered engine, with the same pool settings"""
+        with self._lock:
+            entry = next((e for e in self._entries.values() if e.engine is engine), None)
+            if entry is None:
+                return create_async_engine_for(engine)
+            if not entry.async_created:
+                entry.async_engine = create_async_engine_for(engine, **pool_options(engine.url))
+                if entry.async_engine is not None:
+                    apply_schema(entry.async_engine.sync_engine, entry.schema)
+                entry.async_created = True
+            return entry.async_engine
+
+    def _dispose_idle(self):
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.refs == 0 and now - entry.released_at > self.idle_seconds:
+                result_cache.close_probe(entry.engine)
+                entry.engine.dispose()
+                if entry.async_engine is not None:
+                    ## pooled async connections need an event loop to close, they are dropped instead
+                    entry.async_engine.sync_engine.dispose(close=False)
+                del self._entries[key]
+                self.disposed += 1
+                ## the per-connection caches would otherwise outlive every engine of the connection
+                drop_schema_cache(connection_key(entry.engine, entry.schema))
+                if not any(connection_key(e.engine) == connection_key(entry.engine) for e in self._entries.values()):
+                    ## the concurrency cap is shared by every schema of the database
+                    drop_limiter(connection_key(entry.engine))
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._dispose_idle()
+            now = time.monotonic()
+            engines = []
+            for entry in self._entries.values():
+                pool = entry.engine.pool
+                info = {"connection": connection_key(entry.engine), "schema": entry.schema, "refs": entry.refs,
+                        "idle_seconds": round(now - entry.released_at, 1) if entry.refs == 0 else 0,
+                        "pool": type(pool).__name__}
+                ## QueuePool reports its state, other pool classes do not
+                if hasattr(pool, "checkedout"):
+                    info.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                                overflow=pool.overflow(), timeout=pool.timeout())
+                engines.append(info)
+            return {"created": self.created, "reused": self.reused, "disposed": self.disposed, "engines": engines}
+
+
+engine_registry = EngineRegistry(idle_seconds=float(os.getenv("DB_ENGINE_IDLE_SECONDS", "600")))
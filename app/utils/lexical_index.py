@@ -0,0 +1,99 @@
+"""
+In-process BM25 inverted index.
+Documents can be added, replaced and removed one at a time, so callers can
+keep the index in sync with their data without rebuilding it.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Container, Dict, Hashable, Iterable, List, Optional, Tuple
+
+_WORDS = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, identifiers are split on snake_case and camelCase boundaries"""
+    tokens = []
+    for raw in re.findall(r"\w+", text):
+        parts = [p.lower() for p in _WORDS.findall(raw)]
+        if len(parts) > 1:
+            tokens.append(raw.lower())
+        tokens.extend(parts)
+    ## naive plural folding so "orders" matches "order"
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+
+
+class BM25Index:
+    """Thread-safe BM25 index over token lists"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._doc_terms: Dict[Hashable, Counter] = {}
+        self._total_length = 0
+        ## BM25 length normalisation per document, recomputed lazily after updates
+        self._norms: Optional[Dict[Hashable, float]] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id: Hashable, tokens: Iterable[str]):
+        """Add a document, replacing any previous version of it"""
+        terms = Counter(tokens)
+        with self._lock:
+            self.remove(doc_id)
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            length = sum(terms.values())
+            self._doc_terms[doc_id] = terms
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+            self._norms = None
+
+    def remove(self, doc_id: Hashable):
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                posting = self._postings[term]
+                del posting[doc_id]
+                if not posting:
+                    del self._postings[term]
+            self._total_length -= self._doc_lengths.pop(doc_id)
+            self._norms = None
+
+    def search(self, tokens: Iterable[str], k: int = 10,
+               include: Optional[Container] = None) -> List[Tuple[Hashable, float]]:
+        """Top-k (doc_id, score) pairs for the query tokens, optionally restricted to some documents"""
+        with self._lock:
+            total_docs = len(self._doc_lengths)
+            if not total_docs:
+                return []
+            if self._norms is None:
+                average_length = self._total_length / total_docs
+                self._norms = {
+                    doc_id: self.k1 * (1 - self.b + self.b * length / average_length)
+                    for doc_id, length in self._doc_lengths.items()
+                }
+            norms = self._norms
+            k1_plus_one = self.k1 + 1
+            scores: Dict[Hashable, float] = {}
+            for term in set(tokens):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (total_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    if include is not None and doc_id not in include:
+                        continue
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * k1_plus_one / (tf + norms[doc_id])
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
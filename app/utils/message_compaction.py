@@ -0,0 +1,82 @@
+"""
+Conversation compaction before each LLM call.
+Earlier exchanges keep the question, the executed SQL and the answer, while
+their schema dumps and query results are dropped or truncated. The last
+exchanges stay verbatim as long as the prompt fits the token budget.
+"""
+from typing import List, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+## tools whose calls are kept in earlier exchanges, so follow-up questions can refine the query
+KEPT_TOOLS = {"execute_query"}
+
+
+def estimate_tokens(message) -> int:
+    """Rough token count, about 4 characters per token"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    size = len(content)
+    for call in getattr(message, "tool_calls", None) or []:
+        size += len(call["name"]) + len(str(call["args"]))
+    return size // 4 + 1
+
+
+def split_exchanges(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into exchanges, each starting with a human message"""
+    exchanges: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not exchanges:
+            exchanges.append([])
+        exchanges[-1].append(message)
+    return exchanges
+
+
+def truncate_tool_output(message: ToolMessage, max_chars: int) -> ToolMessage:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    if len(content) <= max_chars:
+        return message
+    return message.model_copy(update={"content": f"{content[:max_chars]}... [{len(content) - max_chars} characters elided]"})
+
+
+def compact_exchange(exchange: List[BaseMessage], tool_output_max_chars: int) -> List[BaseMessage]:
+    """Keep the question, the kept tool calls with truncated outputs and the answer of an earlier exchange"""
+    kept_ids = set()
+    compacted: List[BaseMessage] = []
+    for message in exchange:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = [call for call in message.tool_calls if call["name"] in KEPT_TOOLS]
+            if calls:
+                kept_ids.update(call["id"] for call in calls)
+                compacted.append(message.model_copy(update={"tool_calls": calls, "content": ""}))
+        elif isinstance(message, ToolMessage):
+            if message.tool_call_id in kept_ids:
+                compacted.append(truncate_tool_output(message, tool_output_max_chars))
+        else:
+            compacted.append(message)
+    return compacted
+
+
+def compact_messages(messages: Sequence[BaseMessage], keep_exchanges: int = 3, max_tokens: int = 12000,
+                     tool_output_max_chars: int = 500) -> Tuple[List[BaseMessage], int]:
+    """Compacted copy of the conversation and the number of tokens removed"""
+    exchanges = split_exchanges(messages)
+    before = sum(estimate_tokens(m) for m in messages)
+    split = max(len(exchanges) - keep_exchanges, 0)
+    exchanges = [compact_exchange(e, tool_output_max_chars) for e in exchanges[:split]] + exchanges[split:]
+
+    def total() -> int:
+        return sum(estimate_tokens(m) for e in exchanges for m in e)
+
+    ## over budget: drop the oldest exchanges, then truncate earlier tool outputs of the current one
+    while len(exchanges) > 1 and total() > max_tokens:
+        exchanges.pop(0)
+    compacted = [m for e in exchanges for m in e]
+    if total() > max_tokens:
+        ## the trailing tool results are what the model is about to answer from, keep them whole
+        tail = len(compacted)
+        while tail > 0 and isinstance(compacted[tail - 1], ToolMessage):
+            tail -= 1
+        compacted = [truncate_tool_output(m, tool_output_max_chars) if isinstance(m, ToolMessage) and i < tail else m
+                     for i, m in enumerate(compacted)]
+
+    return compacted, before - sum(estimate_tokens(m) for m in compacted)
@@ -0,0 +1,211 @@
+"""
+EXPLAIN helpers shared by the /query/explain endpoint and the agent's
+cost guard, which refuses or limits statements whose estimated rows or
+cost exceed the thresholds configured for the connection.
+"""
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:
+    sqlglot = None
+
+from app.utils.sql_validation import SQLGLOT_DIALECTS
+
+
+def explain_statement(query: str, dialect: str) -> str:
+    """Estimate-only EXPLAIN of a query, the statement itself is not run"""
+    query = query.strip().rstrip(";")
+    if dialect == "postgresql":
+        return f"EXPLAIN (FORMAT JSON) {query}"
+    if dialect == "mysql":
+        return f"EXPLAIN FORMAT=JSON {query}"
+    return f"EXPLAIN QUERY PLAN {query}"
+
+
+def plan_output(rows, dialect: str) -> list:
+    """Serializable EXPLAIN output"""
+    if dialect in ["postgresql", "mysql"]:
+        # Usually returns a single column containing JSON
+        return [row[0] for row in rows]
+    # SQLite returns (id, parent, notused, detail)
+    return [dict(row._mapping) for row in rows]
+
+
+@dataclass
+class PlanEstimate:
+    rows: Optional[float] = None
+    cost: Optional[float] = None
+    full_scans: List[str] = field(default_factory=list)
+    ## True when rows counts the rows the plan reads (SQLite, MySQL), not the rows it returns
+    rows_scanned: bool = False
+
+    def describe(self) -> str:
+        parts = []
+        if self.rows is not None:
+            parts.append(f"{self.rows:,.0f} rows scanned" if self.rows_scanned else f"{self.rows:,.0f} rows")
+        if self.cost is not None:
+            parts.append(f"cost {self.cost:,.0f}")
+        if self.full_scans:
+            parts.append(f"full scan of {', '.join(self.full_scans)}")
+        return ", ".join(parts) or "no estimate"
+
+
+def _load_json(value):
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def _walk(node, visit):
+    if isinstance(node, dict):
+        visit(node)
+        for value in node.values():
+            _walk(value, visit)
+    elif isinstance(node, list):
+        for value in node:
+            _walk(value, visit)
+
+
+def estimate_plan(plan: list, dialect: str, table_rows: Optional[dict] = None) -> PlanEstimate:
+    """Rows and cost estimate from plan_output(), table_rows gives the row counts SQLite plans lack"""
+    estimate = PlanEstimate()
+    if not plan:
+        return estimate
+    if dialect == "postgresql":
+        top = _load_json(plan[0])[0]["Plan"]
+        estimate.rows = float(top.get("Plan Rows", 0))
+        estimate.cost = float(top.get("Total Cost", 0))
+
+        def visit(node):
+            if node.get("Node Type") == "Seq Scan" and node.get("Relation Name"):
+                estimate.full_scans.append(node["Relation Name"])
+        _walk(top, visit)
+    elif dialect == "mysql":
+        block = _load_json(plan[0]).get("query_block", {})
+        cost = block.get("cost_info", {}).get("query_cost")
+        estimate.cost = float(cost) if cost is not None else None
+        examined = []
+
+        def visit(node):
+            if "rows_examined_per_scan" in node:
+                examined.append(float(node["rows_examined_per_scan"]))
+                if node.get("access_type") == "ALL" and node.get("table_name"):
+                    estimate.full_scans.append(node["table_name"])
+        _walk(block, visit)
+        estimate.rows = sum(examined) if examined else None
+        estimate.rows_scanned = True
+    else:
+        ## SQLite only tells which tables are scanned, rows come from sqlite_stat1 when ANALYZE ran
+        for step in plan:
+            match = re.match(r"SCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)", str(step.get("detail", "")))
+            if match:
+                estimate.full_scans.append(match.group(1))
+        if table_rows:
+            counts = [table_rows[t] for t in estimate.full_scans if t in table_rows]
+            estimate.rows = float(sum(counts)) if counts else None
+        estimate.rows_scanned = True
+    return estimate
+
+
+def sqlite_table_rows(connection) -> dict:
+    """Row counts recorded by ANALYZE, empty when it never ran"""
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        ## the first number of every stat row is the row count of the table
+        rows = connection.execute(text("SELECT tbl, stat FROM sqlite_stat1")).fetchall()
+    except SQLAlchemyError:
+        return {}
+    return {table: int(str(stat).split()[0]) for table, stat in rows}
+
+
+def result_shape(query: str, dialect: str) -> Tuple[Optional[int], bool]:
+    """(most rows the statement returns, whether it aggregates) as far as its text tells, (None, False) when unknown"""
+    if sqlglot is None:
+        return None, False
+    try:
+        statement = sqlglot.parse_one(query, read=SQLGLOT_DIALECTS.get(dialect))
+    except SqlglotError:
+        return None, False
+    if not isinstance(statement, exp.Select):
+        return None, False
+    limit = statement.args.get("limit")
+    bound = limit.expression.to_py() if limit is not None and limit.expression.is_int else None
+    grouped = statement.args.get("group") is not None
+    ## window functions (COUNT(*) OVER ...) keep one output row per input row
+    aggregate = grouped or any(not function.find_ancestor(exp.Window)
+                               for projection in statement.expressions for function in projection.find_all(exp.AggFunc))
+    if aggregate and not grouped:
+        bound = 1
+    return bound, aggregate
+
+
+def add_limit(query: str, limit: int, dialect: str) -> str:
+    """Query with its result capped to limit rows"""
+    if sqlglot is not None:
+        try:
+            statement = sqlglot.parse_one(query, read=SQLGLOT_DIALECTS.get(dialect))
+            existing = statement.args.get("limit")
+            ## SQLite estimates ignore the LIMIT, a smaller one already in place is kept
+            if existing is not None and existing.expression.is_int and existing.expression.to_py() <= limit:
+                return query
+            return statement.limit(limit).sql(dialect=SQLGLOT_DIALECTS.get(dialect))
+        except (SqlglotError, AttributeError):
+            pass
+    return f"SELECT * FROM ({query.strip().rstrip(';')}) AS limited_query LIMIT {limit}"
+
+
+@dataclass
+class CostGuard:
+    """Per-connection thresholds on EXPLAIN estimates"""
+    max_rows: Optional[float] = None
+    max_cost: Optional[float] = None
+    ## "limit" rewrites queries returning too many rows with a LIMIT, "refuse" rejects them
+    action: str = "limit"
+    limit_rows: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows is not None or self.max_cost is not None
+
+    @classmethod
+    def from_env(cls, max_rows: Optional[float] = None, max_cost: Optional[float] = None,
+                 action: Optional[str] = None) -> "CostGuard":
+        """Guard of a connection, values not given fall back to the COST_GUARD_* environment variables"""
+        def env_number(name):
+            value = os.getenv(name)
+            return float(value) if value else None
+        return cls(
+            max_rows=max_rows if max_rows is not None else env_number("COST_GUARD_MAX_ROWS"),
+            max_cost=max_cost if max_cost is not None else env_number("COST_GUARD_MAX_COST"),
+            action=(action or os.getenv("COST_GUARD_ACTION", "limit")).lower(),
+            limit_rows=int(os.getenv("COST_GUARD_LIMIT_ROWS")) if os.getenv("COST_GUARD_LIMIT_ROWS") else None,
+        )
+
+    def check(self, query: str, dialect: str, estimate: PlanEstimate):
+        """(query to run, note for the model) or (None, refusal) when the estimate is over the thresholds"""
+        if self.max_cost is not None and estimate.cost is not None and estimate.cost > self.max_cost:
+            ## a LIMIT does not make an expensive aggregation cheaper
+            return None, (f"Error: Query refused before execution, the estimate ({estimate.describe()}) exceeds the "
+                          f"cost limit of {self.max_cost:,.0f}. Add selective filters on indexed columns or aggregate less data.")
+        if self.max_rows is not None and estimate.rows is not None and estimate.rows > self.max_rows:
+            bound, aggregate = result_shape(query, dialect)
+            ## a scanned rows estimate says nothing about the rows an aggregate or a bounded query returns
+            if (bound is not None and bound <= self.max_rows) or (aggregate and estimate.rows_scanned):
+                return query, ""
+            if self.action != "limit":
+                return None, (f"Error: Query refused before execution, the estimate ({estimate.describe()}) exceeds the "
+                              f"limit of {self.max_rows:,.0f} rows. Add filters, aggregate, or add a LIMIT.")
+            limit = self.limit_rows or int(self.max_rows)
+            limited = add_limit(query, limit, dialect)
+            if limited == query:
+                return query, ""
+            return limited, (
+                f"Note: the estimate ({estimate.describe()}) exceeds the limit of {self.max_rows:,.0f} rows, "
+                f"only the first {limit} rows are returned. Refine the query if more specific results are needed.\n")
+        return query, ""
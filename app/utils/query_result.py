@@ -0,0 +1,301 @@
+"""
+Bounded fetch of query results.
+Rows are read in batches through a server-side cursor and only the first
+rows within the row and byte caps are kept. Reading stops once the caps are
+hit (or the summary has its rows), the total is then a lower bound; exact
+counting by reading on up to a count limit is opt-in.
+"""
+import datetime
+import decimal
+import json
+import os
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from langchain_community.utilities.sql_database import truncate_word
+
+## execute_query tool outputs of a failed query
+FAILED_QUERY_PREFIXES = ("Error", "Query execution failed")
+
+
+@dataclass
+class ResultLimits:
+    max_rows: int = 200
+    ## size of the formatted rows handed to the model
+    max_bytes: int = 16384
+    fetch_size: int = 500
+    ## keep reading past the caps to count the total, up to count_limit rows
+    exact_count: bool = False
+    ## rows counted past the caps before the total is reported as a lower bound
+    count_limit: int = 100000
+    max_string_length: int = 300
+    ## results with more rows, or cut by the caps, reach the model as a statistical summary
+    summary: bool = True
+    summary_threshold: int = 200
+    ## rows the summary statistics are computed over, read past the caps when summaries are on
+    summary_max_rows: int = 10000
+    ## uniform sample of the rows kept for quantiles, distinct counts and top values
+    summary_sample_size: int = 10000
+    summary_top_k: int = 5
+    summary_sample_rows: int = 5
+
+    @classmethod
+    def from_env(cls, max_string_length: int = 300) -> "ResultLimits":
+        return cls(
+            max_rows=int(os.getenv("RESULT_MAX_ROWS", "200")),
+            max_bytes=int(os.getenv("RESULT_MAX_BYTES", "16384")),
+            fetch_size=int(os.getenv("RESULT_FETCH_SIZE", "500")),
+            exact_count=os.getenv("RESULT_EXACT_COUNT", "false").lower() == "true",
+            count_limit=int(os.getenv("RESULT_COUNT_LIMIT", "100000")),
+            max_string_length=max_string_length,
+            summary=os.getenv("RESULT_SUMMARY", "true").lower() == "true",
+            summary_threshold=int(os.getenv("RESULT_SUMMARY_THRESHOLD", "200")),
+            summary_max_rows=int(os.getenv("RESULT_SUMMARY_MAX_ROWS", "10000")),
+            summary_sample_size=int(os.getenv("RESULT_SUMMARY_SAMPLE_SIZE", "10000")),
+            summary_top_k=int(os.getenv("RESULT_SUMMARY_TOP_K", "5")),
+            summary_sample_rows=int(os.getenv("RESULT_SUMMARY_SAMPLE_ROWS", "5")),
+        )
+
+
+@dataclass
+class QueryResult:
+    """Rows kept from a query, with what was cut off"""
+    columns: List[str] = field(default_factory=list)
+    rows: List[tuple] = field(default_factory=list)
+    total_rows: int = 0
+    ## False when reading stopped before the end of the cursor, total_rows is then a lower bound
+    total_exact: bool = True
+    ## "rows" or "bytes" when the kept rows hit a cap
+    truncated_by: Optional[str] = None
+    ## cost guard note shown to the model before the rows
+    note: str = ""
+    ## statistical summary sent to the model instead of the rows, see result_summary
+    summary: str = ""
+    size: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.truncated_by is not None
+
+    def to_text(self) -> str:
+        """Tool output, formatted like SQLDatabase.run plus a truncation marker"""
+        if self.summary:
+            return self.note + self.summary
+        text = str(self.rows) if self.rows else ""
+        if self.truncated:
+            total = f"{self.total_rows:,}" if self.total_exact else f"at least {self.total_rows:,}"
+            limit = "row limit" if self.truncated_by == "rows" else "size limit"
+            text += (f"\n[Result truncated: showing the first {len(self.rows):,} of {total} rows ({limit}). "
+                     "Add filters or aggregate to get the rest.]")
+        return self.note + text
+
+
+## Python type of the values -> dtype reported to API clients, checked in order (bool is an int)
+DTYPES = [
+    (bool, "bool"),
+    (int, "int64"),
+    (float, "float64"),
+    (decimal.Decimal, "decimal"),
+    (str, "string"),
+    (datetime.datetime, "datetime"),
+    (datetime.date, "date"),
+    (datetime.time, "time"),
+    ((bytes, bytearray, memoryview), "binary"),
+]
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def infer_dtype(values: list) -> str:
+    """dtype of a column from its non-null values"""
+    dtypes = set()
+    for value in values:
+        if value is None:
+            continue
+        dtypes.add(next((dtype for types, dtype in DTYPES if isinstance(value, types)), "object"))
+    if not dtypes:
+        return "null"
+    if dtypes == {"int64", "float64"}:
+        return "float64"
+    return dtypes.pop() if len(dtypes) == 1 else "object"
+
+
+def to_columnar(result: QueryResult) -> dict:
+    """Typed columnar JSON of a result: column names, dtypes and one array per column"""
+    data = [list(column) for column in zip(*result.rows)] if result.rows else [[] for _ in result.columns]
+    return {
+        "columns": result.columns,
+        "dtypes": [infer_dtype(column) for column in data],
+        "data": data,
+        "total_rows": result.total_rows,
+        "total_exact": result.total_exact,
+        "truncated": result.truncated,
+    }
+
+
+def to_arrow_ipc(result: QueryResult, metadata: Optional[dict] = None) -> bytes:
+    """Arrow IPC stream of a result, metadata is attached to the schema"""
+    if pyarrow is None:
+        raise RuntimeError("pyarrow is not installed")
+    columnar = to_columnar(result)
+    arrays = []
+    for column in columnar["data"]:
+        try:
+            arrays.append(pyarrow.array(column))
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            ## mixed types, fall back to their text form
+            arrays.append(pyarrow.array([None if v is None else str(v) for v in column], type=pyarrow.string()))
+    table = pyarrow.Table.from_arrays(arrays, names=columnar["columns"])
+    metadata = {**(metadata or {}), "total_rows": result.total_rows, "truncated": result.truncated}
+    table = table.replace_schema_metadata({
+        key: json.dumps(value, default=str) if isinstance(value, (dict, list)) else str(value)
+        for key, value in metadata.items() if value is not None
+    })
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class RunningStats:
+    """Summary statistics built row by row: exact row count, nulls, min, max and sum per column,
+    plus a uniform sample of the rows for the statistics that need the values"""
+
+    def __init__(self, columns, sample_size: int = 10000, seed: int = 0):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.rows = 0
+        self.nulls = [0] * width
+        self.minimum: List[Any] = [None] * width
+        self.maximum: List[Any] = [None] * width
+        ## False once a column holds values that do not compare (mixed types)
+        self.comparable = [True] * width
+        self.sums: List[Any] = [0] * width
+        ## non-null values that are numbers, the sum covers the whole column when it equals its non-null count
+        self.numbers = [0] * width
+        self.sample_size = sample_size
+        self.sample: List[tuple] = []
+        self._random = random.Random(seed)
+
+    def add(self, row: tuple):
+        self.rows += 1
+        for i, value in enumerate(row):
+            if value is None or (isinstance(value, float) and value != value):
+                self.nulls[i] += 1
+                continue
+            if self.comparable[i]:
+                try:
+                    if self.minimum[i] is None or value < self.minimum[i]:
+                        self.minimum[i] = value
+                    if self.maximum[i] is None or value > self.maximum[i]:
+                        self.maximum[i] = value
+                except TypeError:
+                    self.comparable[i] = False
+            if isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool):
+                try:
+                    self.sums[i] += value
+                except TypeError:
+                    ## float and Decimal values in one column
+                    self.sums[i] = float(self.sums[i]) + float(value)
+                self.numbers[i] += 1
+        ## reservoir sampling, every row read has the same chance to be in the sample
+        if len(self.sample) < self.sample_size:
+            self.sample.append(row)
+        else:
+            slot = self._random.randrange(self.rows)
+            if slot < self.sample_size:
+                self.sample[slot] = row
+
+
+class _Collector:
+    def __init__(self, columns, limits: ResultLimits):
+        self.limits = limits
+        self.result = QueryResult(columns=list(columns))
+        ## summary statistics and the last rows, only kept when summaries are on
+        self.stats = RunningStats(columns, limits.summary_sample_size) if limits.summary else None
+        self.tail = deque(maxlen=limits.summary_sample_rows)
+
+    def add(self, batch) -> bool:
+        """Take a batch of rows, False once counting can stop"""
+        result, limits = self.result, self.limits
+        for row in batch:
+            result.total_rows += 1
+            if self.stats is not None:
+                row = tuple(row)
+                self.stats.add(row)
+                self.tail.append(row)
+            if result.truncated:
+                continue
+            values = tuple(truncate_word(value, length=limits.max_string_length) for value in row)
+            ## +2 for the ", " separating rows in the formatted output
+            size = len(repr(values)) + 2
+            if len(result.rows) >= limits.max_rows:
+                result.truncated_by = "rows"
+            elif result.size + size > limits.max_bytes and result.rows:
+                result.truncated_by = "bytes"
+            else:
+                result.rows.append(values)
+                result.size += size
+        if result.truncated and not self._reading_on():
+            result.total_exact = False
+            return False
+        return True
+
+    def _reading_on(self) -> bool:
+        """Whether rows past the caps are still needed, for the exact count or the summary"""
+        result, limits = self.result, self.limits
+        if limits.exact_count and result.total_rows - len(result.rows) < limits.count_limit:
+            return True
+        return self.stats is not None and result.total_rows < limits.summary_max_rows
+
+    def finish(self) -> QueryResult:
+        result, limits = self.result, self.limits
+        if self.stats is not None and (result.truncated or result.total_rows > limits.summary_threshold):
+            try:
+                ## pandas is only imported once a result needs a summary
+                from app.utils.result_summary import summarize
+                ## the tail is only known when the whole cursor was read
+                tail = list(self.tail) if result.total_exact else []
+                result.summary = summarize(self.stats, result.total_rows, result.total_exact,
+                                           result.rows[:limits.summary_sample_rows], tail, limits.summary_top_k)
+                result.size += len(result.summary)
+            except Exception as e:
+                ## fall back to the (truncated) rows
+                print(f"Error summarizing query result: {e}")
+        self.stats = None
+        return result
+
+
+def collect_result(result: Any, limits: ResultLimits) -> QueryResult:
+    """Read a sync Result in batches"""
+    if not result.returns_rows:
+        return QueryResult()
+    collector = _Collector(result.keys(), limits)
+    try:
+        while True:
+            batch = result.fetchmany(limits.fetch_size)
+            if not batch or not collector.add(batch):
+                break
+    finally:
+        result.close()
+    return collector.finish()
+
+
+async def acollect_result(result: Any, limits: ResultLimits) -> QueryResult:
+    """Read an AsyncResult (from AsyncConnection.stream) in batches"""
+    collector = _Collector(result.keys(), limits)
+    try:
+        while True:
+            batch = await result.fetchmany(limits.fetch_size)
+            if not batch or not collector.add(batch):
+                break
+    finally:
+        await result.close()
+    return collector.finish()
@@ -0,0 +1,317 @@
+"""
+Shared cache of executed SQL results.
+Entries are keyed by the connection and the canonicalized SQL text and are
+tagged with the data version of the database at the time they were stored.
+A cheap per-dialect probe is run on lookup, and an entry is only served while
+the data version it was stored under is still current. Statements calling
+volatile functions (now(), random(), date('now'), ...) are never cached.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.utils.sql_validation import SQLGLOT_DIALECTS
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:
+    sqlglot = None
+
+READ_ONLY_PREFIX = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+## functions whose result changes between runs on unchanged data, a statement calling one is not cached
+VOLATILE_FUNCTIONS = {
+    "now", "sysdate", "getdate", "getutcdate", "sysdatetime", "systimestamp", "curdate", "curtime",
+    "current_timestamp", "current_date", "current_time", "localtime", "localtimestamp", "utc_timestamp",
+    "utc_date", "utc_time", "unix_timestamp", "clock_timestamp", "statement_timestamp",
+    "transaction_timestamp", "timeofday", "random", "rand", "randomblob", "newid", "uuid", "uuid_short",
+    "gen_random_uuid", "nextval", "last_insert_rowid", "changes", "total_changes", "connection_id",
+}
+## string arguments that make SQLite date functions (and Postgres casts like 'now'::timestamp) read the clock
+VOLATILE_LITERALS = {"now", "localtime", "today", "tomorrow", "yesterday"}
+if sqlglot is not None:
+    VOLATILE_EXPRESSIONS = (exp.CurrentTimestamp, exp.CurrentDate, exp.CurrentTime, exp.CurrentDatetime,
+                            exp.Localtimestamp, exp.UtcTimestamp, exp.Rand, exp.Uuid)
+_VOLATILE = re.compile(r"\b(%s)\b|'(%s)'" % ("|".join(sorted(VOLATILE_FUNCTIONS)), "|".join(sorted(VOLATILE_LITERALS))),
+                       re.IGNORECASE)
+
+
+def is_deterministic(query: str, dialect: Optional[str] = None) -> bool:
+    """False when the statement calls a volatile function (now(), random(), date('now'), ...)"""
+    if sqlglot is not None:
+        try:
+            statement = sqlglot.parse_one(query, read=SQLGLOT_DIALECTS.get(dialect))
+            for node in statement.walk():
+                if isinstance(node, VOLATILE_EXPRESSIONS):
+                    return False
+                if isinstance(node, exp.Anonymous) and node.name.lower() in VOLATILE_FUNCTIONS:
+                    return False
+                if isinstance(node, exp.Literal) and node.is_string and node.name.lower() in VOLATILE_LITERALS:
+                    return False
+            return True
+        except (SqlglotError, ValueError):
+            pass
+    ## unparsable or no sqlglot, matches on the text (a false positive only skips the cache)
+    return _VOLATILE.search(query) is None
+
+
+def is_cacheable(query: str, dialect: Optional[str] = None) -> bool:
+    """Read-only statement whose result only depends on the data"""
+    return bool(READ_ONLY_PREFIX.match(query)) and is_deterministic(query, dialect)
+
+## quoted literals/identifiers are kept verbatim, everything else has its whitespace collapsed
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)|(\s+)")
+
+
+def canonicalize_sql(query: str) -> str:
+    """Canonical form of a SQL statement used as cache key"""
+    def replace(match):
+        return match.group(1) if match.group(1) is not None else " "
+    return _SQL_TOKENS.sub(replace, query).strip().rstrip(";").strip()
+
+
+## (optional session setup, probe query) per dialect, SQLite is handled separately
+PROBE_QUERIES = {
+    "postgresql": (None, """
+        SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0), COUNT(*)
+        FROM pg_stat_user_tables
+    """),
+    ## MySQL 8 caches information_schema statistics for a day by default
+    "mysql": ("SET SESSION information_schema_stats_expiry = 0", """
+        SELECT MAX(UPDATE_TIME), SUM(TABLE_ROWS), COUNT(*)
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+    """),
+}
+
+
+class DataVersionProbe:
+    """Cheap per-dialect query whose result changes whenever table data changes"""
+
+    def __init__(self, engine: Engine):
+        ## held weakly, the probe must not keep a disposed engine (and its pool) alive
+        self._engine = weakref.ref(engine)
+        self.dialect = engine.dialect.name
+        self.database = engine.url.database
+        self._lock = threading.Lock()
+        self._sqlite_connection = None
+
+    @property
+    def engine(self) -> Optional[Engine]:
+        return self._engine()
+
+    def close(self):
+        """Close the dedicated SQLite connection, a later version() call opens a new one"""
+        with self._lock:
+            connection, self._sqlite_connection = self._sqlite_connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception as e:
+                print(f"Error closing data version probe: {e}")
+
+    def version(self) -> Optional[Tuple]:
+        """Current data version, None when it cannot be determined"""
+        try:
+            if self.dialect == "sqlite":
+                return self._sqlite_version()
+            if self.dialect in PROBE_QUERIES:
+                setup, query = PROBE_QUERIES[self.dialect]
+                engine = self.engine
+                if engine is None:
+                    return None
+                with engine.connect() as connection:
+                    if setup:
+                        try:
+                            connection.execute(text(setup))
+                        except Exception:
+                            connection.rollback()
+                    return tuple(str(value) for value in connection.execute(text(query)).fetchone())
+        except Exception as e:
+            print(f"Data version probe failed: {e}")
+        return None
+
+    async def aversion(self, async_engine=None) -> Optional[Tuple]:
+        """Async variant of version(), run on the async engine when one is available"""
+        if async_engine is None or self.dialect not in PROBE_QUERIES:
+            return await asyncio.to_thread(self.version)
+        try:
+            setup, query = PROBE_QUERIES[self.dialect]
+            async with async_engine.connect() as connection:
+                if setup:
+                    try:
+                        await connection.execute(text(setup))
+                    except Exception:
+                        await connection.rollback()
+                result = await connection.execute(text(query))
+                return tuple(str(value) for value in result.fetchone())
+        except Exception as e:
+            print(f"Data version probe failed: {e}")
+        return None
+
+    def _sqlite_version(self) -> Optional[Tuple]:
+        ## PRAGMA data_version is per connection: it only moves when *other* connections
+        ## commit, so the probe keeps one dedicated connection outside the pool
+        if self.database in (None, "", ":memory:"):
+            return None
+        with self._lock:
+            if self._sqlite_connection is None:
+                engine = self.engine
+                if engine is None:
+                    return None
+                connection = engine.raw_connection()
+                connection.detach()
+                ## the bare DBAPI connection, the pooled wrapper refers back to the pool and the engine
+                self._sqlite_connection = connection.dbapi_connection
+            cursor = self._sqlite_connection.cursor()
+            try:
+                cursor.execute("PRAGMA data_version")
+                return tuple(cursor.fetchone())
+            finally:
+                cursor.close()
+
+
+@dataclass
+class CachedResult:
+    value: Any
+    data_version: Tuple
+    size: int
+    created_at: float
+
+
+class ResultCache:
+    """Thread-safe, size-bounded LRU cache of SQL results with data-version invalidation"""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        ## safety net for probes that lag behind writes (e.g. Postgres statistics)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], CachedResult]" = OrderedDict()
+        self._probes: "weakref.WeakKeyDictionary[Engine, DataVersionProbe]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def probe(self, engine: Engine) -> DataVersionProbe:
+        with self._lock:
+            probe = self._probes.get(engine)
+            if probe is None:
+                probe = self._probes[engine] = DataVersionProbe(engine)
+            return probe
+
+    def close_probe(self, engine: Engine):
+        """Drop the probe of an engine that is being disposed"""
+        with self._lock:
+            probe = self._probes.pop(engine, None)
+        if probe is not None:
+            probe.close()
+
+    def _lookup(self, key, data_version: Tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.data_version == data_version and time.monotonic() - entry.created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry.value
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+            return False, None
+
+    def get_or_execute(self, engine: Engine, connection_key: str, query: str,
+                       execute: Callable[[str], Any], size_of: Callable[[Any], int] = lambda v: len(str(v)),
+                       cacheable: Callable[[Any], bool] = lambda v: True) -> Any:
+        """Return the cached result of a read-only query, executing and storing it on a miss"""
+        if not is_cacheable(query, engine.dialect.name):
+            return execute(query)
+        data_version = self.probe(engine).version()
+        if data_version is None:
+            return execute(query)
+
+        key = (connection_key, canonicalize_sql(query))
+        hit, value = self._lookup(key, data_version)
+        if hit:
+            return value
+        value = execute(query)
+        if cacheable(value):
+            self._store(key, CachedResult(value, data_version, size_of(value), time.monotonic()))
+        return value
+
+    async def aget_or_execute(self, engine: Engine, connection_key: str, query: str,
+                              aexecute: Callable[[str], Awaitable[Any]], async_engine=None,
+                              size_of: Callable[[Any], int] = lambda v: len(str(v)),
+                              cacheable: Callable[[Any], bool] = lambda v: True) -> Any:
+        """Async variant of get_or_execute()"""
+        if not is_cacheable(query, engine.dialect.name):
+            return await aexecute(query)
+        data_version = await self.probe(engine).aversion(async_engine)
+        if data_version is None:
+            return await aexecute(query)
+
+        key = (connection_key, canonicalize_sql(query))
+        hit, value = self._lookup(key, data_version)
+        if hit:
+            return value
+        value = await aexecute(query)
+        if cacheable(value):
+            self._store(key, CachedResult(value, data_version, size_of(value), time.monotonic()))
+        return value
+
+    def _store(self, key, entry: CachedResult):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300")),
+)
@@ -0,0 +1,96 @@
+"""
+Local statistical summary of large query results.
+Instead of thousands of rows the model gets the row count, per-column
+statistics (min/max/mean/quantiles for numbers and dates, top categories
+for text) and a few head/tail rows. Counts, nulls, min, max and sums are
+exact over all rows read, the other statistics come from a bounded uniform
+sample and are computed with pandas.
+"""
+import re
+from typing import List
+
+import pandas as pd
+
+## dates stored as text, as SQLite does
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+
+def _number(value) -> str:
+    if pd.isna(value):
+        return "null"
+    ## numpy scalars -> Python numbers
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:,.6g}" if abs(value) < 1e6 else f"{value:,.0f}"
+    return f"{value:,.0f}" if isinstance(value, (int, float)) else str(value)
+
+
+def _numeric(series: pd.Series) -> pd.Series:
+    """Numeric view of a column, decimals included, None when the column is not numeric"""
+    if pd.api.types.is_bool_dtype(series):
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    converted = pd.to_numeric(series, errors="coerce")
+    ## object columns of Decimal values convert completely, text columns do not
+    return converted if converted.notna().sum() == series.notna().sum() and series.notna().any() else None
+
+
+def _dates(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    values = series.dropna().head(20)
+    if len(values) and all((hasattr(v, "isoformat") and hasattr(v, "year")) or
+                           (isinstance(v, str) and _ISO_DATE.match(v)) for v in values):
+        converted = pd.to_datetime(series, errors="coerce", format="ISO8601")
+        return converted if converted.notna().sum() == series.notna().sum() else None
+    return None
+
+
+def describe_column(name: str, series: pd.Series, top_k: int, stats=None, index: int = 0) -> str:
+    """Statistics of a column, series is the (sampled) values; exact counts, min, max and sum come from stats"""
+    rows = stats.rows if stats is not None else len(series)
+    nulls = stats.nulls[index] if stats is not None else int(series.isna().sum())
+    null_text = f", {nulls:,} nulls" if nulls else ""
+    if nulls == rows or series.notna().sum() == 0:
+        return f"{name}: all values null"
+    numeric = _numeric(series)
+    if numeric is not None:
+        q = numeric.quantile([0.25, 0.5, 0.75])
+        minimum, maximum, total, mean = numeric.min(), numeric.max(), numeric.sum(), numeric.mean()
+        ## exact over all rows read when every value is a number (not numeric text)
+        if stats is not None and stats.comparable[index] and stats.numbers[index] == rows - nulls:
+            minimum, maximum, total = stats.minimum[index], stats.maximum[index], stats.sums[index]
+            mean = float(total) / (rows - nulls)
+        return (f"{name} (number): min {_number(minimum)}, max {_number(maximum)}, "
+                f"mean {_number(mean)}, p25 {_number(q[0.25])}, median {_number(q[0.5])}, "
+                f"p75 {_number(q[0.75])}, sum {_number(total)}{null_text}")
+    dates = _dates(series)
+    if dates is not None:
+        if stats is not None and stats.comparable[index]:
+            return f"{name} (date): min {stats.minimum[index]}, max {stats.maximum[index]}{null_text}"
+        return f"{name} (date): min {dates.min()}, max {dates.max()}{null_text}"
+    values = series.dropna().astype(str)
+    counts = values.value_counts()
+    top = ", ".join(f"{value} ({count:,})" for value, count in counts.head(top_k).items())
+    return f"{name} (text): {len(counts):,} distinct, top: {top}{null_text}"
+
+
+def summarize(stats, total_rows: int, total_exact: bool, head: List[tuple], tail: List[tuple], top_k: int = 5) -> str:
+    """Compact text summary of a result from its RunningStats (see query_result)"""
+    frame = pd.DataFrame.from_records(stats.sample, columns=stats.columns)
+    total = f"{total_rows:,}" if total_exact else f"at least {total_rows:,}"
+    lines = [f"Result summary of {total} rows (computed locally, the rows are not listed in full)."]
+    if stats.rows < total_rows or not total_exact:
+        lines.append(f"Statistics cover the first {stats.rows:,} rows.")
+    if len(frame) < stats.rows:
+        lines.append(f"Quantiles, distinct counts and top values are estimated from a uniform sample of {len(frame):,} rows.")
+    lines.append("Columns:")
+    for index, name in enumerate(frame.columns):
+        ## duplicate column names (e.g. from joins) are addressed by position
+        lines.append("- " + describe_column(str(name), frame.iloc[:, index], top_k, stats, index))
+    lines.append(f"First {len(head)} rows: {head}")
+    if tail:
+        lines.append(f"Last {len(tail)} rows: {tail}")
+    lines.append("Aggregate in SQL (GROUP BY, COUNT, SUM, AVG) for exact figures on specific groups.")
+    return "\n".join(lines)
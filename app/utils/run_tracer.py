@@ -0,0 +1,151 @@
+"""
+Per-step accounting of one agent graph run.
+A callback handler that records, for every LangGraph node run (sql_agent,
+tools), its wall time, the model and its input/output tokens, and the tools
+it called with their duration and result size. Failed execute_query calls
+are counted as retries.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.utils.query_result import FAILED_QUERY_PREFIXES
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _usage(response) -> Dict[str, int]:
+    """Input/output tokens of an LLMResult, from the message usage or the provider's llm_output"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return {"input_tokens": token_usage.get("prompt_tokens", 0), "output_tokens": token_usage.get("completion_tokens", 0)}
+
+
+class RunTracer(BaseCallbackHandler):
+    """Collects per-node timings, tokens and tool calls of the runs it is attached to"""
+
+    ## record in the calling thread, timestamps stay accurate and in order
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        ## node run id -> step record, in start order
+        self._steps: Dict[Any, dict] = {}
+        ## langgraph step number -> node run id, to attribute model and tool calls
+        self._step_runs: Dict[int, Any] = {}
+        self._pending: Dict[Any, tuple] = {}
+        self._query_attempts = 0
+
+    def _step_for(self, metadata: Optional[dict]) -> Optional[dict]:
+        run_id = self._step_runs.get((metadata or {}).get("langgraph_step"))
+        return self._steps.get(run_id)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        ## the node run itself is tagged with its graph step, inner runnables are not
+        if not any(tag.startswith("graph:step:") for tag in tags or []):
+            return
+        metadata = metadata or {}
+        with self._lock:
+            step = metadata.get("langgraph_step")
+            self._step_runs[step] = run_id
+            self._steps[run_id] = {
+                "step": step,
+                "node": metadata.get("langgraph_node", kwargs.get("name")),
+                "started_ms": _ms(time.perf_counter() - self._started),
+                "wall_ms": None,
+                "model_calls": [],
+                "tool_calls": [],
+            }
+            self._pending[run_id] = ("node", time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+            if pending is not None and run_id in self._steps:
+                self._steps[run_id]["wall_ms"] = _ms(time.perf_counter() - pending[1])
+
+    on_chain_error = on_chain_end
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        with self._lock:
+            model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name") or kwargs.get("name")
+            self._pending[run_id] = ("model", time.perf_counter(), metadata, model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+            if pending is None:
+                return
+            _, started, metadata, model = pending
+            step = self._step_for(metadata)
+            if step is not None:
+                step["model_calls"].append({
+                    "model": model,
+                    "ms": _ms(time.perf_counter() - started),
+                    **_usage(response),
+                })
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._pending.pop(run_id, None)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        with self._lock:
+            ## the agent tools call the toolkit tools internally, only the outer call is recorded
+            if parent_run_id in self._pending and self._pending[parent_run_id][0] == "tool":
+                return
+            name = (serialized or {}).get("name") or kwargs.get("name")
+            self._pending[run_id] = ("tool", time.perf_counter(), metadata, name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+            if pending is None:
+                return
+            _, started, metadata, name = pending
+            content = str(getattr(output, "content", output))
+            record = {"tool": name, "ms": _ms(time.perf_counter() - started), "result_chars": len(content)}
+            if name == "execute_query":
+                self._query_attempts += 1
+                record["attempt"] = self._query_attempts
+                record["failed"] = content.startswith(FAILED_QUERY_PREFIXES)
+            step = self._step_for(metadata)
+            if step is not None:
+                step["tool_calls"].append(record)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.on_tool_end(f"Error: {error}", run_id=run_id)
+
+    def summary(self, total_seconds: Optional[float] = None) -> dict:
+        """Steps of the run and their totals, total_seconds is the wall time of the whole request"""
+        with self._lock:
+            steps = sorted(self._steps.values(), key=lambda s: s["started_ms"])
+            models = [call for step in steps for call in step["model_calls"]]
+            tools = [call for step in steps for call in step["tool_calls"]]
+            graph_ms = round(sum(step["wall_ms"] or 0 for step in steps), 2)
+            totals = {
+                "graph_steps": len(steps),
+                "graph_ms": graph_ms,
+                "model_calls": len(models),
+                "model_ms": round(sum(call["ms"] for call in models), 2),
+                "input_tokens": sum(call["input_tokens"] for call in models),
+                "output_tokens": sum(call["output_tokens"] for call in models),
+                "tool_calls": len(tools),
+                "tool_ms": round(sum(call["ms"] for call in tools), 2),
+                "result_chars": sum(call["result_chars"] for call in tools),
+                "retries": sum(1 for call in tools if call.get("failed")),
+            }
+            if total_seconds is not None:
+                totals["request_ms"] = _ms(total_seconds)
+                ## time spent outside the graph nodes: caching, history, state reads, serialization
+                totals["glue_ms"] = round(totals["request_ms"] - graph_ms, 2)
+            return {"totals": totals, "steps": steps}
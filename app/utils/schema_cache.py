@@ -0,0 +1,74 @@
+"""
+Per-connection cache of table schemas.
+get_schema answers from this cache: each entry holds the CREATE TABLE
+statement and the sample rows of one table. Entries are filled on demand,
+only for the requested tables, and the cache is emptied whenever the schema
+fingerprint of the connection changes.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class TableSchemaCache:
+    """Table name -> schema text of one connection, valid for one schema fingerprint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, str] = {}
+        self.fingerprint: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, tables: Iterable[str], fingerprint: Optional[str]) -> Tuple[Dict[str, str], List[str]]:
+        """Cached schemas of the tables and the tables still to fetch, drops everything on a new fingerprint"""
+        with self._lock:
+            if fingerprint is not None and fingerprint != self.fingerprint:
+                if self.fingerprint is not None:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.fingerprint = fingerprint
+            found, missing = {}, []
+            for table in tables:
+                if table in self._entries:
+                    found[table] = self._entries[table]
+                elif table not in missing:
+                    missing.append(table)
+            self.hits += len(found)
+            self.misses += len(missing)
+            return found, missing
+
+    def store(self, schemas: Dict[str, str], fingerprint: Optional[str]):
+        with self._lock:
+            ## schemas read under an older fingerprint are not kept
+            if fingerprint == self.fingerprint:
+                self._entries.update(schemas)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.fingerprint = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations}
+
+
+_caches: Dict[str, TableSchemaCache] = {}
+_caches_lock = threading.Lock()
+
+
+def schema_cache_for(connection_key: str) -> TableSchemaCache:
+    """Shared schema cache of a connection, so reconnecting and every conversation reuse it"""
+    with _caches_lock:
+        cache = _caches.get(connection_key)
+        if cache is None:
+            cache = _caches[connection_key] = TableSchemaCache()
+        return cache
+
+
+def drop_schema_cache(connection_key: str):
+    """Forget the schema cache of a connection whose engine was disposed"""
+    with _caches_lock:
+        _caches.pop(connection_key, None)
@@ -0,0 +1,144 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+
+## one catalog query per dialect, so the whole column listing costs a single round trip
+CATALOG_QUERIES = {
+    "sqlite": """
+        SELECT m.name, p.name, p.type
+        FROM sqlite_master m JOIN pragma_table_info(m.name) p
+        WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'
+        ORDER BY m.name, p.cid
+    """,
+    "postgresql": """
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = COALESCE(:schema, current_schema())
+        ORDER BY table_name, ordinal_position
+    """,
+    "mysql": """
+        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE())
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """,
+}
+
+
+def read_catalog(engine: Engine, schema: Optional[str] = None) -> Dict[str, List[Tuple[str, str]]]:
+    """Read the column listing of every table as {table: [(column, type), ...]}"""
+    query = CATALOG_QUERIES.get(engine.dialect.name)
+    catalog: Dict[str, List[Tuple[str, str]]] = {}
+    if query is not None:
+        params = {"schema": schema} if ":schema" in query else {}
+        with engine.connect() as connection:
+            for table, column, col_type in connection.execute(text(query), params):
+                catalog.setdefault(table, []).append((column, str(col_type)))
+        return catalog
+
+    ## fall back to the (slower) per-table inspector for other dialects
+    inspector = inspect(engine)
+    for table in inspector.get_table_names(schema=schema):
+        catalog[table] = [(col["name"], str(col["type"])) for col in inspector.get_columns(table, schema=schema)]
+    return catalog
+
+
+def catalog_fingerprint(catalog: Dict[str, List[Tuple[str, str]]]) -> str:
+    """Stable hash of a catalog, changes whenever a table or column is added, dropped or retyped"""
+    digest = hashlib.sha256()
+    for table in sorted(catalog):
+        digest.update(table.encode())
+        for column, col_type in catalog[table]:
+            digest.update(f"|{column}:{col_type}".encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def schema_fingerprint(engine: Engine, schema: Optional[str] = None) -> str:
+    """Fingerprint of the connected schema"""
+    return catalog_fingerprint(read_catalog(engine, schema))
+
+
+## (table, column or NULL for the table itself, comment)
+COMMENT_QUERIES = {
+    "postgresql": """
+        SELECT c.relname, a.attname, d.description
+        FROM pg_description d
+        JOIN pg_class c ON c.oid = d.objoid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = d.objsubid AND d.objsubid > 0
+        WHERE d.classoid = 'pg_class'::regclass AND n.nspname = COALESCE(:schema, current_schema())
+    """,
+    "mysql": """
+        SELECT TABLE_NAME, NULL, TABLE_COMMENT FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND TABLE_COMMENT <> ''
+        UNION ALL
+        SELECT TABLE_NAME, COLUMN_NAME, COLUMN_COMMENT FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND COLUMN_COMMENT <> ''
+    """,
+}
+
+## (table, referred table)
+FOREIGN_KEY_QUERIES = {
+    "sqlite": """
+        SELECT m.name, f."table"
+        FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) f
+        WHERE m.type = 'table'
+    """,
+    "postgresql": """
+        SELECT cl.relname, rf.relname
+        FROM pg_constraint co
+        JOIN pg_class cl ON cl.oid = co.conrelid
+        JOIN pg_class rf ON rf.oid = co.confrelid
+        JOIN pg_namespace n ON n.oid = cl.relnamespace
+        WHERE co.contype = 'f' AND n.nspname = COALESCE(:schema, current_schema())
+    """,
+    "mysql": """
+        SELECT TABLE_NAME, REFERENCED_TABLE_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND REFERENCED_TABLE_NAME IS NOT NULL
+    """,
+}
+
+
+def _fetch_rows(connection, query: str, schema: Optional[str]):
+    params = {"schema": schema} if ":schema" in query else {}
+    return connection.execute(text(query), params).fetchall()
+
+
+def read_catalog_details(engine: Engine, schema: Optional[str] = None,
+                         catalog: Optional[Dict[str, List[Tuple[str, str]]]] = None) -> Dict[str, dict]:
+    """Columns, comments and foreign key neighbours of every table, in a few bulk catalog queries.
+    A read_catalog result already at hand is reused instead of listing the columns again."""
+    if catalog is None:
+        catalog = read_catalog(engine, schema)
+    details = {
+        table: {"columns": columns, "comment": "", "column_comments": {}, "references": set()}
+        for table, columns in catalog.items()
+    }
+    dialect = engine.dialect.name
+    if dialect not in FOREIGN_KEY_QUERIES:
+        inspector = inspect(engine)
+        for table, info in details.items():
+            try:
+                info["comment"] = inspector.get_table_comment(table, schema=schema).get("text") or ""
+            except NotImplementedError:
+                pass
+            info["references"] = {fk["referred_table"] for fk in inspector.get_foreign_keys(table, schema=schema)}
+        return details
+
+    with engine.connect() as connection:
+        if dialect in COMMENT_QUERIES:
+            for table, column, comment in _fetch_rows(connection, COMMENT_QUERIES[dialect], schema):
+                if table not in details or not comment:
+                    continue
+                if column is None:
+                    details[table]["comment"] = comment
+                else:
+                    details[table]["column_comments"][column] = comment
+        for table, referred in _fetch_rows(connection, FOREIGN_KEY_QUERIES[dialect], schema):
+            if table in details:
+                details[table]["references"].add(referred)
+    return details
@@ -0,0 +1,34 @@
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+
+def table_digest(inspector, table: str, schema: Optional[str] = None) -> str:
+    """One line description of a table: name(column TYPE [PK] [-> table.column], ...)"""
+    primary_key = set(inspector.get_pk_constraint(table, schema=schema).get("constrained_columns") or [])
+    references = {}
+    for fk in inspector.get_foreign_keys(table, schema=schema):
+        for column, referred in zip(fk["constrained_columns"], fk["referred_columns"]):
+            references[column] = f"{fk['referred_table']}.{referred}"
+
+    columns = []
+    for column in inspector.get_columns(table, schema=schema):
+        entry = f"{column['name']} {column['type']}"
+        if column["name"] in primary_key:
+            entry += " PK"
+        if column["name"] in references:
+            entry += f" -> {references[column['name']]}"
+        columns.append(entry)
+    return f"{table}({', '.join(columns)})"
+
+
+def table_digests(engine: Engine, tables: Iterable[str], schema: Optional[str] = None) -> Dict[str, str]:
+    """Table name -> digest line of the given tables, read with one inspector"""
+    inspector = inspect(engine)
+    return {table: table_digest(inspector, table, schema) for table in tables}
+
+
+def build_schema_digest(engine: Engine, tables: Iterable[str], schema: Optional[str] = None) -> str:
+    """Compact schema digest of the given tables, one line per table"""
+    return "\n".join(table_digests(engine, sorted(tables), schema).values())
@@ -0,0 +1,78 @@
+"""
+Lexical retrieval index over the connected schema.
+Each table is one document made of its name, column names, comments and
+foreign key neighbours, so the agent can be shown the few tables relevant
+to a question instead of the whole catalog.
+"""
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from app.utils.lexical_index import BM25Index, tokenize
+
+## repeat table names so a name hit outweighs a column hit
+TABLE_NAME_WEIGHT = 3
+
+STOP_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "whom", "how", "many", "much", "me", "show", "list", "give", "all", "with",
+    "from", "that", "this", "there", "their", "do", "does", "did", "per", "each", "please",
+}
+## stop words as they come out of tokenize()
+STOP_TOKENS = {token for word in STOP_WORDS for token in tokenize(word)}
+
+
+def table_document(table: str, info: dict, neighbours: Iterable[str]) -> List[str]:
+    """Tokens describing one table"""
+    tokens = tokenize(table) * TABLE_NAME_WEIGHT
+    for column, _ in info["columns"]:
+        tokens.extend(tokenize(column))
+    tokens.extend(tokenize(info.get("comment", "")))
+    for comment in info.get("column_comments", {}).values():
+        tokens.extend(tokenize(comment))
+    for neighbour in sorted(neighbours):
+        tokens.extend(tokenize(neighbour))
+    return tokens
+
+
+class SchemaIndex:
+    """BM25 index of tables, updated incrementally from catalog details"""
+
+    def __init__(self):
+        self._index = BM25Index()
+        self._doc_hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def update(self, details: Dict[str, dict]) -> int:
+        """Sync the index with read_catalog_details() output, returns the number of tables re-indexed"""
+        ## foreign keys are indexed on both ends
+        neighbours = {table: set(info["references"]) for table, info in details.items()}
+        for table, info in details.items():
+            for referred in info["references"]:
+                if referred in neighbours:
+                    neighbours[referred].add(table)
+
+        changed = 0
+        with self._lock:
+            for table in set(self._doc_hashes) - set(details):
+                self._index.remove(table)
+                del self._doc_hashes[table]
+                changed += 1
+            for table, info in details.items():
+                tokens = table_document(table, info, neighbours[table])
+                doc_hash = hashlib.sha1(" ".join(tokens).encode()).hexdigest()
+                if self._doc_hashes.get(table) == doc_hash:
+                    continue
+                self._index.add(table, tokens)
+                self._doc_hashes[table] = doc_hash
+                changed += 1
+        return changed
+
+    def search(self, question: str, k: int = 10, allowed: Optional[Iterable[str]] = None) -> List[str]:
+        """Names of the k tables most relevant to a question"""
+        include = set(allowed) if allowed is not None else None
+        tokens = [t for t in tokenize(question) if t not in STOP_TOKENS]
+        return [table for table, _ in self._index.search(tokens, k, include)]
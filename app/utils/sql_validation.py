@@ -0,0 +1,147 @@
+"""
+Local validation of generated SQL before it reaches the database.
+Rejects multi-statements and anything that is not a read-only query, and
+resolves table and column references against the cached catalog and the
+allowed tables. Uses sqlglot when installed, otherwise only the read-only
+and multi-statement checks run (on a regex level).
+Errors are returned as "Error: ..." tool outputs, like database errors.
+"""
+import difflib
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:
+    sqlglot = None
+
+## SQLAlchemy dialect name -> sqlglot dialect
+SQLGLOT_DIALECTS = {
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "mariadb": "mysql",
+    "sqlite": "sqlite",
+    "mssql": "tsql",
+    "oracle": "oracle",
+    "snowflake": "snowflake",
+    "bigquery": "bigquery",
+    "duckdb": "duckdb",
+}
+
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|--[^\n]*|/\*.*?\*/", re.S)
+_READ_ONLY = re.compile(r"^\s*\(?\s*(select|with|values)\b", re.I)
+_WRITES = re.compile(
+    r"\b(insert\s+into|update\s+\S+\s+set|delete\s+from|merge\s+into|truncate|drop|alter|create|grant|revoke|"
+    r"attach|detach|vacuum|reindex|into\s+outfile|into\s+dumpfile|into\s+\S+\s+from)\b", re.I)
+## system catalogs are not part of the cached catalog but may be queried
+SYSTEM_TABLE_PREFIXES = ("sqlite_", "pg_")
+
+READ_ONLY_ERROR = "Error: Only read-only SELECT queries are allowed."
+MULTI_STATEMENT_ERROR = "Error: Only a single SQL statement can be executed at a time."
+
+
+## catalog as prepared by lower_catalog(): {table: {column, ...}} with lowercased names
+Catalog = Dict[str, set]
+
+
+def lower_catalog(catalog: Dict[str, List[Tuple[str, str]]]) -> Catalog:
+    return {table.lower(): {column.lower() for column, _ in columns} for table, columns in catalog.items()}
+
+
+def _suggest(name: str, candidates: Iterable[str]) -> str:
+    matches = difflib.get_close_matches(name, list(candidates), n=3, cutoff=0.6)
+    return f" Did you mean: {', '.join(matches)}?" if matches else ""
+
+
+def _regex_checks(query: str) -> Optional[str]:
+    """Read-only and multi-statement checks without a parser"""
+    stripped = _QUOTED.sub(" ", query).strip().rstrip(";")
+    if ";" in stripped:
+        return MULTI_STATEMENT_ERROR
+    if not _READ_ONLY.match(stripped) or _WRITES.search(stripped):
+        return READ_ONLY_ERROR
+    return None
+
+
+def _write_expressions():
+    names = ("Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "AlterTable", "TruncateTable",
+             "Command", "Into", "Grant", "Revoke", "Set", "Pragma", "Use", "Transaction", "Commit")
+    return tuple(getattr(exp, name) for name in names if hasattr(exp, name))
+
+
+def _check_references(statement, catalog: Optional[Catalog], allowed: Optional[set], dialect: str = "") -> Optional[str]:
+    cte_names = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+    aliases = {alias.alias.lower() for alias in statement.find_all(exp.Alias) if alias.alias}
+    aliases |= {column.name.lower() for cte in statement.find_all(exp.CTE)
+                for column in (cte.args.get("alias").columns if cte.args.get("alias") else [])}
+    ## table alias -> real table, None for derived tables and CTEs
+    sources: Dict[str, Optional[str]] = {}
+    tables = set()
+
+    for table in statement.find_all(exp.Table):
+        name = table.name
+        if not name:
+            continue
+        lowered = name.lower()
+        if lowered in cte_names and not table.db:
+            sources[table.alias_or_name.lower()] = None
+            continue
+        if allowed is not None and lowered not in allowed:
+            return (f"Error: Table '{name}' is not available. Allowed tables: {', '.join(sorted(allowed))}.")
+        if catalog is not None and not table.db and not lowered.startswith(SYSTEM_TABLE_PREFIXES):
+            if lowered not in catalog:
+                candidates = allowed if allowed is not None else catalog
+                return f"Error: Table '{name}' does not exist.{_suggest(lowered, candidates)}"
+            tables.add(lowered)
+            sources[table.alias_or_name.lower()] = lowered
+        else:
+            sources[table.alias_or_name.lower()] = None
+    for subquery in statement.find_all(exp.Subquery):
+        if subquery.alias:
+            sources[subquery.alias.lower()] = None
+
+    if catalog is None:
+        return None
+    known_columns = set().union(*(catalog[t] for t in tables)) if tables else set()
+    ## unqualified columns may come from derived tables or CTEs we do not resolve
+    resolvable = all(source is not None for source in sources.values())
+    for column in statement.find_all(exp.Column):
+        if isinstance(column.this, exp.Star):
+            continue
+        name = column.name.lower()
+        qualifier = column.table.lower()
+        if qualifier:
+            table = sources.get(qualifier)
+            if table is not None and name not in catalog[table]:
+                return (f"Error: Column '{column.name}' does not exist in table '{table}'."
+                        f"{_suggest(name, catalog[table])} Columns of {table}: {', '.join(sorted(catalog[table]))}.")
+        elif resolvable and tables and name not in known_columns and name not in aliases:
+            ## SQLite reads a double-quoted identifier that names no column as a string literal
+            if dialect == "sqlite" and column.this.quoted:
+                continue
+            return (f"Error: Column '{column.name}' does not exist in {', '.join(sorted(tables))}."
+                    f"{_suggest(name, known_columns)}")
+    return None
+
+
+def validate_sql(query: str, dialect: str = "", catalog: Optional[Catalog] = None,
+                 allowed_tables: Optional[Iterable[str]] = None) -> Optional[str]:
+    """Error message for a query that must not be executed, None when it may run"""
+    allowed = {t.lower() for t in allowed_tables} if allowed_tables is not None else None
+    if sqlglot is None:
+        return _regex_checks(query)
+    try:
+        statements = [s for s in sqlglot.parse(query, read=SQLGLOT_DIALECTS.get(dialect)) if s is not None]
+    except SqlglotError:
+        ## the parser does not know every dialect feature, leave the verdict to the database
+        return _regex_checks(query)
+    if len(statements) > 1:
+        return MULTI_STATEMENT_ERROR
+    if not statements:
+        return "Error: The query is empty."
+    statement = statements[0]
+    if not isinstance(statement, exp.Query) or statement.find(*_write_expressions()):
+        return READ_ONLY_ERROR
+    return _check_references(statement, catalog, allowed, dialect)
@@ -0,0 +1,116 @@
+"""
+Concurrency cap and timings of database tool calls.
+Tool calls of one agent step run in parallel (ToolNode fans them out), the
+per-connection limiter bounds how many of them hit the database at once.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+
+from app.utils.metrics import TOOL_SECONDS
+
+
+class ConnectionLimiter:
+    """Bounds the concurrent database work on one connection, from threads and coroutines"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.waits = 0
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(blocking=False):
+            self.waits += 1
+            self._semaphore.acquire()
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+
+    @asynccontextmanager
+    async def aslot(self):
+        if not self._semaphore.acquire(blocking=False):
+            self.waits += 1
+            ## only wait in a worker thread when the cap is actually reached
+            acquire = asyncio.ensure_future(asyncio.to_thread(self._semaphore.acquire))
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                ## the thread still gets the slot, hand it back once it does
+                acquire.add_done_callback(lambda _: self._semaphore.release())
+                raise
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "peak": self.peak, "waits": self.waits}
+
+
+_limiters: Dict[str, ConnectionLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(connection_key: str, limit: int) -> ConnectionLimiter:
+    """Shared limiter of a connection, so reconnecting does not raise the cap"""
+    with _limiters_lock:
+        limiter = _limiters.get(connection_key)
+        if limiter is None or limiter.limit != limit:
+            limiter = _limiters[connection_key] = ConnectionLimiter(limit)
+        return limiter
+
+
+def drop_limiter(connection_key: str):
+    """Forget the limiter of a database whose engines were all disposed"""
+    with _limiters_lock:
+        _limiters.pop(connection_key, None)
+
+
+class ToolTimings:
+    """Call count and wall time per tool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tools: Dict[str, dict] = {}
+
+    @contextmanager
+    def measure(self, tool: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            TOOL_SECONDS.observe(elapsed, tool=tool)
+            with self._lock:
+                entry = self._tools.setdefault(tool, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+                entry["calls"] += 1
+                entry["total_ms"] += elapsed * 1000
+                entry["max_ms"] = max(entry["max_ms"], elapsed * 1000)
+                entry["last_ms"] = elapsed * 1000
+            print(f"⏱ {tool} took {elapsed * 1000:.1f} ms")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                tool: {**entry, "mean_ms": entry["total_ms"] / entry["calls"]}
+                for tool, entry in self._tools.items()
+            }
@@ -0,0 +1,196 @@
+"""
+End-to-end latency benchmark of /api/v1/query.
+Runs offline: the agent is driven by the deterministic ScriptedChatModel
+against a copy of the bundled employee.db, in a scratch directory so the
+users/history database of the checkout is not touched.
+
+    python benchmarks/bench_query.py --requests 200 --model-latency-ms 50
+    python benchmarks/bench_query.py --json > bench_output.txt
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+## question keyword -> SQL the scripted model answers with
+SCENARIO = {
+    "how many customers": "SELECT COUNT(*) FROM customers",
+    "average salary": "SELECT AVG(salary) FROM employees",
+    "total amount per customer": (
+        "SELECT c.first_name, c.last_name, SUM(o.amount) FROM customers c "
+        "JOIN orders o ON o.customer_id = c.customer_id GROUP BY c.customer_id ORDER BY 3 DESC"
+    ),
+    "latest orders": "SELECT * FROM orders ORDER BY order_date DESC LIMIT 10",
+    "highest paid employees": "SELECT first_name, last_name, salary FROM employees ORDER BY salary DESC LIMIT 5",
+}
+QUESTIONS = [
+    "How many customers do we have?",
+    "What is the average salary of employees?",
+    "Show the total amount per customer from orders",
+    "List the latest orders",
+    "Who are the highest paid employees?",
+]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_timing_handler(tool_names):
+    """Callback handler summing graph steps, model time and agent tool time over all runs"""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TimingHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.started = {}
+            self.steps = 0
+            self.model_calls = 0
+            self.tool_calls = 0
+            self.model_seconds = 0.0
+            self.tool_seconds = 0.0
+
+        def on_chain_start(self, serialized, inputs, *, run_id, tags=None, **kwargs):
+            if any(tag.startswith("graph:step:") for tag in tags or []):
+                with self.lock:
+                    self.steps += 1
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self.started[run_id] = time.perf_counter()
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            start = self.started.pop(run_id, None)
+            if start is not None:
+                with self.lock:
+                    self.model_calls += 1
+                    self.model_seconds += time.perf_counter() - start
+
+        def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+            ## the agent tools call the toolkit tools internally, count only the outer ones
+            if (serialized or {}).get("name", kwargs.get("name")) in tool_names:
+                self.started[run_id] = time.perf_counter()
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            start = self.started.pop(run_id, None)
+            if start is not None:
+                with self.lock:
+                    self.tool_calls += 1
+                    self.tool_seconds += time.perf_counter() - start
+
+        on_tool_error = on_tool_end
+
+    return TimingHandler()
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="talk2db-bench-")
+    database = os.path.join(workdir, "employee.db")
+    shutil.copy(args.database, database)
+    ## the app keeps users.db (and checkpoints.db) relative to the working directory
+    os.chdir(workdir)
+    os.environ["LLM_PROVIDER"] = "scripted"
+    os.environ.setdefault("SCHEMA_FAST_PATH", "true" if args.fast_path else "false")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.agents.scripted_llm import ScriptedChatModel
+    from app.agents.sql_agent import SQLAgent
+    from app.services.agent_sessions import agent_sessions
+
+    agent_sessions.factory = lambda: SQLAgent(
+        llm=ScriptedChatModel(queries=SCENARIO, latency_seconds=args.model_latency_ms / 1000))
+    client = TestClient(app)
+    response = client.post("/api/v1/setup-connection",
+                           json={"connection_string": f"sqlite:///{database}", "username": "benchmark"})
+    response.raise_for_status()
+    sql_agent = agent_sessions.get("benchmark")
+
+    def ask(i):
+        payload = {"query": QUESTIONS[i % len(QUESTIONS)], "username": "benchmark", "use_cache": args.use_cache}
+        start = time.perf_counter()
+        reply = client.post("/api/v1/query", json=payload)
+        return time.perf_counter() - start, reply.status_code == 200
+
+    for i in range(args.warmup):
+        ask(i)
+
+    timing = make_timing_handler({tool.name for tool in sql_agent.tools_list})
+    sql_agent.callbacks.append(timing)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(ask, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    sql_agent.callbacks.remove(timing)
+
+    latencies = [latency * 1000 for latency, _ in outcomes]
+    total_seconds = sum(latency for latency, _ in outcomes)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "throughput_rps": args.requests / elapsed,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies),
+        },
+        "graph_steps_per_request": timing.steps / args.requests,
+        "model_calls_per_request": timing.model_calls / args.requests,
+        "tool_calls_per_request": timing.tool_calls / args.requests,
+        "model_ms_per_request": timing.model_seconds * 1000 / args.requests,
+        "tool_ms_per_request": timing.tool_seconds * 1000 / args.requests,
+        ## everything else: graph overhead, checkpointing, prompt building, HTTP
+        "other_ms_per_request": (total_seconds - timing.model_seconds - timing.tool_seconds) * 1000 / args.requests,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark of /api/v1/query")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="simulated latency of each model call")
+    parser.add_argument("--use-cache", action="store_true", help="let repeated questions hit the answer cache")
+    parser.add_argument("--fast-path", action="store_true", help="enable the schema-in-prompt fast path")
+    parser.add_argument("--database", default=os.path.join(REPO_ROOT, "employee.db"))
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.json:
+        ## keep the app's progress prints out of the JSON report
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run(args)
+    else:
+        report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    latency = report.pop("latency_ms")
+    print(f"\nlatency ms   mean {latency['mean']:.1f}  p50 {latency['p50']:.1f}  "
+          f"p95 {latency['p95']:.1f}  p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    for name, value in report.items():
+        print(f"{name:<26} {value:.2f}" if isinstance(value, float) else f"{name:<26} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+
+def pytest_configure(config):
+    ## the app creates users.db, checkpoints and schema snapshots in the working directory
+    os.chdir(tempfile.mkdtemp(prefix="talk2db-tests-"))
+
+
+@pytest.fixture
+def employee_db(tmp_path):
+    """URL of a small SQLite database with customers, employees and orders"""
+    path = tmp_path / "employee.db"
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, city TEXT);
+        CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, salary REAL);
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers (id),
+                             employee_id INTEGER REFERENCES employees (id), total REAL);
+        INSERT INTO customers (name, city) VALUES ('Ann', 'Pune'), ('Bob', 'Delhi');
+        INSERT INTO employees (name, salary) VALUES ('Sunny', 50000), ('Arhun', 60000), ('Mia', 55000);
+        INSERT INTO orders (customer_id, employee_id, total) VALUES (1, 1, 10.5), (2, 2, 99.0);
+    """)
+    connection.close()
+    return f"sqlite:///{path}"
+
+
+@pytest.fixture
+def offline_agent(monkeypatch):
+    """SQLAgent factory on the scripted offline model, without background schema warm-up"""
+    monkeypatch.setenv("SCHEMA_WARMUP", "false")
+    monkeypatch.setenv("SCHEMA_SNAPSHOTS", "false")
+    from app.agents.scripted_llm import ScriptedChatModel
+    from app.agents.sql_agent import SQLAgent
+    return lambda: SQLAgent(llm=ScriptedChatModel())
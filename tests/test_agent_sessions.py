@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from app.services.agent_sessions import AgentSessionRegistry
+from app.services.answer_cache import answer_cache
+from app.utils.database_connection import engine_registry
+from app.utils.result_cache import result_cache
+
+
+@pytest.fixture
+def sessions(offline_agent):
+    return AgentSessionRegistry(factory=offline_agent)
+
+
+def engine_refs(engine):
+    return next(entry.refs for entry in engine_registry._entries.values() if entry.engine is engine)
+
+
+def test_sessions_are_per_user(sessions, employee_db):
+    alice = sessions.connect("alice", employee_db)
+    bob = sessions.connect("bob", employee_db)
+    assert alice is not bob
+    assert sessions.get("alice") is alice and sessions.get("bob") is bob
+    assert sessions.get("carol") is None
+    ## reconnecting with the same options keeps the session, the engine is shared by both users
+    assert sessions.connect("alice", employee_db) is alice
+    assert alice.db._engine is bob.db._engine
+    assert (sessions.created, sessions.reused) == (2, 1)
+
+
+def test_sessions_on_one_url_with_other_schema_share_no_cache(sessions, employee_db):
+    alice = sessions.connect("alice", employee_db)
+    bob = sessions.connect("bob", employee_db, schema="main")
+    assert alice.connection_key != bob.connection_key
+
+    ## schema cache
+    assert alice.db_tools.schema_cache is not bob.db_tools.schema_cache
+    alice.db_tools.get_schema(["employees"])
+    assert bob.db_tools.schema_cache.stats()["entries"] == 0
+    ## the per-database concurrency cap is still shared
+    assert alice.db_tools.limiter is bob.db_tools.limiter
+
+    ## result cache
+    query = "SELECT COUNT(*) FROM employees"
+    alice.db_tools.execute_query(query)
+    hits = result_cache.hits
+    bob.db_tools.execute_query(query)
+    assert result_cache.hits == hits
+    alice.db_tools.execute_query(query)
+    assert result_cache.hits == hits + 1
+
+    ## answer cache and coalescing
+    question = "how many employees are there"
+    assert (answer_cache.make_key(question, alice.connection_key, alice.schema_fingerprint())
+            != answer_cache.make_key(question, bob.connection_key, bob.schema_fingerprint()))
+    assert alice.coalescing_key(question) != bob.coalescing_key(question)
+
+
+def test_allowed_tables_split_answers_and_coalescing(sessions, employee_db):
+    alice = sessions.connect("alice", employee_db)
+    bob = sessions.connect("bob", employee_db, allowed_tables=["employees"])
+    question = "how many employees are there"
+    assert alice.coalescing_key(question) != bob.coalescing_key(question)
+    assert (answer_cache.make_key(question, alice.connection_key, alice.schema_fingerprint(), None)
+            != answer_cache.make_key(question, bob.connection_key, bob.schema_fingerprint(), ["employees"]))
+
+
+def test_least_recently_used_session_is_evicted_over_the_count(offline_agent, employee_db):
+    sessions = AgentSessionRegistry(max_sessions=2, factory=offline_agent)
+    alice = sessions.connect("alice", employee_db)
+    sessions.connect("bob", employee_db)
+    refs = engine_refs(alice.db._engine)
+    sessions.get("alice")
+    sessions.connect("carol", employee_db)
+    assert sessions.get("bob") is None
+    assert sessions.get("alice") is alice and sessions.get("carol") is not None
+    assert sessions.evictions == 1
+    ## the evicted session released its engine, carol holds one instead
+    assert engine_refs(alice.db._engine) == refs
+
+
+def test_idle_sessions_are_swept(offline_agent, employee_db):
+    sessions = AgentSessionRegistry(idle_seconds=0.05, factory=offline_agent)
+    sessions.connect("alice", employee_db)
+    time.sleep(0.1)
+    assert sessions.stats()["sessions"] == []
+    assert sessions.get("alice") is None
+
+
+def test_memory_budget_keeps_the_new_session(offline_agent, employee_db):
+    sessions = AgentSessionRegistry(max_bytes=1, factory=offline_agent)
+    sessions.connect("alice", employee_db)
+    bob = sessions.connect("bob", employee_db)
+    assert sessions.get("alice") is None
+    assert sessions.get("bob") is bob
+    assert [s["user"] for s in sessions.stats()["sessions"]] == ["bob"]
+
+
+def test_reconnect_compares_the_current_table_scope(sessions, employee_db):
+    alice = sessions.connect("alice", employee_db, allowed_tables=["employees"])
+    ## the scope changed after connecting, e.g. through POST /schema/allowed-tables
+    alice.set_allowed_tables(["employees", "customers"])
+    assert sessions.connect("alice", employee_db, allowed_tables=["employees", "customers"]) is alice
+
+    scoped = sessions.connect("alice", employee_db, allowed_tables=["employees"])
+    assert scoped is not alice
+    assert scoped.allowed_tables == ["employees"]
@@ -0,0 +1,21 @@
+def test_get_schema_rejects_tables_outside_the_scope(employee_db, offline_agent):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db, allowed_tables=["employees", "orders"])
+
+    assert agent.db_tools.get_schema(["customers"]) == (
+        "Error: Table 'customers' is not available. Allowed tables: employees, orders.")
+    assert "CREATE TABLE employees" in agent.db_tools.get_schema(["employees"])
+    assert "customers" not in agent.db._metadata.tables
+
+
+def test_schema_index_only_holds_allowed_tables(employee_db, offline_agent):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db, allowed_tables=["employees"])
+    assert len(agent.schema_index) == 1
+    assert agent.schema_index.search("city") == []
+    ## the validation catalog stays complete, it tells hidden tables apart from missing ones
+    assert "customers" in agent.catalog
+
+    agent.set_allowed_tables(["employees", "customers"])
+    assert agent.schema_index.search("city") == ["customers"]
+    assert "CREATE TABLE customers" in agent.db_tools.get_schema(["customers"])
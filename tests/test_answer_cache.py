@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from app.api.v1.endpoints.sql_query import SQLQueryRequest, answer_cache_key
+from app.services import answer_cache as answer_cache_module
+from app.services.answer_cache import AnswerCache, normalize_question
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_normalize_question_folds_case_punctuation_and_synonyms():
+    assert normalize_question("How many   Employees?") == normalize_question("number of employees")
+    assert normalize_question("Show me the top-10 customers!") == "list the top 10 customers"
+
+
+def test_normalize_question_keeps_operators_and_signs():
+    assert normalize_question("employees with salary > 60000") == "employees with salary gt 60000"
+    assert normalize_question("employees with salary > 60000") != normalize_question("employees with salary < 60000")
+    assert normalize_question("salary >= 60000") != normalize_question("salary <= 60000")
+    assert normalize_question("status != 'open'") != normalize_question("status = 'open'")
+    assert normalize_question("balance below -100") != normalize_question("balance below 100")
+    assert normalize_question("price over 1.5") != normalize_question("price over 15")
+
+
+def test_make_key_separates_connections_and_scopes():
+    key = AnswerCache.make_key("how many orders", "db", "fp")
+    assert key == AnswerCache.make_key("How many orders?", "db", "fp")
+    assert key != AnswerCache.make_key("how many orders", "other", "fp")
+    assert key != AnswerCache.make_key("how many orders", "db", "fp2")
+    assert key != AnswerCache.make_key("how many orders", "db", "fp", allowed_tables=["orders"])
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(answer_cache_module, "time", clock)
+    cache = AnswerCache(max_entries=4, ttl_seconds=60)
+    cache.set("key", "42 orders", "SELECT COUNT(*) FROM orders")
+
+    clock.now += 59
+    assert cache.get("key").result == "42 orders"
+    clock.now += 2
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") is not None
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a").result == "1"
+    assert cache.get("c").result == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_answer_cache_key_respects_bypass_flag():
+    agent = SimpleNamespace(db=object(), connection_key="db", schema_fingerprint=lambda: "fp",
+                            allowed_tables=None)
+
+    key = answer_cache_key(agent, SQLQueryRequest(query="how many orders"))
+    assert key == AnswerCache.make_key("how many orders", "db", "fp")
+    assert answer_cache_key(agent, SQLQueryRequest(query="how many orders", use_cache=False)) is None
+    assert answer_cache_key(agent, SQLQueryRequest(query="how many orders", thread_id="t1")) is None
+    assert answer_cache_key(SimpleNamespace(db=None), SQLQueryRequest(query="how many orders")) is None
@@ -0,0 +1,121 @@
+import itertools
+import sqlite3
+import time
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from app.services.checkpointer import BoundedMemorySaver, SQLiteCheckpointSaver
+
+## increasing channel versions, put() does not read the thread back (that would flush a SQLite saver)
+VERSIONS = itertools.count()
+
+
+def put(saver, thread_id, payload="x"):
+    """Store a checkpoint whose only channel holds the payload"""
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    version = saver.get_next_version(next(VERSIONS), None)
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": payload}
+    checkpoint["channel_versions"] = {"messages": version}
+    return saver.put(config, checkpoint, {"source": "loop", "step": 0}, {"messages": version})
+
+
+def latest(saver, thread_id):
+    found = saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+    return found.checkpoint["channel_values"]["messages"] if found else None
+
+
+def test_keeps_only_latest_checkpoints():
+    saver = BoundedMemorySaver(keep_checkpoints=2)
+    for i in range(5):
+        put(saver, "t", f"turn {i}")
+    assert len(saver.storage["t"][""]) == 2
+    assert len([key for key in saver.blobs if key[0] == "t"]) == 2
+    assert latest(saver, "t") == "turn 4"
+
+
+def test_idle_threads_expire():
+    saver = BoundedMemorySaver(ttl_seconds=0.05)
+    put(saver, "t")
+    time.sleep(0.1)
+    assert latest(saver, "t") is None
+    assert saver.expirations == 1
+    assert saver.stats()["threads"] == 0
+    assert saver.total_bytes == 0
+
+
+def test_least_recently_used_thread_is_evicted():
+    saver = BoundedMemorySaver(max_threads=2)
+    put(saver, "a")
+    put(saver, "b")
+    latest(saver, "a")
+    put(saver, "c")
+    assert set(saver._threads) == {"a", "c"}
+    assert latest(saver, "b") is None
+    assert saver.evictions == 1
+
+
+def test_byte_budget_evicts_other_threads():
+    saver = BoundedMemorySaver(max_bytes=20000)
+    for thread_id in "abcdef":
+        put(saver, thread_id, "x" * 5000)
+        assert saver.total_bytes <= saver.max_bytes
+    assert "f" in saver._threads
+    assert saver.evictions > 0
+    ## the current thread is kept even when it alone is over the budget
+    put(saver, "g", "x" * 50000)
+    assert list(saver._threads) == ["g"]
+
+
+def persisted(path, table="checkpoints"):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_sqlite_flusher_writes_in_batches(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    saver = SQLiteCheckpointSaver(path=path, flush_interval=0.2)
+    for i in range(20):
+        put(saver, f"t{i}")
+    ## nothing is written on the request path, the flusher thread commits the queue
+    assert wait_for(lambda: persisted(path) == 20)
+    assert persisted(path, "threads") == 20
+    assert 1 <= saver.flushes < 20
+    assert saver.stats()["pending_writes"] == 0
+
+
+def test_sqlite_reloads_evicted_threads(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    saver = SQLiteCheckpointSaver(path=path, max_threads=1)
+    put(saver, "a", "first")
+    put(saver, "a", "second")
+    put(saver, "b", "other")
+    assert list(saver._threads) == ["b"]
+    assert latest(saver, "a") == "second"
+    ## a fresh process reads the same store
+    saver.flush()
+    assert latest(SQLiteCheckpointSaver(path=path), "a") == "second"
+
+
+def test_sqlite_deleted_thread_is_removed_from_disk(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    saver = SQLiteCheckpointSaver(path=path)
+    put(saver, "a")
+    saver.flush()
+    assert persisted(path) == 1
+    saver.delete_thread("a")
+    saver.flush()
+    assert persisted(path) == 0
+    assert latest(saver, "a") is None
@@ -0,0 +1,53 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.utils import database_connection, schema_cache, tool_execution
+from app.utils.database_connection import EngineRegistry, connection_key
+
+
+def test_engines_are_shared_per_url_and_schema(tmp_path):
+    registry = EngineRegistry()
+    url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    first = registry.acquire(url)
+    assert registry.acquire(url) is first
+    assert registry.acquire(url, "main") is not first
+    assert (registry.created, registry.reused) == (2, 1)
+
+
+def test_schema_is_applied_on_sync_and_async_connections(tmp_path, monkeypatch):
+    ## SQLite has no default schema setting, a per-connection pragma stands in for it
+    monkeypatch.setitem(database_connection.SCHEMA_STATEMENTS, "sqlite", "PRAGMA {}.cache_size = 1234")
+    registry = EngineRegistry()
+    url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine = registry.acquire(url, "main")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == 1234
+    with registry.acquire(url).connect() as connection:
+        assert connection.execute(text("PRAGMA cache_size")).scalar() != 1234
+
+    async_engine = registry.async_engine(engine)
+
+    async def cache_size():
+        async with async_engine.connect() as connection:
+            return (await connection.execute(text("PRAGMA cache_size"))).scalar()
+    assert asyncio.run(cache_size()) == 1234
+
+
+def test_disposing_the_last_engine_drops_the_connection_caches(tmp_path):
+    registry = EngineRegistry(idle_seconds=0)
+    url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine, other_schema = registry.acquire(url), registry.acquire(url, "main")
+    schema_cache.schema_cache_for(connection_key(engine))
+    schema_cache.schema_cache_for(connection_key(other_schema, "main"))
+    tool_execution.limiter_for(connection_key(engine), 4)
+
+    registry.release(engine)
+    assert connection_key(engine) not in schema_cache._caches
+    assert connection_key(other_schema, "main") in schema_cache._caches
+    ## the database still has an engine, its concurrency cap stays
+    assert connection_key(engine) in tool_execution._limiters
+
+    registry.release(other_schema)
+    assert connection_key(other_schema, "main") not in schema_cache._caches
+    assert connection_key(engine) not in tool_execution._limiters
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from app.api.v1 import auth
+from app.services.few_shot import FewShotIndex
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    """Empty query history in a temporary users database"""
+    path = tmp_path / "users.db"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE query_history (id INTEGER PRIMARY KEY, connection_key TEXT, "
+                       "natural_query TEXT, generated_sql TEXT)")
+    connection.commit()
+    connection.close()
+    monkeypatch.setattr(auth, "get_db", lambda: sqlite3.connect(path))
+
+
+def test_add_evicts_oldest_examples(history):
+    index = FewShotIndex(max_examples=3)
+    assert index.search("db", "how many orders") == []
+
+    for table in ["customers", "orders", "employees", "products", "invoices"]:
+        index.add("db", f"how many {table} are there", f"SELECT COUNT(*) FROM {table}")
+
+    assert index.stats()["examples"] == 3
+    assert index.stats()["evictions"] == 2
+    questions = [question for question, _ in index.search("db", "how many customers are there", k=5)]
+    assert sorted(questions) == ["how many employees are there", "how many invoices are there",
+                                 "how many products are there"]
+    assert index.search("db", "how many invoices are there")[0] == (
+        "how many invoices are there", "SELECT COUNT(*) FROM invoices")
+    assert len(index._indexes["db"]) == 3
+
+
+def test_repeated_question_counts_as_newest(history):
+    index = FewShotIndex(max_examples=2)
+    index.search("db", "warm up")
+    index.add("db", "how many orders are there", "SELECT COUNT(*) FROM orders")
+    index.add("db", "how many customers are there", "SELECT COUNT(*) FROM customers")
+    index.add("db", "how many orders are there", "SELECT COUNT(id) FROM orders")
+    index.add("db", "how many employees are there", "SELECT COUNT(*) FROM employees")
+
+    examples = index.search("db", "how many orders are there", k=5)
+    assert examples[0] == ("how many orders are there", "SELECT COUNT(id) FROM orders")
+    assert "how many customers are there" not in [question for question, _ in examples]
@@ -0,0 +1,66 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.utils.message_compaction import compact_messages, estimate_tokens
+
+
+def exchange(n, schema_size=200, result_size=200, answered=True):
+    """Question n with list_tables, get_schema and execute_query calls and, when answered, the answer"""
+    messages = [
+        HumanMessage(content=f"question {n}"),
+        AIMessage(content="", tool_calls=[{"name": "list_tables", "args": {}, "id": f"list-{n}"}]),
+        ToolMessage(content="customers, employees, orders", tool_call_id=f"list-{n}", name="list_tables"),
+        AIMessage(content="", tool_calls=[{"name": "get_schema", "args": {"table_name": ["orders"]}, "id": f"schema-{n}"}]),
+        ToolMessage(content="CREATE TABLE orders " + "x" * schema_size, tool_call_id=f"schema-{n}", name="get_schema"),
+        AIMessage(content="", tool_calls=[{"name": "execute_query", "args": {"query": f"SELECT {n}"}, "id": f"query-{n}"}]),
+        ToolMessage(content="r" * result_size, tool_call_id=f"query-{n}", name="execute_query"),
+    ]
+    if answered:
+        messages.append(AIMessage(content=f"answer {n}"))
+    return messages
+
+
+def assert_tool_results_follow_their_calls(messages):
+    open_calls = set()
+    for message in messages:
+        if isinstance(message, AIMessage):
+            open_calls = {call["id"] for call in message.tool_calls}
+        elif isinstance(message, ToolMessage):
+            assert message.tool_call_id in open_calls
+        else:
+            open_calls = set()
+
+
+def test_earlier_exchanges_keep_question_sql_and_answer():
+    messages = exchange(1) + exchange(2) + exchange(3, answered=False)
+    compacted, removed = compact_messages(messages, keep_exchanges=1, max_tokens=100000)
+
+    first = compacted[:4]
+    assert [type(m).__name__ for m in first] == ["HumanMessage", "AIMessage", "ToolMessage", "AIMessage"]
+    assert first[1].tool_calls[0]["args"] == {"query": "SELECT 1"}
+    assert first[3].content == "answer 1"
+    ## the current exchange is untouched
+    assert compacted[-7:] == messages[-7:]
+    assert removed > 0
+    assert_tool_results_follow_their_calls(compacted)
+
+
+def test_whole_old_exchanges_are_dropped_to_fit_the_budget():
+    messages = exchange(1) + exchange(2) + exchange(3, answered=False)
+    budget = sum(estimate_tokens(m) for m in exchange(3, answered=False)) + 5
+    compacted, _ = compact_messages(messages, keep_exchanges=3, max_tokens=budget)
+
+    assert [m.content for m in compacted if isinstance(m, HumanMessage)] == ["question 3"]
+    assert compacted == exchange(3, answered=False)
+    assert_tool_results_follow_their_calls(compacted)
+
+
+def test_trailing_tool_results_of_the_current_turn_are_kept_whole():
+    messages = exchange(1) + exchange(2, schema_size=5000, result_size=5000, answered=False)
+    compacted, _ = compact_messages(messages, keep_exchanges=3, max_tokens=200, tool_output_max_chars=100)
+
+    assert compacted[0].content == "question 2"
+    ## the schema dump earlier in the turn is truncated, the result the model answers from is not
+    schema = next(m for m in compacted if isinstance(m, ToolMessage) and m.name == "get_schema")
+    assert "characters elided" in schema.content
+    assert compacted[-1].content == "r" * 5000
+    assert_tool_results_follow_their_calls(compacted)
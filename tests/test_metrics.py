@@ -0,0 +1,77 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils import metrics
+from app.utils.metrics import MetricsMiddleware, Registry
+
+
+def test_counter_and_gauge_render_in_text_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", labels=("status",))
+    in_flight = registry.gauge("in_flight", "In flight")
+    requests.inc(status="ok")
+    requests.inc(2, status="ok")
+    requests.inc(status="error")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    registry.collector(lambda: [("cache_entries", "gauge", "Entries", [({"cache": "answers"}, 3), ({"cache": "off"}, None)])])
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{status="ok"} 3',
+        'requests_total{status="error"} 1',
+        "# HELP in_flight In flight",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+        "# HELP cache_entries Entries",
+        "# TYPE cache_entries gauge",
+        'cache_entries{cache="answers"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(5, 1))
+    for value in (0.5, 1, 3, 5, 10):
+        latency.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="5"} 4',
+        'latency_seconds_bucket{le="+Inf"} 5',
+        "latency_seconds_sum 19.5",
+        "latency_seconds_count 5",
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors", labels=("message",))
+    errors.inc(message='bad "quote" \\ and\nnewline')
+    assert registry.render().splitlines()[-1] == 'errors_total{message="bad \\"quote\\" \\\\ and\\nnewline"} 1'
+
+
+def test_route_label_includes_the_router_prefix(monkeypatch):
+    histogram = metrics.Histogram("http_seconds", "HTTP", labels=("method", "route", "status"))
+    monkeypatch.setattr(metrics, "HTTP_REQUEST_SECONDS", histogram)
+    router = APIRouter()
+
+    @router.get("/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+    client.get("/api/v1/items/1")
+    client.get("/api/v1/items/2")
+    client.get("/missing")
+
+    counts = [line for line in histogram.render() if line.startswith("http_seconds_count")]
+    assert counts == [
+        'http_seconds_count{method="GET",route="/api/v1/items/{item_id}",status="200"} 2',
+        'http_seconds_count{method="GET",route="unmatched",status="404"} 1',
+    ]
@@ -0,0 +1,71 @@
+import uuid
+
+from langchain_core.messages import ToolMessage
+
+from app.agents.model_router import ModelRouter
+from app.agents.scripted_llm import ScriptedChatModel
+
+TABLES = ["customers", "employees", "orders"]
+
+
+def executed_queries(agent, question):
+    config = {"configurable": {"thread_id": f"routing-{uuid.uuid4().hex}"}}
+    agent.execute_query(question, config)
+    messages = agent.app.get_state(config).values["messages"]
+    return [str(m.content) for m in messages if isinstance(m, ToolMessage) and m.name == "execute_query"]
+
+
+def routed_agent(employee_db, monkeypatch, small_sql, large_sql):
+    monkeypatch.setenv("SCHEMA_WARMUP", "false")
+    monkeypatch.setenv("SCHEMA_SNAPSHOTS", "false")
+    from app.agents.sql_agent import SQLAgent
+    agent = SQLAgent(llm=ScriptedChatModel(queries={"employees": large_sql}),
+                     small_llm=ScriptedChatModel(queries={"employees": small_sql}))
+    agent.setup_database_connection(employee_db)
+    return agent
+
+
+def test_simple_questions_go_to_the_small_model():
+    router = ModelRouter(threshold=3)
+    assert router.classify("list the employees", TABLES).tier == "small"
+    decision = router.classify("compare the average order total per employee with their salary across customers",
+                               TABLES)
+    assert decision.tier == "large"
+    assert decision.features["join_hints"] >= 2 and decision.features["table_hits"] == 3
+    ## no table named scores one point, the model has to explore the schema
+    assert router.classify("what is in here", TABLES).score == 1
+    assert router.stats()["decisions"] == {"small": 2, "large": 1}
+
+
+def test_failed_small_model_query_escalates(employee_db, monkeypatch):
+    agent = routed_agent(employee_db, monkeypatch, "SELECT nme FROM employees", "SELECT name FROM employees")
+    results = executed_queries(agent, "list the employees")
+
+    assert results[0].startswith("Error")
+    assert results[-1] == "[('Sunny',), ('Arhun',), ('Mia',)]"
+    stats = agent.model_router.stats()
+    assert stats["decisions"]["small"] == 1 and stats["escalations"] == 1
+    assert stats["outcomes"]["escalated"] == 1
+    assert stats["recent"][-1]["escalated"] and stats["recent"][-1]["answered"]
+
+
+def test_empty_small_model_result_escalates(employee_db, monkeypatch):
+    agent = routed_agent(employee_db, monkeypatch, "SELECT name FROM employees WHERE salary > 1000000",
+                         "SELECT name FROM employees")
+    results = executed_queries(agent, "list the employees")
+
+    assert results == [""]
+    assert agent.model_router.stats()["escalations"] == 1
+    assert agent.model_router.stats()["recent"][-1]["tier"] == "large"
+
+
+def test_routing_is_off_without_a_small_model(employee_db, offline_agent):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db)
+    assert agent.small_llm is None
+    results = executed_queries(agent, "list the employees")
+
+    ## the default scripted query counts the rows of the table
+    assert results == ["[(3,)]"]
+    assert agent.model_router.stats()["decisions"] == {"small": 0, "large": 0}
+    assert agent.model_router.stats()["recent"] == []
@@ -0,0 +1,107 @@
+import asyncio
+import uuid
+
+from app.services.result_sets import result_sets
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    runs = []
+
+    async def call():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", call) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert runs == [1]
+    assert [value for value, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 4}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def main():
+        return await asyncio.gather(flight.do("a", call), flight.do("b", call))
+
+    (first, _), (second, _) = asyncio.run(main())
+    assert first is not second
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(flight.do("key", call), flight.do("key", call), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("answer", True)
+
+
+def test_coalescing_key_keeps_operators_and_scope(employee_db, offline_agent):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db)
+
+    key = agent.coalescing_key("employees with salary > 55000")
+    assert key == agent.coalescing_key("Employees with salary > 55000?")
+    assert key != agent.coalescing_key("employees with salary < 55000")
+
+    agent.set_allowed_tables(["employees"])
+    assert key != agent.coalescing_key("employees with salary > 55000")
+
+
+def test_follower_gets_its_own_copy_of_the_thread(employee_db, offline_agent):
+    agent = offline_agent()
+    agent.llm.latency_seconds = 0.05
+    agent.setup_database_connection(employee_db)
+    leader, follower = f"leader-{uuid.uuid4().hex}", f"follower-{uuid.uuid4().hex}"
+
+    async def main():
+        return await asyncio.gather(
+            agent.aexecute_query_coalesced("how many employees", leader),
+            agent.aexecute_query_coalesced("How many employees?", follower),
+        )
+
+    (leader_answer, leader_shared), (follower_answer, follower_shared) = asyncio.run(main())
+    assert (leader_shared, follower_shared) == (False, True)
+    assert follower_answer == leader_answer
+
+    async def messages(thread_id):
+        state = await agent.app.aget_state({"configurable": {"thread_id": thread_id}})
+        return [(type(m).__name__, m.content) for m in state.values["messages"]]
+
+    assert asyncio.run(messages(follower)) == asyncio.run(messages(leader))
+    assert result_sets.get(follower) is not None
@@ -0,0 +1,75 @@
+from app.utils.query_plan import CostGuard, PlanEstimate, estimate_plan, result_shape
+
+## SQLite EXPLAIN QUERY PLAN of a full scan over a table ANALYZE counted 50,000 rows
+SQLITE_SCAN = [{"id": 2, "parent": 0, "notused": 0, "detail": "SCAN orders"}]
+TABLE_ROWS = {"orders": 50000}
+
+
+def sqlite_estimate():
+    return estimate_plan(SQLITE_SCAN, "sqlite", TABLE_ROWS)
+
+
+def test_sqlite_estimate_counts_scanned_rows():
+    estimate = sqlite_estimate()
+    assert (estimate.rows, estimate.rows_scanned, estimate.full_scans) == (50000, True, ["orders"])
+    assert estimate.describe() == "50,000 rows scanned, full scan of orders"
+
+
+def test_result_shape():
+    assert result_shape("SELECT COUNT(*) FROM orders", "sqlite") == (1, True)
+    assert result_shape("SELECT status, SUM(total) FROM orders GROUP BY status", "sqlite") == (None, True)
+    assert result_shape("SELECT * FROM orders LIMIT 10", "sqlite") == (10, False)
+    assert result_shape("SELECT id, COUNT(*) OVER () FROM orders", "sqlite") == (None, False)
+    assert result_shape("SELECT * FROM orders", "sqlite") == (None, False)
+
+
+def test_refuse_lets_aggregates_through_on_scanned_estimates():
+    guard = CostGuard(max_rows=1000, action="refuse")
+    for query in ["SELECT COUNT(*) FROM orders", "SELECT status, COUNT(*) FROM orders GROUP BY status",
+                  "SELECT * FROM orders LIMIT 100"]:
+        assert guard.check(query, "sqlite", sqlite_estimate()) == (query, "")
+    query, message = guard.check("SELECT * FROM orders", "sqlite", sqlite_estimate())
+    assert query is None and message.startswith("Error: Query refused before execution")
+
+
+def test_limit_does_not_note_aggregates():
+    guard = CostGuard(max_rows=1000, action="limit")
+    assert guard.check("SELECT COUNT(*) FROM orders", "sqlite", sqlite_estimate()) == ("SELECT COUNT(*) FROM orders", "")
+    query, note = guard.check("SELECT * FROM orders", "sqlite", sqlite_estimate())
+    assert query == "SELECT * FROM orders LIMIT 1000"
+    assert note.startswith("Note: the estimate (50,000 rows scanned, full scan of orders)")
+
+
+def test_grouped_output_estimate_is_still_checked():
+    ## PostgreSQL estimates the rows a plan returns, a large GROUP BY output is limited
+    guard = CostGuard(max_rows=1000, action="limit")
+    query, note = guard.check("SELECT customer_id, COUNT(*) FROM orders GROUP BY customer_id", "postgresql",
+                              PlanEstimate(rows=40000))
+    assert query.endswith("LIMIT 1000") and note
+
+
+def test_sqlite_index_scans_are_not_full_scans():
+    plan = [{"detail": "SCAN employees USING COVERING INDEX idx_employees_department"},
+            {"detail": "SEARCH orders USING INDEX idx_orders_employee (employee_id=?)"},
+            {"detail": "SCAN customers"}]
+    assert estimate_plan(plan, "sqlite", {"employees": 10, "customers": 5}).full_scans == ["customers"]
+
+
+def test_guarded_results_are_not_shared_with_unguarded_sessions(employee_db, offline_agent):
+    import sqlite3
+    from sqlalchemy.engine import make_url
+    connection = sqlite3.connect(make_url(employee_db).database)
+    connection.execute("ANALYZE")
+    connection.commit()
+    connection.close()
+
+    guarded, unguarded = offline_agent(), offline_agent()
+    guarded.setup_database_connection(employee_db, cost_guard=CostGuard(max_rows=1, action="limit", limit_rows=1))
+    unguarded.setup_database_connection(employee_db, cost_guard=CostGuard())
+    query = "SELECT name FROM employees"
+
+    limited = guarded.db_tools.execute_query(query)
+    assert "only the first 1 rows are returned" in limited and limited.endswith("[('Sunny',)]")
+    ## the same statement on the same connection, the rewritten result must not be reused
+    assert unguarded.db_tools.execute_query(query) == "[('Sunny',), ('Arhun',), ('Mia',)]"
+    assert guarded.db_tools.execute_query(query) == limited
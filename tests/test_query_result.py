@@ -0,0 +1,78 @@
+import decimal
+
+from app.utils.query_result import ResultLimits, RunningStats, collect_result
+
+
+class FakeResult:
+    """Cursor over generated rows that records how many were fetched"""
+
+    returns_rows = True
+
+    def __init__(self, total):
+        self.total = total
+        self.fetched = 0
+
+    def keys(self):
+        return ["id", "name"]
+
+    def fetchmany(self, size):
+        batch = [(i, f"name {i}") for i in range(self.fetched, min(self.fetched + size, self.total))]
+        self.fetched += len(batch)
+        return batch
+
+    def close(self):
+        pass
+
+
+def test_small_result_is_complete():
+    cursor = FakeResult(50)
+    result = collect_result(cursor, ResultLimits(summary=False))
+    assert (len(result.rows), result.total_rows, result.total_exact, result.truncated) == (50, 50, True, False)
+
+
+def test_reading_stops_at_the_cap_by_default():
+    cursor = FakeResult(1_000_000)
+    result = collect_result(cursor, ResultLimits(summary=False, fetch_size=500))
+    assert len(result.rows) == 200 and result.truncated_by == "rows"
+    assert cursor.fetched == 500
+    assert not result.total_exact
+    assert "of at least 500 rows" in result.to_text()
+
+
+def test_exact_count_is_opt_in():
+    cursor = FakeResult(3000)
+    result = collect_result(cursor, ResultLimits(summary=False, exact_count=True))
+    assert (cursor.fetched, result.total_rows, result.total_exact) == (3000, 3000, True)
+    assert "of 3,000 rows" in result.to_text()
+
+    cursor = FakeResult(1_000_000)
+    result = collect_result(cursor, ResultLimits(summary=False, exact_count=True, count_limit=1000))
+    assert cursor.fetched == 1500 and not result.total_exact
+
+
+def test_summary_reads_up_to_its_row_limit():
+    cursor = FakeResult(1_000_000)
+    result = collect_result(cursor, ResultLimits(summary_max_rows=2000))
+    assert cursor.fetched == 2000
+    assert result.summary.startswith("Result summary of at least 2,000 rows")
+
+
+def test_running_stats_are_exact_with_a_bounded_sample():
+    stats = RunningStats(["amount", "city"], sample_size=100)
+    for i in range(10000):
+        stats.add((None if i % 10 == 0 else decimal.Decimal(i), f"city {i % 7}"))
+    assert stats.rows == 10000 and len(stats.sample) == 100
+    assert stats.nulls == [1000, 0]
+    assert (stats.minimum[0], stats.maximum[0]) == (1, 9999)
+    assert stats.sums[0] == sum(i for i in range(10000) if i % 10)
+    assert stats.numbers == [9000, 0]
+
+
+def test_summary_uses_exact_figures_over_all_rows():
+    limits = ResultLimits(summary_max_rows=50000, summary_sample_size=500)
+    result = collect_result(FakeResult(50000), limits)
+    assert "Result summary of at least 50,000 rows" in result.summary
+    assert "estimated from a uniform sample of 500 rows" in result.summary
+    ## min, max and sum are exact although only 500 rows are kept
+    assert "id (number): min 0, max 49,999, mean 24,999.5," in result.summary
+    assert f"sum {sum(range(50000)):,}" in result.summary
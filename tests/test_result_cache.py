@@ -0,0 +1,95 @@
+import gc
+import sqlite3
+
+from sqlalchemy import create_engine, text
+
+from app.utils.database_connection import EngineRegistry
+from app.utils.result_cache import ResultCache, result_cache
+
+
+def make_db(path):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+    connection.executemany("INSERT INTO t (name) VALUES (?)", [("a",), ("b",)])
+    connection.commit()
+    connection.close()
+
+
+def run(engine):
+    def execute(query):
+        with engine.connect() as connection:
+            return connection.execute(text(query)).fetchall()
+    return execute
+
+
+def test_hit_then_invalidated_by_write(tmp_path):
+    path = tmp_path / "db.sqlite"
+    make_db(path)
+    engine = create_engine(f"sqlite:///{path}")
+    cache = ResultCache()
+    query = "SELECT name FROM t ORDER BY id"
+
+    assert cache.get_or_execute(engine, "k", query, run(engine)) == [("a",), ("b",)]
+    assert cache.get_or_execute(engine, "k", query, run(engine)) == [("a",), ("b",)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO t (name) VALUES ('c')"))
+    assert len(cache.get_or_execute(engine, "k", query, run(engine))) == 3
+    assert cache.invalidations == 1
+
+
+def test_probes_do_not_keep_engines_alive(tmp_path):
+    path = tmp_path / "db.sqlite"
+    make_db(path)
+    cache = ResultCache()
+    for _ in range(3):
+        engine = create_engine(f"sqlite:///{path}")
+        cache.get_or_execute(engine, "k", "SELECT 1", run(engine))
+        engine.dispose()
+    del engine
+    gc.collect()
+    assert len(cache._probes) == 0
+
+
+def test_registry_closes_probe_on_dispose(tmp_path):
+    path = tmp_path / "db.sqlite"
+    make_db(path)
+    registry = EngineRegistry(idle_seconds=0)
+    engine = registry.acquire(f"sqlite:///{path}")
+    result_cache.get_or_execute(engine, "k", "SELECT 1", run(engine))
+    probe = result_cache.probe(engine)
+    assert probe._sqlite_connection is not None
+
+    registry.release(engine)
+    assert probe._sqlite_connection is None
+    assert engine not in result_cache._probes
+
+
+def test_volatile_queries_are_not_cached():
+    from app.utils.result_cache import is_cacheable
+
+    assert is_cacheable("SELECT name FROM t WHERE id = 1", "sqlite")
+    assert is_cacheable("SELECT 'nowhere' AS place FROM t", "sqlite")
+    for query, dialect in [
+        ("SELECT now()", "postgresql"),
+        ("SELECT id FROM t WHERE created_at > CURRENT_TIMESTAMP", "sqlite"),
+        ("SELECT * FROM t ORDER BY random() LIMIT 1", "sqlite"),
+        ("SELECT * FROM t WHERE day = date('now')", "sqlite"),
+        ("SELECT strftime('%s', 'now')", "sqlite"),
+        ("SELECT rand()", "mysql"),
+        ("SELECT sysdate()", "mysql"),
+        ("SELECT * FROM t WHERE ts > 'now'::timestamp", "postgresql"),
+        ("UPDATE t SET name = 'x'", "sqlite"),
+    ]:
+        assert not is_cacheable(query, dialect), query
+
+
+def test_volatile_query_runs_every_time(tmp_path):
+    path = tmp_path / "db.sqlite"
+    make_db(path)
+    engine = create_engine(f"sqlite:///{path}")
+    cache = ResultCache()
+    for _ in range(2):
+        cache.get_or_execute(engine, "k", "SELECT random()", run(engine))
+    assert (cache.hits, cache.misses, cache.stats()["entries"]) == (0, 0, 0)
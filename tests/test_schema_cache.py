@@ -0,0 +1,71 @@
+import pytest
+
+from app.utils.schema_cache import TableSchemaCache
+
+
+@pytest.fixture
+def tools(employee_db, offline_agent):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db)
+    db_tools = agent.db_tools
+    db_tools.schema_cache.clear()
+    return db_tools
+
+
+def record_fetches(db_tools, monkeypatch):
+    fetched = []
+    table_schema = db_tools._table_schema
+    monkeypatch.setattr(db_tools, "_table_schema", lambda table: fetched.append(table) or table_schema(table))
+    return fetched
+
+
+def test_lookup_returns_cached_tables_and_the_missing_ones():
+    cache = TableSchemaCache()
+    assert cache.lookup(["a", "b", "a"], "v1") == ({}, ["a", "b"])
+    cache.store({"a": "CREATE TABLE a"}, "v1")
+    assert cache.lookup(["a", "b"], "v1") == ({"a": "CREATE TABLE a"}, ["b"])
+    ## schemas read under an older fingerprint are not kept
+    cache.store({"b": "CREATE TABLE b"}, "v0")
+    assert cache.lookup(["b"], "v1") == ({}, ["b"])
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 4, "invalidations": 0}
+
+
+def test_new_fingerprint_empties_the_cache():
+    cache = TableSchemaCache()
+    cache.lookup(["a"], "v1")
+    cache.store({"a": "CREATE TABLE a"}, "v1")
+    assert cache.lookup(["a"], "v2") == ({}, ["a"])
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_get_schema_fetches_only_missing_tables(tools, monkeypatch):
+    fetched = record_fetches(tools, monkeypatch)
+    first = tools.get_schema(["employees"])
+    assert "CREATE TABLE employees" in first and "3 rows from employees table" in first
+
+    both = tools.get_schema(["employees", "orders"])
+    assert fetched == ["employees", "orders"]
+    assert both.startswith(first)
+    assert tools.get_schema(["orders", "employees"]).count("CREATE TABLE") == 2
+    assert fetched == ["employees", "orders"]
+
+
+def test_schema_change_refetches(tools, monkeypatch):
+    fingerprint = ["v1"]
+    tools.schema_fingerprint = lambda: fingerprint[0]
+    fetched = record_fetches(tools, monkeypatch)
+    tools.get_schema(["employees"])
+    tools.get_schema(["employees"])
+    fingerprint[0] = "v2"
+    tools.get_schema(["employees"])
+    assert fetched == ["employees", "employees"]
+
+
+def test_failed_tables_report_an_error_and_are_not_cached(tools, monkeypatch):
+    def broken(table):
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(tools.db, "_get_sample_rows", broken)
+    assert "Error: could not read the schema of table 'employees': connection reset" in tools.get_schema(["employees"])
+
+    monkeypatch.undo()
+    assert "CREATE TABLE employees" in tools.get_schema(["employees"])
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.engine import make_url
+
+from app.utils import schema_catalog
+
+
+@pytest.fixture
+def catalog_reads(monkeypatch):
+    reads = []
+    read_catalog = schema_catalog.read_catalog
+
+    def counted(engine, schema=None):
+        reads.append(schema)
+        return read_catalog(engine, schema)
+    monkeypatch.setattr(schema_catalog, "read_catalog", counted)
+    monkeypatch.setattr("app.agents.sql_agent.read_catalog", counted)
+    return reads
+
+
+def test_connect_reads_the_catalog_once(employee_db, offline_agent, catalog_reads):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db)
+    assert len(catalog_reads) == 1
+    assert len(agent.schema_index) == 3
+    assert agent.schema_fingerprint() == schema_catalog.catalog_fingerprint(
+        {table: info["columns"] for table, info in agent._catalog_details.items()})
+    assert len(catalog_reads) == 1
+
+
+def test_schema_change_reindexes_from_the_same_read(employee_db, offline_agent, catalog_reads):
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db)
+    connection = sqlite3.connect(make_url(employee_db).database)
+    connection.execute("CREATE TABLE invoices (id INTEGER PRIMARY KEY, amount REAL)")
+    connection.close()
+
+    agent.schema_fingerprint_ttl = 0
+    catalog_reads.clear()
+    agent.schema_fingerprint()
+    assert len(catalog_reads) == 1
+    assert agent.schema_index.search("invoice amount") == ["invoices"]
@@ -0,0 +1,55 @@
+import uuid
+
+import pytest
+from langchain_core.messages import ToolMessage
+
+from app.utils import schema_digest
+
+EMPLOYEES = "employees(id INTEGER PK, name TEXT, salary REAL)"
+ORDERS = ("orders(id INTEGER PK, customer_id INTEGER -> customers.id, employee_id INTEGER -> employees.id, "
+          "total REAL)")
+
+
+@pytest.fixture
+def fast_path_agent(employee_db, offline_agent, monkeypatch):
+    monkeypatch.setenv("SCHEMA_FAST_PATH", "true")
+    agent = offline_agent()
+    agent.setup_database_connection(employee_db)
+    return agent
+
+
+def tools_called(agent, question):
+    config = {"configurable": {"thread_id": f"digest-{uuid.uuid4().hex}"}}
+    agent.execute_query(question, config)
+    messages = agent.app.get_state(config).values["messages"]
+    return [m.name for m in messages if isinstance(m, ToolMessage)]
+
+
+def test_digest_lists_columns_keys_and_references(fast_path_agent):
+    assert fast_path_agent.schema_digest(["orders", "employees"]) == f"{EMPLOYEES}\n{ORDERS}"
+
+
+def test_digest_lines_are_cached_per_table_and_bounded(fast_path_agent, monkeypatch):
+    inspected = []
+    table_digests = schema_digest.table_digests
+    monkeypatch.setattr("app.agents.sql_agent.table_digests",
+                        lambda engine, tables, schema=None: inspected.append(list(tables)) or table_digests(engine, tables, schema))
+    fast_path_agent.schema_digest_cache_tables = 2
+
+    fast_path_agent.schema_digest(["employees"])
+    fast_path_agent.schema_digest(["employees", "orders"])
+    assert inspected == [["employees"], ["orders"]]
+
+    fast_path_agent.schema_digest(["customers", "orders"])
+    assert inspected[-1] == ["customers"]
+    assert list(fast_path_agent.cached_table_digests()) == ["orders", "customers"]
+
+
+def test_fast_path_skips_the_schema_tools(fast_path_agent):
+    assert tools_called(fast_path_agent, "how many employees") == ["execute_query"]
+
+
+def test_digest_over_budget_falls_back_to_the_tool_loop(fast_path_agent):
+    fast_path_agent.schema_digest_max_chars = 20
+    assert fast_path_agent.schema_digest(["employees"]) == ""
+    assert tools_called(fast_path_agent, "how many employees") == ["list_tables", "get_schema", "execute_query"]
@@ -0,0 +1,70 @@
+from app.utils.lexical_index import BM25Index, tokenize
+from app.utils.schema_index import SchemaIndex
+
+
+def table(*columns, references=(), comment=""):
+    return {"columns": [(column, "TEXT") for column in columns], "references": list(references), "comment": comment}
+
+
+DETAILS = {
+    "customers": table("id", "name", "city"),
+    "employees": table("id", "name", "salary", "department"),
+    "orders": table("id", "customer_id", "employee_id", "total", references=["customers", "employees"]),
+    "audit_log": table("id", "event", "created_at",
+                       comment="Changes to customer records, order totals, employee salary reviews and logins"),
+}
+
+
+def test_tokenize_splits_identifiers_and_folds_plurals():
+    assert tokenize("customerOrders per_region") == ["customerorder", "customer", "order", "per_region", "per", "region"]
+    assert tokenize("address class") == ["address", "class"]
+
+
+def test_bm25_add_replace_and_remove_without_rebuild():
+    index = BM25Index()
+    index.add("a", ["salary", "name"])
+    index.add("b", ["total", "name"])
+    assert [doc for doc, _ in index.search(["salary"])] == ["a"]
+
+    ## a new version of a document replaces the old one
+    index.add("a", ["bonus", "name"])
+    assert index.search(["salary"]) == []
+    assert [doc for doc, _ in index.search(["bonus"])] == ["a"]
+
+    index.remove("a")
+    index.remove("missing")
+    assert len(index) == 1 and "a" not in index
+    assert index.search(["bonus"]) == []
+    assert [doc for doc, _ in index.search(["name"])] == ["b"]
+
+
+def test_column_matches_outrank_incidental_mentions():
+    index = SchemaIndex()
+    index.update(DETAILS)
+    ## audit_log mentions salary in its comment, employees has the column
+    assert index.search("average salary")[:2] == ["employees", "audit_log"]
+    ## a table name hit outweighs the foreign key neighbours and comments mentioning it
+    assert index.search("orders")[0] == "orders"
+
+
+def test_update_only_reindexes_changed_tables():
+    index = SchemaIndex()
+    assert index.update(DETAILS) == 4
+    assert index.update(DETAILS) == 0
+
+    changed = {**DETAILS, "employees": table("id", "name", "salary", "department", "hire_date")}
+    assert index.update(changed) == 1
+    assert index.search("hire date") == ["employees"]
+
+    removed = {name: info for name, info in changed.items() if name != "audit_log"}
+    assert index.update(removed) == 1
+    assert len(index) == 3
+    assert "audit_log" not in index.search("salary")
+
+
+def test_search_is_restricted_to_allowed_tables():
+    index = SchemaIndex()
+    index.update(DETAILS)
+    assert index.search("salary", allowed=["orders", "audit_log"]) == ["audit_log"]
+    assert index.search("salary", allowed=[]) == []
+    assert index.search("how many of the") == []
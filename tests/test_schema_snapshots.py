@@ -0,0 +1,91 @@
+import os
+
+import pytest
+from sqlalchemy import MetaData, create_engine
+
+from app.services import schema_snapshots as snapshots_module
+from app.services.schema_snapshots import SchemaSnapshot, SchemaSnapshotStore
+from app.utils.schema_catalog import read_catalog_details
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SchemaSnapshotStore(directory=str(tmp_path / "snapshots"))
+
+
+@pytest.fixture
+def snapshot(employee_db):
+    engine = create_engine(employee_db)
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    details = read_catalog_details(engine)
+    engine.dispose()
+    return SchemaSnapshot(fingerprint="v1", metadata=metadata, details=details,
+                          digests={"employees": "employees(id INTEGER PK, name TEXT, salary REAL)"})
+
+
+def test_round_trip(store, snapshot):
+    assert store.load("db", None, "v1") is None
+    store.save("db", None, snapshot)
+    loaded = store.load("db", None, "v1")
+
+    assert sorted(loaded.metadata.tables) == ["customers", "employees", "orders"]
+    orders = loaded.metadata.tables["orders"]
+    assert [c.name for c in orders.columns] == ["id", "customer_id", "employee_id", "total"]
+    assert sorted(fk.target_fullname for fk in orders.foreign_keys) == ["customers.id", "employees.id"]
+    assert loaded.details == snapshot.details
+    assert loaded.digests == snapshot.digests
+    ## one file per connection target, the schema is part of it
+    assert store.load("db", "main", "v1") is None
+    assert store.stats() == {"directory": store.directory, "hits": 1, "misses": 2, "stale": 0, "saves": 1}
+    assert os.stat(store.directory).st_mode & 0o777 == 0o700
+
+
+def test_stale_fingerprint_is_rejected(store, snapshot):
+    store.save("db", None, snapshot)
+    assert store.load("db", None, "v2") is None
+    assert store.stats()["stale"] == 1
+
+
+def test_corrupt_or_unreadable_snapshot_is_skipped(store, snapshot):
+    store.save("db", None, snapshot)
+    path = store._path("db", None)
+    with open(path, "wb") as f:
+        f.write(b"not a pickle")
+    assert store.load("db", None, "v1") is None
+
+    ## a directory where the file should be cannot be opened
+    os.remove(path)
+    os.mkdir(path)
+    assert store.load("db", None, "v1") is None
+    os.rmdir(path)
+
+    ## the next save replaces the bad file
+    store.save("db", None, snapshot)
+    assert store.load("db", None, "v1") is not None
+
+
+def test_snapshots_in_a_shared_directory_are_ignored(store, snapshot):
+    store.save("db", None, snapshot)
+    os.chmod(store.directory, 0o777)
+    assert store.load("db", None, "v1") is None
+    os.chmod(store.directory, 0o700)
+    assert store.load("db", None, "v1") is not None
+
+
+def test_reconnect_restores_the_snapshot(employee_db, offline_agent, store, monkeypatch):
+    monkeypatch.setenv("SCHEMA_SNAPSHOTS", "true")
+    monkeypatch.setattr(snapshots_module, "schema_snapshots", store)
+    monkeypatch.setattr("app.agents.sql_agent.schema_snapshots", store)
+    first = offline_agent()
+    first.setup_database_connection(employee_db)
+    first.db_tools.get_schema(["employees"])
+    first.warm_schema(first.db_tools, first.schema_fingerprint())
+    assert store.stats()["saves"] == 1
+
+    second = offline_agent()
+    second.setup_database_connection(employee_db)
+    assert store.stats()["hits"] == 1
+    assert sorted(second.db._metadata.tables) == ["customers", "employees", "orders"]
+    assert second.cached_table_digests() == first.cached_table_digests()
+    assert len(second.schema_index) == 3
@@ -0,0 +1,59 @@
+import pytest
+
+from app.utils.sql_validation import MULTI_STATEMENT_ERROR, READ_ONLY_ERROR, lower_catalog, validate_sql
+
+CATALOG = lower_catalog({
+    "employees": [("id", "INTEGER"), ("name", "TEXT"), ("department_id", "INTEGER")],
+    "departments": [("id", "INTEGER"), ("name", "TEXT")],
+})
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT name FROM employees WHERE id = 1",
+    "SELECT e.name, d.name FROM employees e JOIN departments d ON d.id = e.department_id",
+    "WITH t AS (SELECT department_id, COUNT(*) AS n FROM employees GROUP BY 1) SELECT n FROM t",
+    "SELECT name AS label FROM employees ORDER BY label",
+    "SELECT name FROM sqlite_master",
+])
+def test_valid_queries_pass(query):
+    assert validate_sql(query, "sqlite", CATALOG) is None
+
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM employees",
+    "UPDATE employees SET name = 'x'",
+    "DROP TABLE employees",
+    "INSERT INTO employees (name) VALUES ('x')",
+])
+def test_writes_are_rejected(query):
+    assert validate_sql(query, "sqlite", CATALOG) == READ_ONLY_ERROR
+
+
+def test_multiple_statements_are_rejected():
+    assert validate_sql("SELECT 1; SELECT 2", "sqlite", CATALOG) == MULTI_STATEMENT_ERROR
+
+
+def test_unknown_table_and_column_have_suggestions():
+    error = validate_sql("SELECT name FROM employee", "sqlite", CATALOG)
+    assert error.startswith("Error: Table 'employee' does not exist.") and "employees" in error
+    error = validate_sql("SELECT nme FROM employees", "sqlite", CATALOG)
+    assert error.startswith("Error: Column 'nme' does not exist") and "name" in error
+    error = validate_sql("SELECT e.dept FROM employees e", "sqlite", CATALOG)
+    assert error.startswith("Error: Column 'dept' does not exist in table 'employees'.")
+
+
+def test_allowed_tables():
+    assert validate_sql("SELECT name FROM employees", "sqlite", CATALOG, ["employees"]) is None
+    error = validate_sql("SELECT name FROM departments", "sqlite", CATALOG, ["employees"])
+    assert error == "Error: Table 'departments' is not available. Allowed tables: employees."
+
+
+def test_sqlite_double_quoted_string_is_not_a_column():
+    ## SQLite falls back to a string literal for double-quoted text that names no column
+    assert validate_sql('SELECT id FROM employees WHERE name = "alice"', "sqlite", CATALOG) is None
+    assert validate_sql('SELECT "name" FROM employees', "sqlite", CATALOG) is None
+    ## other dialects treat it as an identifier
+    error = validate_sql('SELECT id FROM employees WHERE name = "alice"', "postgresql", CATALOG)
+    assert error.startswith("Error: Column 'alice' does not exist")
+    ## unquoted names are still checked on SQLite
+    assert validate_sql("SELECT id FROM employees WHERE name = alice", "sqlite", CATALOG).startswith("Error: Column")